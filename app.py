@@ -2,7 +2,7 @@ import os
 import django
 import logging
 import time
-from flask import Flask, redirect, request, session
+from flask import Flask, jsonify, redirect, request, session
 from werkzeug.middleware.proxy_fix import ProxyFix
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "Analitica.settings")
@@ -39,6 +39,7 @@ from design_system import DesignSystem
 from settings.plotly_config import PlotlyConfig
 from services.global_db import reset_engine
 from services.data_manager import data_manager
+from services.cache_warmer import cache_warmer
 
 logging.basicConfig(
     level=logging.INFO,
@@ -98,6 +99,22 @@ def logout():
     session.clear()
     return redirect("/")
 
+@server.route("/internal/cache/warmer")
+def cache_warmer_status():
+    # Endpoint interno: progreso/costo del pre-calentador y ocupación de cachés (lista
+    # tenants). Sólo desde el propio host y sin pasar por el proxy (X-Forwarded-For).
+    if request.remote_addr not in ("127.0.0.1", "::1") or request.headers.get("X-Forwarded-For"):
+        return jsonify({"error": "forbidden"}), 403
+    return jsonify({
+        "enabled": Config.CACHE_WARMER_ENABLED,
+        "warmer": cache_warmer.status(),
+        "queries": data_manager.get_query_stats(),
+        "caches": data_manager.get_cache_stats(),
+    })
+
+if Config.CACHE_WARMER_ENABLED:
+    cache_warmer.start()
+
 def get_app_shell():
     theme = cast(Any, DesignSystem.get_mantine_theme())
     header_config = cast(Any, {"height": {"base": 60, "sm": 0}})
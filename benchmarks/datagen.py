@@ -0,0 +1,600 @@
+"""
+python -m benchmarks.datagen --output /tmp/analitica_10m.sqlite --fact-rows 10M \
+    [--start 2022-01-01 --end 2026-12-31] [--format sqlite|parquet] [--rows d_area=8 ...]
+
+Datos sintéticos con forma de estrella a partir de la metadata del tenant. El esquema sale
+de tables.json (fields, pk, date_column y joins) más las columnas que leen las recetas de
+metrics.json y las referencias "tabla.columna" de screens.json.
+
+Consistencia referencial:
+
+    dominios    las columnas unidas por un join (a.x = b.y) comparten dominio de valores;
+                su cardinalidad es el número de filas de la tabla cuya pk está en el
+                dominio (una dim 1:1 con un fact, como d_viaje, crece al tamaño del fact)
+    pk          serial 1..filas, así toda llave del dominio existe en la tabla dueña; una
+                columna de dim referenciada por un join sin ser pk recorre el dominio igual
+    compuestas  en un join de varias columnas (id_area + no_viaje) la fila hija elige una
+                fila de la tabla padre y copia sus valores: la tupla siempre existe
+    resto       fechas uniformes en [start, end], importes sesgados hacia valores bajos,
+                enteros 0..1000 y textos de un catálogo corto
+
+Cada valor es una función determinista (hash con semilla) del índice de fila. La
+generación es vectorial por bloques, con memoria constante a cualquier escala, y una
+tabla sale igual aunque se genere sola (--table).
+
+Escribe en SQLite (el motor embebido del benchmark) o en Parquet, un archivo por tabla.
+Parquet requiere pyarrow.
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+
+DEFAULT_START = datetime.date(2024, 1, 1)
+DEFAULT_END = datetime.date(2026, 12, 31)
+DEFAULT_CHUNK_ROWS = 250_000
+STRING_VALUES = np.array(["A", "C", "L", "X", "Norte", "Sur", "Centro", "Bajío"])
+META_TABLE = "_datagen_meta"
+META_FILE = "_datagen.json"
+
+_SQL_WORDS = {
+    "day", "month", "year", "getdate", "datediff", "sum", "count", "avg", "min", "max",
+    "case", "when", "then", "else", "end", "in", "and", "or", "not", "is", "null",
+    "coalesce", "isnull", "cast", "as", "distinct",
+}
+_JOIN_PAIR = re.compile(r"(\w+)\.(\w+)\s*=\s*(\w+)\.(\w+)")
+_SCALE = {"k": 1_000, "m": 1_000_000}
+
+
+# --- esquema ---
+
+@dataclass
+class TableSpec:
+    name: str
+    kind: str                               # "fact" | "dim"
+    pk: Optional[str]
+    date_column: Optional[str]
+    columns: Dict[str, str] = field(default_factory=dict)   # columna -> tipo de tables.json
+    rows: int = 0
+
+
+@dataclass(frozen=True)
+class CompositeKey:
+    """Join de varias columnas: la fila de child copia los valores de una fila de parent."""
+    child: str
+    parent: str
+    pairs: Tuple[Tuple[str, str], ...]      # (columna de child, columna de parent)
+
+
+@dataclass
+class StarSchema:
+    tables: Dict[str, TableSpec]
+    domains: Dict[Tuple[str, str], int]     # (tabla, columna) -> dominio
+    composites: List[CompositeKey]
+    referenced: Set[Tuple[str, str]] = field(default_factory=set)   # lado padre de joins de 1 columna
+    domain_rows: Dict[int, int] = field(default_factory=dict)
+    domain_kind: Dict[int, str] = field(default_factory=dict)   # "integer" | "string"
+
+    def index_columns(self, table: TableSpec) -> List[Tuple[str, ...]]:
+        """Índices que tendría la BD real: pk, columnas referenciadas por joins y llaves
+        compuestas del lado padre, más la columna de fecha de los filtros de periodo."""
+        indexes: List[Tuple[str, ...]] = []
+        if table.pk in table.columns:
+            indexes.append((table.pk,))
+        indexes += [(col,) for t, col in sorted(self.referenced) if t == table.name and col in table.columns]
+        indexes += [tuple(p for _, p in k.pairs) for k in self.composites if k.parent == table.name]
+        if table.date_column in table.columns:
+            indexes.append((table.date_column,))
+        return list(dict.fromkeys(indexes))
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            name: {"rows": t.rows, "columns": sorted(t.columns.items())}
+            for name, t in sorted(self.tables.items())
+        }
+
+
+def infer_schema(tables: Dict[str, Any], metrics: Optional[Dict[str, Any]] = None, screens: Any = None) -> StarSchema:
+    """
+    Esquema físico de la metadata. Los alias de tables.json con el mismo table_name
+    (d_plaza_origen / d_plaza_destino → d_plaza) comparten tabla; los joins se resuelven
+    a nombres físicos.
+    """
+    physical = {alias: spec.get("table_name") or alias for alias, spec in tables.items()}
+    specs: Dict[str, TableSpec] = {}
+    for alias, spec in tables.items():
+        name = physical[alias]
+        date_col = spec.get("date_column")
+        table = specs.setdefault(name, TableSpec(
+            name=name,
+            kind=spec.get("type") or "dim",
+            pk=spec.get("pk"),
+            date_column=date_col if date_col and "." not in date_col else None,
+        ))
+        for col, kind in (spec.get("fields") or {}).items():
+            table.columns.setdefault(col, kind)
+        if table.pk:
+            table.columns.setdefault(table.pk, "integer")
+        if table.date_column:
+            table.columns[table.date_column] = "date"
+
+    def add_column(alias: str, col: str, kind: str) -> None:
+        name = physical.get(alias, alias)
+        table = specs.setdefault(name, TableSpec(name=name, kind="dim", pk=None, date_column=None))
+        table.columns.setdefault(col, kind)
+
+    joins: List[List[Tuple[str, str, str, str]]] = []
+    for alias, spec in tables.items():
+        for join in (spec.get("joins") or {}).values():
+            pairs = []
+            for ta, ca, tb, cb in _JOIN_PAIR.findall(join.get("on", "")):
+                add_column(ta, ca, "integer")
+                add_column(tb, cb, "integer")
+                pairs.append((physical.get(ta, ta), ca, physical.get(tb, tb), cb))
+            if pairs:
+                joins.append(pairs)
+
+    for metric in (metrics or {}).values():
+        recipe = metric.get("recipe") or {}
+        column = recipe.get("column")
+        if recipe.get("table") and isinstance(column, str):
+            expr = re.sub(r"'[^']*'", "", column)
+            for word in re.findall(r"\b[a-zA-Z_]\w*\b", expr):
+                if word.lower() not in _SQL_WORDS:
+                    add_column(recipe["table"], word, "decimal")
+
+    for alias, col in _qualified_refs(screens):
+        if alias in tables:
+            add_column(alias, col, "string")
+
+    referenced = set()
+    for pairs in joins:
+        if len(pairs) == 1:
+            ta, ca, tb, cb = pairs[0]
+            referenced.add((ta, ca) if _a_is_parent(specs[ta], {ca}, specs[tb], {cb}) else (tb, cb))
+    return StarSchema(
+        tables=specs, domains=_key_domains(joins), composites=_composite_keys(joins, specs), referenced=referenced,
+    )
+
+
+def _a_is_parent(a: TableSpec, cols_a: Set[str], b: TableSpec, cols_b: Set[str]) -> bool:
+    """Padre de un join: el lado cuya pk está en el join; si no, la dim frente al fact;
+    si no, la tabla destino (b)."""
+    a_pk, b_pk = a.pk in cols_a, b.pk in cols_b
+    if a_pk != b_pk:
+        return a_pk
+    if a.kind != b.kind:
+        return a.kind == "dim"
+    return False
+
+
+def _qualified_refs(value: Any) -> Iterable[Tuple[str, str]]:
+    if isinstance(value, dict):
+        for k, v in value.items():
+            yield from _qualified_refs(k)
+            yield from _qualified_refs(v)
+    elif isinstance(value, list):
+        for v in value:
+            yield from _qualified_refs(v)
+    elif isinstance(value, str):
+        match = re.match(r"^(\w+)\.(\w+)$", value)
+        if match:
+            yield match.group(1), match.group(2)
+
+
+def _key_domains(joins: List[List[Tuple[str, str, str, str]]]) -> Dict[Tuple[str, str], int]:
+    """Union-find sobre las igualdades de los joins: cada clase es un dominio de llaves."""
+    parent: Dict[Tuple[str, str], Tuple[str, str]] = {}
+
+    def find(x):
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for pairs in joins:
+        for ta, ca, tb, cb in pairs:
+            ra, rb = find((ta, ca)), find((tb, cb))
+            if ra != rb:
+                parent[max(ra, rb)] = min(ra, rb)
+
+    roots = sorted({find(x) for x in parent})
+    ids = {root: i for i, root in enumerate(roots)}
+    return {x: ids[find(x)] for x in sorted(parent)}
+
+
+def _composite_keys(joins: List[List[Tuple[str, str, str, str]]], specs: Dict[str, TableSpec]) -> List[CompositeKey]:
+    """Joins de 2+ columnas, orientados hijo → padre (ver _a_is_parent)."""
+    seen: Set[Tuple[str, str, frozenset]] = set()
+    keys = []
+    for pairs in joins:
+        if len(pairs) < 2:
+            continue
+        a, b = pairs[0][0], pairs[0][2]
+        if a == b or any(p[0] != a or p[2] != b for p in pairs):
+            continue
+        if _a_is_parent(specs[a], {p[1] for p in pairs}, specs[b], {p[3] for p in pairs}):
+            key = CompositeKey(child=b, parent=a, pairs=tuple((cb, ca) for _, ca, _, cb in pairs))
+        else:
+            key = CompositeKey(child=a, parent=b, pairs=tuple((ca, cb) for _, ca, _, cb in pairs))
+        ident = (key.child, key.parent, frozenset(key.pairs))
+        if ident not in seen:
+            seen.add(ident)
+            keys.append(key)
+    return keys
+
+
+def size_schema(
+    schema: StarSchema, fact_rows: int, dim_rows: int, overrides: Optional[Dict[str, int]] = None,
+) -> StarSchema:
+    """
+    Filas por tabla (fact_rows a cada fact, dim_rows a cada dim, overrides por nombre) y
+    cardinalidad de cada dominio. Una tabla cuya pk está en un dominio crece hasta la
+    cardinalidad del dominio: su serie 1..filas tiene que cubrir todas las llaves.
+    """
+    overrides = overrides or {}
+    for table in schema.tables.values():
+        table.rows = int(overrides.get(table.name, fact_rows if table.kind == "fact" else dim_rows))
+
+    owners: Dict[int, List[TableSpec]] = {}
+    for table in schema.tables.values():
+        domain = schema.domains.get((table.name, table.pk)) if table.pk else None
+        if domain is not None:
+            owners.setdefault(domain, []).append(table)
+
+    for domain in set(schema.domains.values()):
+        tables = owners.get(domain, [])
+        rows = max((t.rows for t in tables), default=dim_rows)
+        for t in tables:
+            t.rows = rows
+        schema.domain_rows[domain] = rows
+        if tables:
+            is_string = any(t.columns.get(t.pk) == "string" for t in tables)
+        else:
+            members = [schema.tables[t].columns.get(c) for (t, c), d in schema.domains.items() if d == domain]
+            is_string = all(kind == "string" for kind in members)
+        schema.domain_kind[domain] = "string" if is_string else "integer"
+    return schema
+
+
+# --- generación ---
+
+def _salt(*parts: Any) -> np.uint64:
+    digest = hashlib.blake2b(":".join(map(str, parts)).encode(), digest_size=8).digest()
+    return np.uint64(int.from_bytes(digest, "little"))
+
+
+def _mix(idx: np.ndarray, salt: np.uint64) -> np.ndarray:
+    """splitmix64 del índice de fila: mismo índice y salt → mismo valor, sin estado."""
+    x = idx.astype(np.uint64) + salt
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _uniform(idx: np.ndarray, salt: np.uint64) -> np.ndarray:
+    return (_mix(idx, salt) >> np.uint64(11)).astype(np.float64) * (1.0 / (1 << 53))
+
+
+def _randint(idx: np.ndarray, salt: np.uint64, n: int) -> np.ndarray:
+    return (_mix(idx, salt) % np.uint64(max(n, 1))).astype(np.int64)
+
+
+class StarGenerator:
+    """Valores de cada columna como función del índice de fila (vectorial)."""
+
+    def __init__(self, schema: StarSchema, *, start: datetime.date, end: datetime.date, seed: int, dim_rows: int) -> None:
+        if end < start:
+            raise ValueError(f"Rango de fechas vacío: {start} > {end}")
+        self.schema = schema
+        self.seed = seed
+        self.dim_rows = dim_rows
+        self.start = np.datetime64(start.isoformat(), "D")
+        self.days = (end - start).days + 1
+        self._sources = {name: self._column_sources(t) for name, t in schema.tables.items()}
+        self._resolving: Set[Tuple[str, str]] = set()
+
+    def _column_sources(self, table: TableSpec) -> Dict[str, Tuple[Any, ...]]:
+        sources: Dict[str, Tuple[Any, ...]] = {}
+        if table.pk in table.columns:
+            sources[table.pk] = ("serial",)
+        composites = sorted(
+            (k for k in self.schema.composites if k.child == table.name), key=lambda k: -len(k.pairs)
+        )
+        for key in composites:
+            for child_col, parent_col in key.pairs:
+                sources.setdefault(child_col, ("copy", key, parent_col))
+        for col, kind in table.columns.items():
+            if col in sources:
+                continue
+            domain = self.schema.domains.get((table.name, col))
+            if domain is not None and table.kind == "dim" and (table.name, col) in self.schema.referenced:
+                # Columna referenciada que no es pk: recorre el dominio para cubrir cada llave
+                sources[col] = ("cover", domain)
+            elif domain is not None:
+                sources[col] = ("domain", domain)
+            elif col.startswith("id_"):
+                sources[col] = ("key",)
+            else:
+                sources[col] = (kind if kind in ("date", "string", "integer") else "decimal",)
+        return sources
+
+    def _parent_rows(self, table: TableSpec, key: CompositeKey, idx: np.ndarray) -> np.ndarray:
+        parent = self.schema.tables[key.parent]
+        sources = self._sources[table.name]
+        for child_col, parent_col in key.pairs:
+            # La pk serial de la hija apunta a la misma fila del padre (relación 1:1)
+            if sources.get(child_col) == ("serial",) and parent_col == parent.pk:
+                return idx % max(parent.rows, 1)
+        return _randint(idx, _salt(self.seed, "parent", table.name, key.parent, key.pairs), parent.rows)
+
+    def column(self, table_name: str, col: str, idx: np.ndarray) -> np.ndarray:
+        table = self.schema.tables[table_name]
+        source = self._sources[table_name][col]
+        kind = source[0]
+        salt = _salt(self.seed, table_name, col)
+
+        if kind == "serial":
+            return idx + 1
+        if kind == "copy":
+            _, key, parent_col = source
+            guard = (table_name, col)
+            if guard not in self._resolving:
+                self._resolving.add(guard)
+                try:
+                    return self.column(key.parent, parent_col, self._parent_rows(table, key, idx))
+                finally:
+                    self._resolving.discard(guard)
+            # Ciclo de llaves compuestas: valor del dominio sin copiar
+            domain = self.schema.domains.get(guard)
+            rows = self.schema.domain_rows.get(domain, self.dim_rows) if domain is not None else self.dim_rows
+            return _randint(idx, salt, rows) + 1
+        if kind == "cover":
+            return idx % max(self.schema.domain_rows.get(source[1], self.dim_rows), 1) + 1
+        if kind == "domain":
+            return _randint(idx, salt, self.schema.domain_rows.get(source[1], self.dim_rows)) + 1
+        if kind == "key":
+            return _randint(idx, salt, self.dim_rows) + 1
+        if kind == "date":
+            return self.start + _randint(idx, salt, self.days).astype("timedelta64[D]")
+        if kind == "string":
+            return STRING_VALUES[_randint(idx, salt, len(STRING_VALUES))]
+        if kind == "integer":
+            return _randint(idx, salt, 1001)
+        u = _uniform(idx, salt)
+        return np.round(u * u * 20000.0, 2)
+
+    def _output_kind(self, table: TableSpec, col: str) -> str:
+        domain = self.schema.domains.get((table.name, col))
+        if domain is not None:
+            return self.schema.domain_kind.get(domain, "integer")
+        return table.columns[col]
+
+    def chunks(self, table_name: str, chunk_rows: int = DEFAULT_CHUNK_ROWS) -> Iterator[Dict[str, np.ndarray]]:
+        table = self.schema.tables[table_name]
+        for start in range(0, table.rows, chunk_rows):
+            idx = np.arange(start, min(start + chunk_rows, table.rows), dtype=np.int64)
+            out = {}
+            for col in table.columns:
+                values = self.column(table_name, col, idx)
+                if self._output_kind(table, col) == "string" and values.dtype.kind in "iu":
+                    values = values.astype(str)
+                out[col] = values
+            yield out
+
+
+# --- escritores ---
+
+class SqliteWriter:
+    """Un archivo SQLite; los índices se crean al terminar de cargar cada tabla."""
+
+    def __init__(self, path: str) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if os.path.exists(path):
+            os.remove(path)
+        self.path = path
+        self.con = sqlite3.connect(path)
+        self.con.execute("PRAGMA journal_mode = OFF")
+        self.con.execute("PRAGMA synchronous = OFF")
+
+    def begin(self, table: TableSpec) -> None:
+        cols = ", ".join(f"[{c}]" for c in table.columns)
+        self.con.execute(f"CREATE TABLE [{table.name}] ({cols})")
+
+    def write(self, table: TableSpec, columns: Dict[str, np.ndarray]) -> None:
+        values = []
+        for arr in columns.values():
+            if arr.dtype.kind == "M":
+                arr = np.datetime_as_string(arr, unit="D")
+            values.append(arr.tolist())
+        placeholders = ", ".join("?" * len(values))
+        self.con.executemany(f"INSERT INTO [{table.name}] VALUES ({placeholders})", zip(*values))
+
+    def end(self, table: TableSpec, indexes: List[Tuple[str, ...]]) -> None:
+        for i, cols in enumerate(indexes):
+            self.con.execute(
+                f"CREATE INDEX [ix_{table.name}_{i}] ON [{table.name}] ({', '.join(f'[{c}]' for c in cols)})"
+            )
+        self.con.commit()
+
+    def close(self, meta: Dict[str, Any]) -> None:
+        self.con.execute(f"CREATE TABLE {META_TABLE} (meta TEXT)")
+        self.con.execute(f"INSERT INTO {META_TABLE} VALUES (?)", (json.dumps(meta, sort_keys=True),))
+        self.con.commit()
+        self.con.close()
+
+
+class ParquetWriter:
+    """Un .parquet por tabla en el directorio de salida (un row group por bloque)."""
+
+    def __init__(self, path: str) -> None:
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as e:
+            raise RuntimeError("El formato parquet requiere pyarrow (pip install pyarrow)") from e
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._writer = None
+
+    def begin(self, table: TableSpec) -> None:
+        self._writer = None
+
+    def write(self, table: TableSpec, columns: Dict[str, np.ndarray]) -> None:
+        batch = self._pa.table({name: self._pa.array(values) for name, values in columns.items()})
+        if self._writer is None:
+            self._writer = self._pq.ParquetWriter(os.path.join(self.path, f"{table.name}.parquet"), batch.schema)
+        self._writer.write_table(batch)
+
+    def end(self, table: TableSpec, indexes: List[Tuple[str, ...]]) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def close(self, meta: Dict[str, Any]) -> None:
+        with open(os.path.join(self.path, META_FILE), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2, sort_keys=True)
+
+
+WRITERS = {"sqlite": SqliteWriter, "parquet": ParquetWriter}
+
+
+def read_meta(path: str) -> Optional[Dict[str, Any]]:
+    """Parámetros con los que se generó path (SQLite o directorio Parquet); None si no hay."""
+    if os.path.isdir(path):
+        try:
+            with open(os.path.join(path, META_FILE), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    if not os.path.exists(path):
+        return None
+    try:
+        con = sqlite3.connect(path)
+        try:
+            row = con.execute(f"SELECT meta FROM {META_TABLE}").fetchone()
+        finally:
+            con.close()
+        return json.loads(row[0]) if row else None
+    except (sqlite3.Error, ValueError):
+        return None
+
+
+def generate(
+    schema: StarSchema,
+    writer: Any,
+    *,
+    dim_rows: int,
+    start: datetime.date = DEFAULT_START,
+    end: datetime.date = DEFAULT_END,
+    seed: int = 7,
+    only: Optional[Iterable[str]] = None,
+    chunk_rows: int = DEFAULT_CHUNK_ROWS,
+    progress: Optional[Callable[[TableSpec], None]] = None,
+) -> Dict[str, Any]:
+    """Genera las tablas (todas, o sólo `only`) con un schema ya dimensionado y las escribe."""
+    generator = StarGenerator(schema, start=start, end=end, seed=seed, dim_rows=dim_rows)
+    names = sorted(schema.tables) if only is None else sorted(only)
+    for name in names:
+        table = schema.tables[name]
+        if not table.columns:
+            continue
+        if progress:
+            progress(table)
+        writer.begin(table)
+        for chunk in generator.chunks(name, chunk_rows):
+            writer.write(table, chunk)
+        writer.end(table, schema.index_columns(table))
+    meta = {
+        "seed": seed, "start": start.isoformat(), "end": end.isoformat(), "dim_rows": dim_rows,
+        "tables": {name: schema.describe()[name] for name in names},
+    }
+    writer.close(meta)
+    return meta
+
+
+# --- CLI ---
+
+def parse_count(text: str) -> int:
+    """'50M' → 50_000_000, '250k' → 250_000, '1.5M' → 1_500_000."""
+    text = text.strip().lower().replace("_", "")
+    if text and text[-1] in _SCALE:
+        return int(float(text[:-1]) * _SCALE[text[-1]])
+    return int(text)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Datos sintéticos con forma de estrella desde tables.json")
+    parser.add_argument("--output", required=True, help="Archivo SQLite o directorio Parquet")
+    parser.add_argument("--format", choices=sorted(WRITERS), default="sqlite")
+    parser.add_argument("--fact-rows", type=parse_count, default=parse_count("1M"), help="Filas por fact (1M, 10M, 50M...)")
+    parser.add_argument("--dim-rows", type=parse_count, default=200, help="Filas por dimensión")
+    parser.add_argument("--rows", action="append", default=[], metavar="TABLA=N", help="Filas de una tabla (repetible)")
+    parser.add_argument("--start", type=datetime.date.fromisoformat, default=DEFAULT_START)
+    parser.add_argument("--end", type=datetime.date.fromisoformat, default=DEFAULT_END)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--table", action="append", default=[], help="Genera sólo esta tabla (repetible)")
+    parser.add_argument("--tenant", default=None, help="Metadata del tenant (defaults + overrides)")
+    parser.add_argument("--chunk-rows", type=parse_count, default=DEFAULT_CHUNK_ROWS)
+    args = parser.parse_args(argv)
+
+    overrides = {}
+    for item in args.rows:
+        name, sep, value = item.partition("=")
+        if not sep:
+            raise SystemExit(f"--rows inválido '{item}': usa TABLA=N")
+        overrides[name.strip()] = parse_count(value)
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "Analitica.settings")
+    from dashboard_core.metadata_engine import MetadataEngine
+
+    metadata = MetadataEngine().get_context(args.tenant)
+    screens = _screens_config(args.tenant)
+    schema = size_schema(infer_schema(metadata["tables"], metadata["metrics"], screens), args.fact_rows, args.dim_rows, overrides)
+
+    unknown = sorted(set(args.table) - set(schema.tables))
+    if unknown:
+        raise SystemExit(f"Tablas desconocidas: {', '.join(unknown)}")
+
+    try:
+        writer = WRITERS[args.format](args.output)
+    except RuntimeError as e:
+        raise SystemExit(f"❌ {e}")
+    generate(
+        schema, writer, dim_rows=args.dim_rows, start=args.start, end=args.end, seed=args.seed,
+        only=args.table or None, chunk_rows=args.chunk_rows,
+        progress=lambda t: print(f"🧪 {t.name}: {t.rows:,} filas", file=sys.stderr),
+    )
+    print(f"✅ Datos sintéticos en {args.output}", file=sys.stderr)
+    return 0
+
+
+def _screens_config(tenant: Optional[str]) -> List[Any]:
+    """screens.json default y del tenant sin levantar DataManager (sólo aportan columnas)."""
+    from django.conf import settings
+
+    base = os.path.join(settings.BASE_DIR, "configs", "screens")
+    paths = [os.path.join(base, "defaults", "screens.json")]
+    if tenant:
+        paths.append(os.path.join(base, tenant, "screens.json"))
+    configs = []
+    for path in paths:
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                configs.append(json.load(f))
+    return configs
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,313 @@
+"""
+python -m benchmarks.screen_refresh [--screen ID ...] [--baseline benchmarks/baseline.json]
+
+Corre DataManager.refresh_screen de cada pantalla contra la BD local de standin_db
+(SQLite con datos sintéticos) por el camino real de db_helper, y reporta por pantalla:
+
+    wall_seconds        refresh_screen en frío (cachés vacías), mediana de --repeat
+    plan/fetch/transform_seconds
+                        fases de _compute_screen: planeación, espera de la BD (o de los
+                        cubos) e inyección en Python
+    db_seconds          suma de la latencia de cada query (con concurrencia > fetch)
+    queries / rows      sentencias ejecutadas y filas traídas en frío
+    query_errors        sentencias que fallaron (SQL de SQL Server sin equivalente en SQLite)
+    warm_wall_seconds   la misma pantalla con la caché de queries caliente (use_cache=False
+                        sólo salta la caché de pantallas)
+    cache_hit_ratio     hits / (ejecutadas + hits + coalescidas) en la corrida caliente
+    peak_memory_kib     pico de tracemalloc de una corrida en frío aparte (--no-memory la omite)
+
+La salida es JSON (stdout o --output). Con --baseline compara contra un reporte previo
+y sale con código 1 si algo empeoró más allá de la tolerancia; --save-baseline guarda el
+reporte como nueva referencia.
+"""
+import argparse
+import asyncio
+import contextlib
+import datetime
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional
+
+BENCH_TENANT = "benchmark_standin"
+DEFAULT_FILTERS = {"year": "2025", "month": "marzo"}
+
+# métrica -> (tipo de comparación, umbral absoluto bajo el que se ignora la diferencia)
+REGRESSION_RULES = {
+    "wall_seconds": ("time", 0.01),
+    "transform_seconds": ("time", 0.01),
+    "warm_wall_seconds": ("time", 0.01),
+    "queries": ("count", 0),
+    "rows": ("count", 0),
+    "query_errors": ("count", 0),
+    "peak_memory_kib": ("time", 256),
+    "cache_hit_ratio": ("ratio", 0.05),
+}
+
+
+class _ErrorCounter(logging.Handler):
+    """Cuenta los errores que db_helper registra (la query devuelve [] en vez de fallar)."""
+
+    def __init__(self) -> None:
+        super().__init__(level=logging.ERROR)
+        self.count = 0
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.count += 1
+
+
+def _isolate_environment() -> None:
+    # Cachés en memoria del proceso: clear() no debe tocar un Redis / SQLite compartido
+    os.environ["CACHE_BACKEND"] = "memory"
+    os.environ["SNAPSHOT_STORE_ENABLED"] = "false"
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "Analitica.settings")
+
+
+def _parse_filters(items: List[str]) -> Dict[str, str]:
+    filters = dict(DEFAULT_FILTERS)
+    for item in items:
+        key, sep, value = item.partition("=")
+        if not sep or not key.strip():
+            raise SystemExit(f"Filtro inválido '{item}': usa CLAVE=VALOR")
+        filters[key.strip()] = value.strip()
+    return filters
+
+
+class ScreenBenchmark:
+    def __init__(self, data_manager, tenant: str, filters: Dict[str, str], repeat: int, memory: bool) -> None:
+        from flask import Flask
+
+        self.dm = data_manager
+        self.tenant = tenant
+        self.filters = filters
+        self.repeat = max(1, repeat)
+        self.memory = memory
+        # refresh_screen lee la sesión de Flask (tenant activo y catálogo de BDs)
+        self.app = Flask(__name__)
+        self.app.secret_key = "benchmark"
+        self.errors = _ErrorCounter()
+
+    def _clear_caches(self) -> None:
+        from dashboard_core.db_helper import reset_db_failures
+
+        self.dm.cache.clear()
+        self.dm.query_cache.clear()
+        reset_db_failures(self.tenant)
+
+    def _run(self, screen_id: str) -> Dict[str, Any]:
+        from flask import session
+        from services.data_manager import track_query_cost
+
+        errors_before = self.errors.count
+        with self.app.test_request_context():
+            session["current_db"] = self.tenant
+            with track_query_cost() as cost:
+                started = time.perf_counter()
+                asyncio.run(self.dm.refresh_screen(
+                    screen_id, filters=dict(self.filters), use_cache=False, db_config=self.tenant,
+                ))
+                wall = time.perf_counter() - started
+        return {"wall": wall, "errors": self.errors.count - errors_before, **cost}
+
+    def measure(self, screen_id: str) -> Dict[str, Any]:
+        cold_runs = []
+        for _ in range(self.repeat):
+            self._clear_caches()
+            cold_runs.append(self._run(screen_id))
+        warm_runs = [self._run(screen_id) for _ in range(self.repeat)]
+
+        def median(runs, field):
+            return statistics.median(r.get(field, 0.0) for r in runs)
+
+        cold = cold_runs[-1]
+        lookups = sum(r.get("executed", 0) + r.get("cache_hits", 0) + r.get("coalesced", 0) for r in warm_runs)
+        hits = sum(r.get("cache_hits", 0) for r in warm_runs)
+        result = {
+            "wall_seconds": round(median(cold_runs, "wall"), 6),
+            "plan_seconds": round(median(cold_runs, "plan_seconds"), 6),
+            "fetch_seconds": round(median(cold_runs, "fetch_seconds"), 6),
+            "transform_seconds": round(median(cold_runs, "transform_seconds"), 6),
+            "db_seconds": round(median(cold_runs, "db_seconds"), 6),
+            "queries": int(cold.get("executed", 0)),
+            "rows": int(cold.get("rows", 0)),
+            "query_errors": int(cold["errors"]),
+            "warm_wall_seconds": round(median(warm_runs, "wall"), 6),
+            "cache_hit_ratio": round(hits / lookups, 4) if lookups else None,
+            "peak_memory_kib": None,
+        }
+        if self.memory:
+            self._clear_caches()
+            tracemalloc.start()
+            try:
+                self._run(screen_id)
+                result["peak_memory_kib"] = round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+            finally:
+                tracemalloc.stop()
+        return result
+
+    def run(self, screen_ids: List[str]) -> Dict[str, Any]:
+        db_logger = logging.getLogger("dashboard_core.db_helper")
+        db_logger.addHandler(self.errors)
+        try:
+            return {sid: self.measure(sid) for sid in screen_ids}
+        finally:
+            db_logger.removeHandler(self.errors)
+
+
+def _totals(screens: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    totals: Dict[str, Any] = {}
+    for field in ("wall_seconds", "transform_seconds", "db_seconds", "warm_wall_seconds", "queries", "rows", "query_errors"):
+        total = sum(s.get(field) or 0 for s in screens.values())
+        totals[field] = round(total, 6) if isinstance(total, float) else total
+    peaks = [s["peak_memory_kib"] for s in screens.values() if s.get("peak_memory_kib") is not None]
+    totals["peak_memory_kib"] = max(peaks) if peaks else None
+    return totals
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> Dict[str, Any]:
+    """
+    Diferencias por pantalla contra el baseline. Tiempos y memoria empeoran si crecen más
+    de tolerance (y más que el umbral absoluto de REGRESSION_RULES); queries, filas y
+    errores si crecen en absoluto; cache_hit_ratio si baja más que su umbral.
+    """
+    regressions, improvements = [], []
+    for sid, current in report["screens"].items():
+        before = baseline.get("screens", {}).get(sid)
+        if before is None:
+            continue
+        for metric, (kind, min_delta) in REGRESSION_RULES.items():
+            old, new = before.get(metric), current.get(metric)
+            if old is None or new is None:
+                continue
+            delta = new - old
+            entry = {"screen": sid, "metric": metric, "baseline": old, "current": new}
+            if kind == "ratio":
+                worse, better = delta < -min_delta, delta > min_delta
+            elif kind == "count":
+                worse, better = delta > min_delta, delta < -min_delta
+            else:
+                threshold = max(old * tolerance, min_delta)
+                worse, better = delta > threshold, -delta > threshold
+            if old:
+                entry["change"] = round(delta / old, 4)
+            if worse:
+                regressions.append(entry)
+            elif better:
+                improvements.append(entry)
+
+    warnings = []
+    if baseline.get("meta", {}).get("dataset") != report["meta"]["dataset"]:
+        warnings.append("El baseline se midió con otro dataset; filas y queries no son comparables")
+    if baseline.get("meta", {}).get("filters") != report["meta"]["filters"]:
+        warnings.append("El baseline se midió con otros filtros")
+    missing = sorted(set(baseline.get("screens", {})) - set(report["screens"]))
+    return {
+        "baseline_created": baseline.get("meta", {}).get("created"),
+        "tolerance": tolerance,
+        "regressions": regressions,
+        "improvements": improvements,
+        "missing_screens": missing,
+        "warnings": warnings,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de refresh_screen contra una BD local sintética")
+    parser.add_argument("--screen", action="append", default=[], help="Pantalla a medir (repetible); por defecto todas")
+    parser.add_argument("--filter", action="append", default=[], metavar="CLAVE=VALOR",
+                        help=f"Filtro de pantalla (repetible); por defecto {DEFAULT_FILTERS}")
+    parser.add_argument("--repeat", type=int, default=5, help="Corridas por pantalla y fase (se reporta la mediana)")
+    parser.add_argument("--no-memory", action="store_true", help="Omite la corrida con tracemalloc")
+    parser.add_argument("--db", default=None, help="SQLite ya generado con benchmarks.datagen (por defecto la BD local chica)")
+    parser.add_argument("--fact-rows", type=int, default=2000, help="Filas por tabla de hechos")
+    parser.add_argument("--dim-rows", type=int, default=25, help="Filas por dimensión")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default=None, help="Escribe el reporte JSON en este archivo")
+    parser.add_argument("--baseline", default=None, help="Reporte previo contra el cual comparar")
+    parser.add_argument("--save-baseline", default=None, help="Guarda este reporte como baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Tolerancia relativa de tiempos y memoria")
+    args = parser.parse_args(argv)
+
+    _isolate_environment()
+    filters = _parse_filters(args.filter)
+    # Los avisos de la app van a stdout; el JSON tiene que salir limpio
+    with contextlib.redirect_stdout(sys.stderr):
+        report = _build_report(args, filters)
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            report["comparison"] = compare(report, json.load(f), args.tolerance)
+        exit_code = 1 if report["comparison"]["regressions"] else 0
+
+    payload = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(payload + "\n")
+    else:
+        print(payload)
+    if args.save_baseline:
+        baseline = {k: v for k, v in report.items() if k != "comparison"}
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            f.write(json.dumps(baseline, indent=2, ensure_ascii=False) + "\n")
+
+    if exit_code:
+        for r in report["comparison"]["regressions"]:
+            print(f"🐢 {r['screen']}: {r['metric']} {r['baseline']} → {r['current']}", file=sys.stderr)
+    return exit_code
+
+
+def _build_report(args: argparse.Namespace, filters: Dict[str, str]) -> Dict[str, Any]:
+    from benchmarks import datagen, standin_db
+    from dashboard_core.db_helper import register_engine
+    from dashboard_core.metadata_engine import MetadataEngine
+    from services.data_manager import data_manager
+
+    screen_map = data_manager.get_screen_map(BENCH_TENANT)
+    if args.db:
+        # BD ya generada (p. ej. con benchmarks.datagen a escala): se usa tal cual
+        if not os.path.exists(args.db):
+            raise SystemExit(f"No existe la BD {args.db}")
+        db_path = args.db
+        meta = datagen.read_meta(db_path) or {}
+        dataset = {
+            "db": os.path.basename(db_path),
+            "seed": meta.get("seed"),
+            "rows": sum(t["rows"] for t in meta.get("tables", {}).values()),
+        }
+    else:
+        metadata = MetadataEngine().get_context(BENCH_TENANT)
+        dataset = {"fact_rows": args.fact_rows, "dim_rows": args.dim_rows, "seed": args.seed}
+        db_path = standin_db.build_standin_db(
+            metadata["tables"], metadata["metrics"], screen_map, standin_db.DEFAULT_PATH, **dataset,
+        )
+    register_engine(BENCH_TENANT, standin_db.create_standin_engine(db_path))
+
+    unknown = [sid for sid in args.screen if sid not in screen_map]
+    if unknown:
+        raise SystemExit(f"Pantallas desconocidas: {', '.join(unknown)}")
+    screen_ids = args.screen or list(screen_map)
+
+    bench = ScreenBenchmark(data_manager, BENCH_TENANT, filters, args.repeat, memory=not args.no_memory)
+    screens = bench.run(screen_ids)
+    return {
+        "meta": {
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "dataset": dataset,
+            "filters": filters,
+            "repeat": args.repeat,
+        },
+        "screens": screens,
+        "totals": _totals(screens),
+    }
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,59 @@
+"""
+BD local (SQLite) con datos sintéticos para correr las pantallas sin SQL Server.
+
+Los datos los genera benchmarks.datagen a partir de la metadata del tenant (esquema,
+llaves y joins consistentes). build_standin_db sólo regenera el archivo si cambió la
+metadata o los parámetros, así las corridas del benchmark comparan contra los mismos datos.
+
+El engine es SQLite puro: al registrarlo con db_helper.register_engine el builder
+compila para el dialecto SQLite (strftime en lugar de YEAR / MONTH, DATEDIFF y GETDATE
+traducidos), así las pantallas corren el mismo plan que en SQL Server.
+"""
+import datetime
+import json
+import os
+from typing import Any, Dict
+
+from sqlalchemy import create_engine
+
+from benchmarks import datagen
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".data", "standin.sqlite")
+
+
+def build_standin_db(
+    tables: Dict[str, Any],
+    metrics: Dict[str, Any],
+    screens: Any,
+    path: str = DEFAULT_PATH,
+    *,
+    fact_rows: int = 2000,
+    dim_rows: int = 25,
+    start: datetime.date = datagen.DEFAULT_START,
+    end: datetime.date = datagen.DEFAULT_END,
+    seed: int = 7,
+) -> str:
+    """Crea (o reutiliza, si ya existe con la misma metadata y parámetros) la BD en path."""
+    schema = datagen.size_schema(datagen.infer_schema(tables, metrics, screens), fact_rows, dim_rows)
+    expected = {
+        "seed": seed, "start": start.isoformat(), "end": end.isoformat(), "dim_rows": dim_rows,
+        "tables": schema.describe(),
+    }
+    stored = datagen.read_meta(path)
+    if stored is not None and _same(stored, expected):
+        return path
+
+    datagen.generate(
+        schema, datagen.SqliteWriter(path), dim_rows=dim_rows, start=start, end=end, seed=seed,
+    )
+    return path
+
+
+def _same(stored: Dict[str, Any], expected: Dict[str, Any]) -> bool:
+    # read_meta devuelve JSON: las tuplas (columna, tipo) vuelven como listas
+    return stored == json.loads(json.dumps(expected))
+
+
+def create_standin_engine(path: str = DEFAULT_PATH):
+    """Engine de SQLAlchemy sobre la BD local."""
+    return create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
@@ -5,7 +5,8 @@ from dotenv import load_dotenv
 load_dotenv()
 
 class Config:
-    SECRET_KEY = os.getenv("SECRET_KEY", "llave-secreta-desarrollo")
+    DEFAULT_SECRET_KEY = "llave-secreta-desarrollo"
+    SECRET_KEY = os.getenv("SECRET_KEY", DEFAULT_SECRET_KEY)
     
     # --- CONFIGURACIÓN DE SESIONES ---
     SESSION_TYPE = "filesystem"
@@ -33,6 +34,61 @@ class Config:
     SQL_PASSWORD = os.getenv("AZURE_SQL_PASSWORD")
     SQL_DRIVER = os.getenv("AZURE_SQL_DRIVER", "ODBC Driver 17 for SQL Server")
 
+    # --- POOL DE CONEXIONES POR TENANT (dashboard_core.db_helper) ---
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+    DB_POOL_MAX_OVERFLOW = int(os.getenv("DB_POOL_MAX_OVERFLOW", "5"))
+    DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "1800"))
+    DB_POOL_IDLE_SECONDS = int(os.getenv("DB_POOL_IDLE_SECONDS", "900"))
+    # Cada cuánto se revisan los pools inactivos (no en cada query)
+    DB_POOL_EVICT_INTERVAL_SECONDS = int(os.getenv("DB_POOL_EVICT_INTERVAL_SECONDS", "60"))
+
+    # --- CACHÉ DE RESULTADOS (services.cache_backends) ---
+    # memory = por proceso | sqlite = archivo compartido por workers del host | redis
+    # Las entradas compartidas son pickle firmado con SECRET_KEY: quien pueda escribir en el
+    # archivo o en Redis y conozca SECRET_KEY ejecuta código en los workers. Usa una
+    # SECRET_KEY propia (con la de desarrollo se usa memoria) y restringe el acceso al
+    # archivo / servidor Redis. sqlite requiere CACHE_SQLITE_PATH en un directorio de la app.
+    CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+    CACHE_SQLITE_PATH = os.getenv("CACHE_SQLITE_PATH", "")
+    CACHE_SQLITE_MMAP_BYTES = int(os.getenv("CACHE_SQLITE_MMAP_BYTES", str(256 * 1024 * 1024)))
+    CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://localhost:6379/0")
+    # Tiempo máximo que una pantalla se conserva (sirve como dato "stale" mientras se refresca)
+    CACHE_SCREEN_RETENTION_SECONDS = int(os.getenv("CACHE_SCREEN_RETENTION_SECONDS", "86400"))
+    # Presupuesto LRU (bytes aproximados) por caché; cada tenant usa como máximo esta fracción
+    CACHE_QUERY_MAX_BYTES = int(os.getenv("CACHE_QUERY_MAX_BYTES", str(256 * 1024 * 1024)))
+    CACHE_SCREEN_MAX_BYTES = int(os.getenv("CACHE_SCREEN_MAX_BYTES", str(64 * 1024 * 1024)))
+    CACHE_TENANT_MAX_FRACTION = float(os.getenv("CACHE_TENANT_MAX_FRACTION", "0.5"))
+    # Series mensuales: los meses cerrados se cachean con este TTL; el mes anterior sigue
+    # "abierto" durante los primeros CACHE_CLOSED_PERIOD_GRACE_DAYS días (ajustes de cierre)
+    CACHE_CLOSED_PERIOD_TTL_SECONDS = int(os.getenv("CACHE_CLOSED_PERIOD_TTL_SECONDS", str(30 * 24 * 3600)))
+    CACHE_CLOSED_PERIOD_GRACE_DAYS = int(os.getenv("CACHE_CLOSED_PERIOD_GRACE_DAYS", "3"))
+    # Snapshots en disco de periodos cerrados (un SQLite por tenant en SNAPSHOT_DIR, firmados
+    # con SECRET_KEY): requieren SNAPSHOT_DIR en un directorio de la app y una SECRET_KEY propia
+    SNAPSHOT_STORE_ENABLED = os.getenv("SNAPSHOT_STORE_ENABLED", "false").lower() in ("1", "true", "yes")
+    SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "")
+    SNAPSHOT_MAX_AGE_SECONDS = int(os.getenv("SNAPSHOT_MAX_AGE_SECONDS", str(180 * 24 * 3600)))
+    SNAPSHOT_IDLE_SECONDS = int(os.getenv("SNAPSHOT_IDLE_SECONDS", str(60 * 24 * 3600)))
+    SNAPSHOT_COMPACT_INTERVAL_SECONDS = int(os.getenv("SNAPSHOT_COMPACT_INTERVAL_SECONDS", "86400"))
+
+    # Queries compiladas por SmartQueryBuilder que se memorizan (LRU compartido por el proceso)
+    QUERY_COMPILE_CACHE_SIZE = int(os.getenv("QUERY_COMPILE_CACHE_SIZE", "4096"))
+    # Historial por query (filas y duración de la última ejecución) que usa explain_screen
+    QUERY_HISTORY_RETENTION_SECONDS = int(os.getenv("QUERY_HISTORY_RETENTION_SECONDS", str(14 * 24 * 3600)))
+    QUERY_HISTORY_MAX_BYTES = int(os.getenv("QUERY_HISTORY_MAX_BYTES", str(8 * 1024 * 1024)))
+
+    # Modo cubo ("cube" en screens.json): filas máximas de un cubo local antes de volver a SQL
+    CUBE_MAX_ROWS = int(os.getenv("CUBE_MAX_ROWS", "200000"))
+
+    # --- PRE-CALENTADOR DE CACHÉ (services.cache_warmer) ---
+    # Recalcula la vista por defecto de cada pantalla para los tenants vistos en las últimas
+    # CACHE_WARMER_ACTIVE_SECONDS, con CACHE_WARMER_CONCURRENCY queries a la vez como máximo.
+    # Apagado por defecto (agrega carga a la BD); activo corre en un solo worker de gunicorn
+    # y sólo sirve a todos los workers con CACHE_BACKEND=sqlite o redis
+    CACHE_WARMER_ENABLED = os.getenv("CACHE_WARMER_ENABLED", "false").lower() in ("1", "true", "yes")
+    CACHE_WARMER_INTERVAL_SECONDS = int(os.getenv("CACHE_WARMER_INTERVAL_SECONDS", "600"))
+    CACHE_WARMER_ACTIVE_SECONDS = int(os.getenv("CACHE_WARMER_ACTIVE_SECONDS", "86400"))
+    CACHE_WARMER_CONCURRENCY = int(os.getenv("CACHE_WARMER_CONCURRENCY", "1"))
+
     @classmethod
     def get_connection_string(cls, target_db=None):
         if not all([cls.SQL_SERVER, cls.SQL_USERNAME, cls.SQL_PASSWORD]):
@@ -1,9 +1,13 @@
 import time
 import logging
-from sqlalchemy import create_engine, text, event
+import threading
+from sqlalchemy import String, bindparam, create_engine, text, event
 from sqlalchemy.pool import NullPool
 from config import Config
 from asgiref.sync import sync_to_async
+from dashboard_core.result_set import ResultSet
+from dashboard_core.sql_query import split_query
+from dashboard_core.sql_dialect import SQL_SERVER, SqlDialect, dialect_for_engine, get_sql_dialect
 
 logger = logging.getLogger(__name__)
 
@@ -13,6 +17,34 @@ BLOCK_SECONDS = 5
 MAX_FAILS = 2
 QUERY_TIMEOUT = 15
 
+# Registro de engines por tenant (db_name -> {"engine", "last_used", "dialect"}).
+# Cada BD tiene su propio pool; los tenants inactivos se liberan tras DB_POOL_IDLE_SECONDS.
+ENGINES = {}
+_ENGINES_LOCK = threading.Lock()
+_last_eviction = 0.0
+_EVICTION_LOCK = threading.Lock()
+
+# Tope de queries simultáneas por BD para todo el proceso (todos los hilos y event loops
+# de Dash), del tamaño total del pool (pool_size + max_overflow): quien no tiene lugar
+# espera en su hilo en vez de agotar el pool y fallar por pool_timeout.
+QUERY_SLOT_WAIT_SECONDS = QUERY_TIMEOUT * 4
+QUERY_SLOTS = max(1, Config.DB_POOL_SIZE + Config.DB_POOL_MAX_OVERFLOW)
+_QUERY_GATES = {}
+_QUERY_GATES_LOCK = threading.Lock()
+
+
+class QuerySlotTimeout(TimeoutError):
+    """Sin lugar en el pool tras QUERY_SLOT_WAIT_SECONDS: la query no se ejecutó, así que
+    no hay resultado (ni vacío) que guardar en caché."""
+
+
+def _query_gate(db_name: str) -> threading.BoundedSemaphore:
+    with _QUERY_GATES_LOCK:
+        gate = _QUERY_GATES.get(db_name)
+        if gate is None:
+            gate = _QUERY_GATES[db_name] = threading.BoundedSemaphore(QUERY_SLOTS)
+        return gate
+
 
 def reset_db_failures(db_name: str = None): # type: ignore
     global FAILURES
@@ -41,6 +73,143 @@ def get_db_status(db_name: str) -> dict:
     }
 
 
+def _create_pooled_engine(conn_str: str):
+    engine = create_engine(
+        conn_str,
+        echo=False,
+        pool_size=Config.DB_POOL_SIZE,
+        max_overflow=Config.DB_POOL_MAX_OVERFLOW,
+        pool_timeout=QUERY_TIMEOUT,
+        pool_recycle=Config.DB_POOL_RECYCLE_SECONDS,
+        pool_pre_ping=True,
+        # SQLAlchemy fija el nivel en cada conexión y lo restaura al devolverla al pool
+        isolation_level=SQL_SERVER.isolation_level,
+        connect_args={"timeout": QUERY_TIMEOUT}
+    )
+
+    _install_session_statements(engine, SQL_SERVER)
+    return engine
+
+
+def _install_session_statements(engine, dialect: SqlDialect):
+    statements = dialect.session_statements(QUERY_TIMEOUT)
+    if not statements:
+        return
+
+    # Se ejecuta una sola vez por conexión física del pool (no en cada cursor).
+    @event.listens_for(engine, "connect")
+    def receive_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+        finally:
+            cursor.close()
+
+
+def evict_idle_engines(max_idle_seconds: int = None) -> int: # type: ignore
+    """Libera los pools de tenants sin consultas en los últimos max_idle_seconds."""
+    max_idle = Config.DB_POOL_IDLE_SECONDS if max_idle_seconds is None else max_idle_seconds
+    now = time.time()
+    with _ENGINES_LOCK:
+        idle = [
+            name for name, entry in ENGINES.items()
+            if not entry.get("pinned") and now - entry["last_used"] > max_idle
+        ]
+        evicted = [ENGINES.pop(name) for name in idle]
+
+    for name, entry in zip(idle, evicted):
+        logger.info(f"♻️ Liberando pool inactivo de BD: {name}")
+        entry["engine"].dispose()
+    return len(evicted)
+
+
+def maybe_evict_idle_engines() -> int:
+    """evict_idle_engines a lo más una vez cada DB_POOL_EVICT_INTERVAL_SECONDS (fuera del camino de cada query)."""
+    global _last_eviction
+    now = time.time()
+    with _EVICTION_LOCK:
+        if now - _last_eviction < Config.DB_POOL_EVICT_INTERVAL_SECONDS:
+            return 0
+        _last_eviction = now
+    return evict_idle_engines()
+
+
+def dispose_engine(db_name: str = None): # type: ignore
+    """Cierra las conexiones del pool. Los engines de register_engine siguen registrados."""
+    with _ENGINES_LOCK:
+        names = [db_name] if db_name else list(ENGINES)
+        entries = [ENGINES[name] for name in names if name in ENGINES]
+        for name in names:
+            if name in ENGINES and not ENGINES[name].get("pinned"):
+                del ENGINES[name]
+
+    for entry in entries:
+        entry["engine"].dispose()
+
+
+def register_engine(db_name: str, engine, dialect: str = None) -> None: # type: ignore
+    """
+    Registra un engine ya creado para db_name en lugar del pool de SQL Server (p. ej.
+    la BD local de benchmarks/). No se libera por inactividad y dispose_engine sólo
+    cierra sus conexiones.
+
+    dialect ("mssql" | "sqlite" | "duckdb") es el SQL que SmartQueryBuilder compila para
+    esta BD; por defecto se deduce del engine. Sus sentencias de sesión (lock timeout,
+    busy_timeout) se aplican a cada conexión nueva.
+    """
+    sql_dialect = get_sql_dialect(dialect) if dialect else dialect_for_engine(engine)
+    with _ENGINES_LOCK:
+        previous = ENGINES.get(db_name)
+        if previous is None or previous["engine"] is not engine:
+            _install_session_statements(engine, sql_dialect)
+        ENGINES[db_name] = {"engine": engine, "last_used": time.time(), "pinned": True, "dialect": sql_dialect}
+    if previous is not None and previous["engine"] is not engine:
+        previous["engine"].dispose()
+    reset_db_failures(db_name)
+    logger.info(f"🔌 Engine registrado para BD: {db_name} ({sql_dialect.name})")
+
+
+def get_dialect(db_name: str = None) -> SqlDialect: # type: ignore
+    """Dialecto SQL de la BD: el del engine registrado, o SQL Server (pool normal)."""
+    entry = ENGINES.get(db_name) if isinstance(db_name, str) and db_name else None
+    return entry.get("dialect", SQL_SERVER) if entry else SQL_SERVER
+
+
+def get_engine(db_name: str):
+    """Devuelve el engine con pool del tenant, creándolo en el primer uso."""
+    if not db_name:
+        return None
+
+    now = time.time()
+    with _ENGINES_LOCK:
+        entry = ENGINES.get(db_name)
+        if entry is None:
+            conn_str = Config.get_connection_string(target_db=db_name)
+            if not conn_str:
+                return None
+            entry = {"engine": _create_pooled_engine(conn_str), "last_used": now}
+            ENGINES[db_name] = entry
+            logger.info(f"🔌 Pool creado para BD: {db_name}")
+        entry["last_used"] = now
+
+    maybe_evict_idle_engines()
+    return entry["engine"]
+
+
+def get_pool_status() -> dict:
+    now = time.time()
+    with _ENGINES_LOCK:
+        items = list(ENGINES.items())
+    return {
+        name: {
+            "idle_seconds": round(now - entry["last_used"], 1),
+            "pool": entry["engine"].pool.status(),
+        }
+        for name, entry in items
+    }
+
+
 def validate_db_quick(db_name: str) -> bool:
     if not db_name:
         return False
@@ -73,7 +242,20 @@ def validate_db_quick(db_name: str) -> bool:
             engine.dispose()
 
 
-def _execute_dynamic_query_sync(db_name: str, query: str):
+def _statement(sql: str, params: dict):
+    """
+    text() con los parámetros str tipados como String: con pyodbc SQLAlchemy los enlaza
+    como VARCHAR (setinputsizes) en vez de NVARCHAR. Un NVARCHAR comparado contra una
+    columna varchar de catálogo obliga a SQL Server a CONVERT_IMPLICIT sobre la columna
+    y convierte el index seek en scan; VARCHAR contra nvarchar sólo convierte el parámetro.
+    """
+    stmt = text(sql)
+    typed = [bindparam(name, type_=String()) for name, value in params.items() if isinstance(value, str)]
+    return stmt.bindparams(*typed) if typed else stmt
+
+
+def _execute_dynamic_query_sync(db_name: str, query):
+    """query: SQL plano o SqlQuery (plantilla + parámetros enlazados)."""
     if not db_name:
         logger.warning("⚠️ Intento de consulta sin nombre de BD")
         return []
@@ -86,32 +268,26 @@ def _execute_dynamic_query_sync(db_name: str, query: str):
         logger.warning(f"🚫 BD {db_name} bloqueada por {seconds_left}s más")
         return []
 
-    conn_str = Config.get_connection_string(target_db=db_name)
-    if not conn_str:
+    engine = get_engine(db_name)
+    if engine is None:
         logger.error(f"❌ No se pudo obtener connection string para: {db_name}")
         return []
 
-    engine = None
+    gate = _query_gate(db_name)
+    if not gate.acquire(timeout=QUERY_SLOT_WAIT_SECONDS):
+        logger.warning(f"⏱️ {db_name}: sin lugar en el pool tras {QUERY_SLOT_WAIT_SECONDS}s de espera")
+        raise QuerySlotTimeout(f"{db_name}: sin lugar en el pool tras {QUERY_SLOT_WAIT_SECONDS}s")
+
     start_time = time.time()
 
     try:
-        engine = create_engine(
-            conn_str,
-            echo=False,
-            poolclass=NullPool,
-            connect_args={"timeout": QUERY_TIMEOUT}
-        )
-
-        @event.listens_for(engine, "before_cursor_execute", retval=True)
-        def receive_before_cursor_execute(conn, cursor, statement, params, context, executemany):
-            cursor.execute(f"SET LOCK_TIMEOUT {QUERY_TIMEOUT * 1000};")
-            return statement, params
-
-        with engine.connect() as connection:
-            connection.execute(text("SET TRANSACTION ISOLATION LEVEL READ UNCOMMITTED"))
-            result = connection.execute(text(query))
-            keys = result.keys()
-            rows = [dict(zip(keys, row)) for row in result.fetchall()]
+        try:
+            with engine.connect() as connection:
+                sql, params = split_query(query)
+                result = connection.execute(_statement(sql, params), params)
+                rows = ResultSet.from_records(result.keys(), result.fetchall())
+        finally:
+            gate.release()
 
         if db_name in FAILURES:
             FAILURES[db_name] = {"count": 0, "blocked_until": 0}
@@ -138,6 +314,11 @@ def _execute_dynamic_query_sync(db_name: str, query: str):
             or "not a recognized built-in function" in error_msg
             or "ProgrammingError" in error_msg
             or "Incorrect syntax" in error_msg
+            or (
+                # Mensajes de SQLite (BD local de benchmarks/); en SQL Server no aplican
+                get_dialect(db_name).name == "sqlite"
+                and any(x in error_msg for x in ("no such function", "no such column", "syntax error"))
+            )
         ) and "42S02" not in error_msg  # 42S02 = table not found → should still block
 
         is_timeout = any(x in error_msg for x in [
@@ -171,16 +352,14 @@ def _execute_dynamic_query_sync(db_name: str, query: str):
                 f"🚫 BD {db_name} BLOQUEADA por {BLOCK_SECONDS}s "
                 f"(fallos consecutivos: {state['count']})"
             )
+            # Descarta las conexiones del pool; al desbloquear se abren limpias
+            dispose_engine(db_name)
         else:
             logger.warning(f"⚠️ Fallo {state['count']}/{MAX_FAILS} para {db_name}")
 
         FAILURES[db_name] = state
         return []
 
-    finally:
-        if engine:
-            engine.dispose()
-
 
 execute_dynamic_query = sync_to_async(
     _execute_dynamic_query_sync,
@@ -0,0 +1,104 @@
+"""
+python manage.py explain_screen <screen_id> [--tenant BD] [--filter clave=valor ...]
+
+Dry-run de DataManager.explain_screen: qué SQL emitiría la pantalla, cuáles se
+deduplican o salen de caché, filas y latencia estimadas y camino crítico. No ejecuta
+ninguna query. Con --max-queries sirve como chequeo en CI: falla si la pantalla
+(o alguna, con --all) ejecutaría más sentencias que el límite.
+
+Las columnas de caché y de filas / latencia estimadas sólo dicen algo con
+CACHE_BACKEND=sqlite o redis: con el backend en memoria cada proceso del CLI arranca
+con la caché vacía y sin historial de queries.
+"""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        "Muestra, sin ejecutar nada, las queries que emitiría una pantalla de screens.json. "
+        "Los aciertos de caché y las filas / latencia estimadas requieren CACHE_BACKEND=sqlite o redis "
+        "(con 'memory' el CLI siempre ve la caché fría y sin historial)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("screen_id", nargs="?", help="Pantalla de screens.json (p. ej. operational-dashboard)")
+        parser.add_argument("--all", action="store_true", help="Todas las pantallas del tenant")
+        parser.add_argument("--tenant", default=None, help="Base de datos del tenant, como session['current_db'] (sin ella: metadata por defecto)")
+        parser.add_argument(
+            "--filter", action="append", default=[], metavar="CLAVE=VALOR",
+            help="Filtro de la pantalla (repetible), p. ej. --filter year=2025 --filter month=marzo",
+        )
+        parser.add_argument("--sql", action="store_true", help="Imprime el SQL completo de cada sentencia")
+        parser.add_argument("--json", action="store_true", help="Salida JSON")
+        parser.add_argument("--max-queries", type=int, default=None, help="Falla si se ejecutarían más sentencias")
+
+    def handle(self, *args, **options):
+        from services.data_manager import data_manager
+
+        filters = {}
+        for item in options["filter"]:
+            key, sep, value = item.partition("=")
+            if not sep or not key.strip():
+                raise CommandError(f"Filtro inválido '{item}': usa CLAVE=VALOR")
+            filters[key.strip()] = value.strip()
+
+        tenant = options["tenant"]
+        if options["all"]:
+            screen_ids = list(data_manager.get_screen_map(tenant))
+        elif options["screen_id"]:
+            screen_ids = [options["screen_id"]]
+        else:
+            raise CommandError("Indica una pantalla o --all")
+
+        reports = [data_manager.explain_screen(sid, dict(filters), tenant) for sid in screen_ids]
+
+        if options["json"]:
+            self.stdout.write(json.dumps(reports if options["all"] else reports[0], indent=2, ensure_ascii=False, default=str))
+        else:
+            for report in reports:
+                self._print_report(report, show_sql=options["sql"])
+
+        limit = options["max_queries"]
+        if limit is not None:
+            over = [r for r in reports if r.get("summary", {}).get("statements", 0) > limit]
+            if over:
+                names = ", ".join(f"{r['screen_id']} ({r['summary']['statements']})" for r in over)
+                raise CommandError(f"Pantallas con más de {limit} sentencias SQL: {names}")
+
+    def _print_report(self, report, show_sql=False):
+        if report.get("error"):
+            self.stdout.write(self.style.ERROR(f"❌ {report['screen_id']}: {report['error']}"))
+            return
+
+        summary = report["summary"]
+        title = f"🔍 {report['screen_id']}  tenant={report['tenant'] or 'default'}  filtros={report['filters']}"
+        if report["cube_mode"]:
+            title += "  (modo cubo: cota superior, el cubo responde parte)"
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        self.stdout.write(f"{'#':>3}  {'caché':<8} {'dup':>4} {'filas':>8} {'seg':>8}  {'periodo':<7} targets")
+        for stmt in report["statements"]:
+            dup = "" if stmt["duplicate_of"] is None else f"={stmt['duplicate_of']}"
+            rows = "?" if stmt["estimated_rows"] is None else str(stmt["estimated_rows"])
+            secs = "?" if stmt["estimated_seconds"] is None else f"{stmt['estimated_seconds']:.3f}"
+            self.stdout.write(
+                f"{stmt['index']:>3}  {stmt['cache']:<8} {dup:>4} {rows:>8} {secs:>8}  {stmt['period'] or '-':<7} "
+                f"{', '.join(stmt['targets'])}"
+            )
+            if show_sql:
+                self.stdout.write(f"      {stmt['sql']}")
+                if stmt["params"]:
+                    self.stdout.write(f"      -- {stmt['params']}")
+
+        critical = summary["critical_path_seconds"]
+        self.stdout.write(
+            f"   solicitudes={summary['requests']} sentencias={summary['statements']} "
+            f"duplicadas={summary['duplicates']} en caché={summary['cache_hits']} "
+            f"a ejecutar={summary['to_execute']} filas≈{summary['estimated_rows']} "
+            f"camino crítico≈{'?' if critical is None else f'{critical:.3f}s'} (concurrencia {summary['concurrency']})"
+        )
+        if summary["latency_unknown"]:
+            how = "sin estimación de latencia" if critical is None else "se estiman con la mediana"
+            self.stdout.write(f"   {summary['latency_unknown']} sentencias sin historial ({how})")
+        self.stdout.write("")
@@ -1,7 +1,47 @@
+import copy
+import hashlib
 import json
 import os
+import threading
 from django.conf import settings
 
+_METADATA_FILES = ('tables.json', 'metrics.json', 'modifiers.json')
+
+
+class FrozenDict(dict):
+    """dict de sólo lectura: la metadata cacheada se comparte entre todos los consumidores.
+    dict(x), {**x} o copy.deepcopy(x) devuelven copias normales modificables."""
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("La metadata compartida es de sólo lectura; usa copy.deepcopy() para modificarla")
+
+    __setitem__ = __delitem__ = _readonly
+    update = pop = popitem = clear = setdefault = _readonly
+
+    def __reduce__(self):
+        return (dict, (dict(self),))
+
+    def __deepcopy__(self, memo):
+        return {k: copy.deepcopy(v, memo) for k, v in self.items()}
+
+
+class MetadataContext(FrozenDict):
+    """{"tables", "metrics", "modifiers"} de un tenant, con:
+    version: contador del proceso, sube en cada recarga;
+    fingerprint: hash del contenido (igual metadata → mismo fingerprint)."""
+    version: int = 0
+    fingerprint: str = ""
+    tenant: str = ""
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return FrozenDict((k, _freeze(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return [_freeze(v) for v in value]
+    return value
+
+
 class MetadataEngine:
     _instance = None
     base_path: str
@@ -10,6 +50,10 @@ class MetadataEngine:
         if cls._instance is None:
             cls._instance = super(MetadataEngine, cls).__new__(cls)
             cls._instance.base_path = os.path.join(settings.BASE_DIR, 'metadata')
+            # tenant ("" = defaults) -> (firma de archivos, MetadataContext)
+            cls._instance._contexts = {}
+            cls._instance._lock = threading.Lock()
+            cls._instance._version = 0
         return cls._instance
 
     def _load_json(self, path):
@@ -22,7 +66,51 @@ class MetadataEngine:
             print(f"⚠️ Error cargando metadatos en {path}: {e}")
             return {}
 
+    def _files_signature(self, tenant_db):
+        """(ruta, mtime, tamaño) de los JSON que componen el contexto; None si no existe."""
+        dirs = [os.path.join(self.base_path, 'defaults')]
+        if tenant_db:
+            dirs.append(os.path.join(self.base_path, 'tenants', tenant_db))
+        signature = []
+        for d in dirs:
+            for name in _METADATA_FILES:
+                path = os.path.join(d, name)
+                try:
+                    st = os.stat(path)
+                    signature.append((path, st.st_mtime_ns, st.st_size))
+                except OSError:
+                    signature.append((path, None, None))
+        return tuple(signature)
+
     def get_context(self, tenant_db=None):
+        """
+        Contexto de metadata del tenant (defaults + overrides), cacheado por proceso.
+        Sólo se vuelve a leer si cambia el mtime / tamaño de algún JSON o tras reload().
+        Devuelve el MetadataContext compartido (de sólo lectura).
+        """
+        key = tenant_db or ""
+        signature = self._files_signature(tenant_db)
+        cached = self._contexts.get(key)
+        if cached and cached[0] == signature:
+            return cached[1]
+
+        with self._lock:
+            cached = self._contexts.get(key)
+            if cached and cached[0] == signature:
+                return cached[1]
+            context = self._build_context(tenant_db)
+            self._contexts[key] = (signature, context)
+            return context
+
+    def reload(self, tenant_db=None):
+        """Descarta el contexto cacheado de un tenant (o de todos); el siguiente get_context relee."""
+        with self._lock:
+            if tenant_db is None:
+                self._contexts.clear()
+            else:
+                self._contexts.pop(tenant_db or "", None)
+
+    def _build_context(self, tenant_db):
         defaults_path = os.path.join(self.base_path, 'defaults')
         tables = self._load_json(os.path.join(defaults_path, 'tables.json'))
         metrics = self._load_json(os.path.join(defaults_path, 'metrics.json'))
@@ -43,8 +131,16 @@ class MetadataEngine:
             if tenant_modifiers:
                 modifiers.update(tenant_modifiers)
 
-        return {
+        raw = {
             "tables": tables,
             "metrics": metrics,
             "modifiers": modifiers
-        }
\ No newline at end of file
+        }
+        context = MetadataContext((k, _freeze(v)) for k, v in raw.items())
+        self._version += 1
+        context.version = self._version
+        context.fingerprint = hashlib.sha256(
+            json.dumps(raw, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()[:16]
+        context.tenant = tenant_db or ""
+        return context
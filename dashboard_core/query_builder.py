@@ -1,6 +1,83 @@
 from .metadata_engine import MetadataEngine
+from .sql_query import QueryParams, SqlQuery
+from .sql_dialect import SQL_SERVER, SqlDialect
+from .db_helper import get_dialect
+from collections import OrderedDict
+from config import Config
 import datetime
+import functools
+import hashlib
+import json
 import re
+import threading
+
+
+class _CompileCache:
+    """LRU acotado de queries compiladas, compartido por todos los builders del proceso
+    (DataManager, drawer, motor de diagnóstico...). La clave incluye la versión de la
+    metadata, así recargarla deja las entradas viejas sin uso hasta que el LRU las saca."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries), "max_entries": self.max_entries,
+                "hits": self.hits, "misses": self.misses,
+                "hit_ratio": round(self.hits / total, 4) if total else None,
+            }
+
+
+_compile_cache = _CompileCache(Config.QUERY_COMPILE_CACHE_SIZE)
+
+
+def _memoized(method):
+    """Memoriza un método puro del builder por (versión de metadata, dialecto SQL, año en
+    curso, forma canónica de los argumentos). El año entra porque sin filtro de año el
+    periodo objetivo es el actual. Devuelve una copia superficial del dict cacheado
+    (los llamadores le agregan o reemplazan claves)."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not _compile_cache.max_entries:
+            return method(self, *args, **kwargs)
+        try:
+            canonical = json.dumps([args, kwargs], sort_keys=True, default=str)
+        except (TypeError, ValueError):
+            return method(self, *args, **kwargs)
+        key = (self.meta_version, self.dialect.name, method.__name__, datetime.datetime.now().year, canonical)
+        found, build = _compile_cache.get(key)
+        if not found:
+            build = method(self, *args, **kwargs)
+            _compile_cache.put(key, build)
+        return dict(build) if isinstance(build, dict) else build
+    return wrapper
+
 
 class SmartQueryBuilder:
 
@@ -52,37 +129,90 @@ class SmartQueryBuilder:
             end_year = year if month < 12 else year + 1
             return f"{year}-{month:02d}-01", f"{end_year}-{end_month:02d}-01"
     
-    def __init__(self, tenant_db=None):
+    def __init__(self, tenant_db=None, dialect: SqlDialect = SQL_SERVER):
         self.meta = MetadataEngine().get_context(tenant_db)
+        # SQL que emite el builder (YEAR/MONTH, alias, funciones de las recetas)
+        self.dialect = dialect
         self.tables = self.meta.get('tables', {})
         self.metrics = self.meta.get('metrics', {})
+        self._join_index = self._build_join_index()
+        self._column_exprs = {}
+        # Sello de la metadata cargada: parte de la clave de las queries memorizadas
+        self.meta_version = getattr(self.meta, "fingerprint", "") or hashlib.sha256(
+            json.dumps(self.meta, sort_keys=True, default=str).encode("utf-8")
+        ).hexdigest()[:16]
+
+    @staticmethod
+    def compile_stats() -> dict:
+        """Hits / misses de la memoización de queries compiladas."""
+        return _compile_cache.stats()
+
+    @staticmethod
+    def clear_compile_cache():
+        _compile_cache.clear()
     
-    def _find_join_path(self, start_table_alias, target_dimension_key, visited=None):
-        if visited is None: visited = set()
-        visited.add(start_table_alias)
-    
-        start_def = self.tables.get(start_table_alias)
-        if not start_def: return None
-    
-        joins = start_def.get('joins', {})
-    
-        for join_key, join_def in joins.items():
-            if join_def.get('target_table') == target_dimension_key:
-                return [(join_def.get('target_table'), join_def)]
-    
-        if target_dimension_key in joins:
-            return [(joins[target_dimension_key]['target_table'], joins[target_dimension_key])]
-    
-        for join_key, join_def in joins.items():
-            neighbor_alias = join_def.get('target_table')
-            if neighbor_alias not in visited:
-                path = self._find_join_path(neighbor_alias, target_dimension_key, visited)
-                if path:
-                    return [(neighbor_alias, join_def)] + path
-    
-        return None
-    
-    def get_dataframe_query(self, metrics: list, dimensions: list, filters=None, page_filters=None):
+    def _build_join_index(self) -> dict:
+        """
+        Tabla de ruteo de JOINs: {tabla origen: {destino: [(alias, join_def), ...]}} con el
+        camino más corto (BFS en el orden de los joins de tables.json) desde cada tabla.
+        Además de los alias de tabla, cada destino se puede pedir por la clave del join que
+        llega a él (p. ej. "area" desde h_viaje), como hacía la búsqueda recursiva.
+        """
+        index = {}
+        for start in self.tables:
+            routes = {}
+            by_key = {}
+            frontier = [(start, [])]
+            seen = {start}
+            while frontier:
+                next_frontier = []
+                for alias, path in frontier:
+                    for join_key, join_def in (self.tables.get(alias, {}).get('joins') or {}).items():
+                        target = join_def.get('target_table')
+                        step = path + [(target, join_def)]
+                        by_key.setdefault(join_key, step)
+                        if target in seen:
+                            continue
+                        seen.add(target)
+                        routes[target] = step
+                        if target in self.tables:
+                            next_frontier.append((target, step))
+                frontier = next_frontier
+            for join_key, step in by_key.items():
+                routes.setdefault(join_key, step)
+            routes.pop(start, None)
+            index[start] = routes
+        return index
+
+    def _find_join_path(self, start_table_alias, target_dimension_key):
+        """Camino más corto de JOINs entre dos tablas (ver _build_join_index); None si no hay."""
+        path = self._join_index.get(start_table_alias, {}).get(target_dimension_key)
+        return list(path) if path else None
+
+    def join_index_report(self) -> dict:
+        """Validación del grafo de JOINs: joins hacia tablas no definidas y pares
+        (origen → destino) sin camino."""
+        undefined = [
+            {"table": alias, "join": join_key, "target": join_def.get('target_table')}
+            for alias, t_def in self.tables.items()
+            for join_key, join_def in (t_def.get('joins') or {}).items()
+            if join_def.get('target_table') not in self.tables
+        ]
+        unreachable = {
+            start: sorted(t for t in self.tables if t != start and t not in self._join_index.get(start, {}))
+            for start in self.tables
+        }
+        return {
+            "tables": len(self.tables),
+            "reachable_pairs": sum(len(self.tables) - 1 - len(v) for v in unreachable.values()),
+            "unreachable_pairs": sum(len(v) for v in unreachable.values()),
+            "undefined_targets": undefined,
+            "unreachable": {start: targets for start, targets in unreachable.items() if targets},
+        }
+
+    def _resolve_fact_table(self, metrics: list):
+        """Resuelve la tabla de hechos a partir de la primera métrica con receta.
+        Devuelve (fact_alias, fact_def) o el resultado anticipado (None, placeholder o error)."""
         first_metric = self.metrics.get(metrics[0])
         if not first_metric: 
             return None
@@ -115,7 +245,237 @@ class SmartQueryBuilder:
                         fact_alias = potential_parent
                         fact_def = defs
                         break
-                    
+
+        return fact_alias, fact_def
+
+    def _effective_time_modifier(self, metrics: list):
+        # El primer time_modifier del batch aplica a todas sus métricas
+        for m_key in metrics:
+            m_def = self.metrics.get(m_key)
+            if m_def and 'recipe' in m_def and m_def['recipe'].get('time_modifier'):
+                return m_def['recipe']['time_modifier']
+        return None
+
+    def _fusion_key(self, metrics: list, dimensions: list, filters=None, page_filters=None):
+        """Firma de la query que generaría el batch: misma tabla de hechos, mismas tablas
+        de métricas (mismos JOINs), mismo periodo, dimensiones y filtros. None si no es fusionable."""
+        if not metrics:
+            return None
+        try:
+            resolved = self._resolve_fact_table(metrics)
+        except Exception:
+            return None
+        if not isinstance(resolved, tuple):
+            return None
+
+        metric_tables = set()
+        for m_key in metrics:
+            m = self.metrics.get(m_key)
+            if not m or m.get('type') in ['derived', 'placeholder']:
+                continue
+            metric_tables.add(m.get('recipe', {}).get('table') or "")
+
+        # Sin dimensiones, las variantes de periodo (actual / previous_year / ytd)
+        # caben en el mismo SELECT vía agregación condicional (ver period_variants)
+        period_key = "__period_variants__" if not dimensions else self._effective_time_modifier(metrics)
+
+        return (
+            resolved[0],
+            tuple(sorted(metric_tables)),
+            period_key,
+            tuple(dimensions or []),
+            json.dumps(filters or {}, sort_keys=True, default=str),
+            json.dumps(page_filters or [], sort_keys=True, default=str),
+        )
+
+    def plan_fused_queries(self, requests: list, open_period_start: str | None = None) -> dict:
+        """
+        Planificador de fusión para todas las solicitudes de métricas de una pantalla.
+
+        requests: [{"id", "metrics", "dimensions", "filters", "page_filters"}, ...]
+
+        Las solicitudes con la misma firma (ver _fusion_key) se compilan en un solo
+        SELECT con la unión de sus métricas. Si el grupo mezcla variantes de periodo,
+        cada solicitud lee sus métricas de columnas propias ("columns": alias → métrica).
+        open_period_start se pasa a get_dataframe_query (corte de periodos cerrados).
+        Devuelve:
+            {"queries": [{**build, "metrics": [...], "request_ids": [...]}],
+             "mapping": {request_id: {"query_index": i, "metrics": [...], "columns"?: {...}}}}
+        """
+        queries = []
+        mapping = {}
+        groups = {}
+
+        for req in requests:
+            req_id = req.get("id")
+            metrics = list(req.get("metrics") or [])
+            dims = list(req.get("dimensions") or [])
+            key = self._fusion_key(metrics, dims, req.get("filters"), req.get("page_filters"))
+
+            if key is not None and key in groups:
+                idx = groups[key]
+                queries[idx]["metrics"].extend(m for m in metrics if m not in queries[idx]["metrics"])
+                queries[idx]["request_ids"].append(req_id)
+            else:
+                idx = len(queries)
+                queries.append({
+                    "metrics": list(dict.fromkeys(metrics)),
+                    "dimensions": dims,
+                    "filters": req.get("filters"),
+                    "page_filters": req.get("page_filters"),
+                    "request_ids": [req_id],
+                    "fusable": key is not None,
+                })
+                if key is not None:
+                    groups[key] = idx
+            mapping[req_id] = {"query_index": idx, "metrics": metrics}
+
+        for q in queries:
+            variants = {}
+            for req_id in q["request_ids"]:
+                req_metrics = mapping[req_id]["metrics"]
+                bucket = variants.setdefault(self._effective_time_modifier(req_metrics), [])
+                bucket.extend(m for m in req_metrics if m not in bucket)
+            period_variants = variants if len(variants) > 1 else None
+
+            try:
+                build = self.get_dataframe_query(
+                    q["metrics"], q["dimensions"], filters=q["filters"], page_filters=q["page_filters"],
+                    period_variants=period_variants, open_period_start=open_period_start,
+                ) if q["metrics"] else None
+            except Exception as e:
+                build = {"error": str(e)}
+
+            if period_variants and build and build.get("variant_columns"):
+                for req_id in q["request_ids"]:
+                    req_metrics = mapping[req_id]["metrics"]
+                    aliases = build["variant_columns"][self._effective_time_modifier(req_metrics)]
+                    mapping[req_id]["columns"] = {aliases[m]: m for m in req_metrics if m in aliases}
+
+            q.update(build or {})
+            for k in ("dimensions", "filters", "page_filters", "fusable", "variant_columns"):
+                q.pop(k, None)
+
+        return {"queries": queries, "mapping": mapping}
+
+    def _page_filter_wheres(self, page_filters, used_tables, params: QueryParams) -> list:
+        """Condiciones WHERE de los page_filters cuyas tablas están en la query (valores enlazados en params)."""
+        wheres = []
+        if not page_filters:
+            return wheres
+        _pf_list = page_filters if isinstance(page_filters, list) else [page_filters]
+        for pf in _pf_list:
+            if not isinstance(pf, dict) or "field" not in pf or "operator" not in pf or "value" not in pf:
+                continue
+            field = pf.get("field", "")
+            if "." not in field:
+                continue
+            table_alias, column = field.split(".", 1)
+            if table_alias not in used_tables or table_alias not in self.tables:
+                continue
+            col_name = f"{table_alias}.{column}"
+            op = pf["operator"].strip().upper()
+            val = pf["value"]
+            if isinstance(val, list):
+                if not val:
+                    continue
+                clean_vals = [params.bind(x) for x in val]
+                if op == "NOT IN":
+                    wheres.append(f"{col_name} NOT IN ({', '.join(clean_vals)})")
+                else:
+                    wheres.append(f"{col_name} IN ({', '.join(clean_vals)})")
+            else:
+                wheres.append(f"{col_name} {pf['operator']} {params.bind(val)}")
+        return wheres
+
+    def _resolve_target_period(self, filters):
+        """(año, mes) objetivo de los filtros; mes None = año completo."""
+        target_year = datetime.datetime.now().year
+        target_month = None
+    
+        if filters:
+            if filters.get('year'):
+                target_year = int(filters['year'])
+    
+            if filters.get('month'):
+                m_val = filters['month']
+                try:
+                    target_month = int(m_val)
+                    if 1 <= target_month <= 12:
+                        pass
+                    else:
+                        target_month = None
+                except (TypeError, ValueError):
+                    m_name = str(m_val).lower()
+                    if hasattr(self, 'MONTH_MAP') and m_name in self.MONTH_MAP:
+                        target_month = self.MONTH_MAP[m_name]
+                    else:
+                        target_month = None
+        return target_year, target_month
+
+    def _column_expr(self, column, table_alias):
+        key = (column, table_alias)
+        expr = self._column_exprs.get(key)
+        if expr is None:
+            expr = self._column_exprs[key] = self._compile_column_expr(column, table_alias)
+        return expr
+
+    def _compile_column_expr(self, column, table_alias):
+        # Expression: contains operators, parens, or spaces (e.g. "duracion * costo"); metadata stays table-agnostic
+        is_expression = isinstance(column, str) and (
+            "(" in column or "*" in column or "+" in column or "-" in column or "/" in column or (" " in column and "." not in column)
+        )
+        if is_expression:
+            return self.dialect.translate(self._qualify_expression(column, table_alias))
+        return f"{table_alias}.{column}"
+
+    def _period_range(self, year: int, month: int | None, time_modifier=None):
+        """Rango (start, end) que get_dataframe_query aplica para un time_modifier sin agrupación."""
+        if time_modifier == 'previous_year':
+            year -= 1
+        if month is None:
+            return self._build_date_range(year)
+        return self._build_date_range(year, month, ytd=(time_modifier == 'ytd'))
+
+    @staticmethod
+    def _aggregate_sql(aggregation_type, inner: str, condition: str | None = None) -> str:
+        if condition:
+            inner = f"CASE WHEN {condition} THEN {inner} END"
+        if aggregation_type in ("DISTINCTCOUNT", "COUNT_DISTINCT"):
+            return f"COUNT(DISTINCT {inner})"
+        return f"{aggregation_type}({inner})"
+
+    @_memoized
+    def get_dataframe_query(
+        self, metrics: list, dimensions: list, filters=None, page_filters=None, period_variants=None,
+        open_period_start: str | None = None,
+    ):
+        """
+        period_variants: {time_modifier: [métricas]} opcional, sólo sin dimensiones.
+        Compila las variantes (actual / previous_year / ytd) de las métricas en un solo
+        SELECT: el WHERE cubre la unión de los rangos y cada variante se agrega con
+        CASE WHEN sobre su propio rango. Las columnas salen como "<métrica>__<variante>"
+        y se reportan en "variant_columns": {time_modifier: {métrica: alias}}.
+
+        La query sale como SqlQuery: periodos y valores de filtro van como parámetros
+        enlazados (:p0, :p1, ...), así la plantilla es la misma para cualquier filtro.
+
+        open_period_start: fecha ISO desde la que los hechos aún pueden cambiar. Si el
+        rango de fechas de la query termina antes, indica "closed_period": True. Para
+        series por mes / año-mes que cruzan el corte (cada grupo cae entero de un lado)
+        devuelve en "period_split" las queries {"closed", "open"} cuyas filas unidas
+        equivalen a "query".
+        """
+        if period_variants:
+            if dimensions:
+                raise ValueError("period_variants no admite dimensiones")
+            metrics = list(dict.fromkeys(m for v_metrics in period_variants.values() for m in v_metrics))
+
+        resolved = self._resolve_fact_table(metrics)
+        if not isinstance(resolved, tuple):
+            return resolved
+        fact_alias, fact_def = resolved
+
         selects = []
         group_bys = []
         joins_needed = set()
@@ -133,7 +493,7 @@ class SmartQueryBuilder:
         for dim in dimensions:
             if "." in dim:
                 tbl, col = dim.split(".")
-                selects.append(f"{tbl}.{col} as '{dim}'")
+                selects.append(f"{tbl}.{col} as {self.dialect.quote_alias(dim)}")
                 group_bys.append(f"{tbl}.{col}")
                 if tbl != fact_alias:
                     path = self._find_join_path(fact_alias, tbl)
@@ -144,6 +504,7 @@ class SmartQueryBuilder:
                 selects.append(f"{fact_alias}.{dim}")
                 group_bys.append(f"{fact_alias}.{dim}")
     
+        metric_aggs = []  # (m_key, aggregation, expresión interna)
         for m_key in metrics:
             m = self.metrics.get(m_key)
             if not m or m.get('type') in ['derived', 'placeholder']: 
@@ -153,35 +514,21 @@ class SmartQueryBuilder:
             m_table = recipe.get('table')
             col = recipe.get('column')
             agg = recipe.get('aggregation', 'SUM')
-            # Expression: contains operators, parens, or spaces (e.g. "duracion * costo"); metadata stays table-agnostic
-            is_expression = isinstance(col, str) and (
-                "(" in col or "*" in col or "+" in col or "-" in col or "/" in col or (" " in col and "." not in col)
-            )
-
-            def get_agg_expr(table_alias, column_name, aggregation_type):
-                is_distinct_count = aggregation_type in ("DISTINCTCOUNT", "COUNT_DISTINCT")
-                if is_expression:
-                    inner = self._qualify_expression(column_name, table_alias)
-                    if is_distinct_count:
-                        return f"COUNT(DISTINCT {inner})"
-                    return f"{aggregation_type}({inner})"
-                if is_distinct_count:
-                    return f"COUNT(DISTINCT {table_alias}.{column_name})"
-                return f"{aggregation_type}({table_alias}.{column_name})"
-
 
             if m_table != fact_alias:
                 path = self._find_join_path(fact_alias, m_table)
                 if path:
                     for neighbor, _ in path:
                         joins_needed.add(neighbor)
-                    expr = get_agg_expr(m_table, col, agg)
-                    selects.append(f"{expr} as {m_key}")
+                    metric_aggs.append((m_key, agg, self._column_expr(col, m_table)))
                 else:
                     print(f"WARNING: No join path found from {fact_alias} to {m_table} for metric {m_key}")
             else:
-                expr = get_agg_expr(fact_alias, col, agg)
-                selects.append(f"{expr} as {m_key}")
+                metric_aggs.append((m_key, agg, self._column_expr(col, fact_alias)))
+
+        if not period_variants:
+            for m_key, agg, inner in metric_aggs:
+                selects.append(f"{self._aggregate_sql(agg, inner)} as {m_key}")
 
         if not fact_def.get('date_column'):
             for j_key, j_def in fact_def.get('joins', {}).items():
@@ -252,36 +599,12 @@ class SmartQueryBuilder:
         used_tables = {fact_alias} | processed_joins
     
         wheres = []
+        params = QueryParams()
     
-        target_year = datetime.datetime.now().year
-        target_month = None
-    
-        if filters:
-            if filters.get('year'):
-                target_year = int(filters['year'])
-    
-            if filters.get('month'):
-                m_val = filters['month']
-                try:
-                    target_month = int(m_val)
-                    if 1 <= target_month <= 12:
-                        pass
-                    else:
-                        target_month = None
-                except (TypeError, ValueError):
-                    m_name = str(m_val).lower()
-                    if hasattr(self, 'MONTH_MAP') and m_name in self.MONTH_MAP:
-                        target_month = self.MONTH_MAP[m_name]
-                    else:
-                        target_month = None
-        
+        target_year, target_month = self._resolve_target_period(filters)
 
-        time_modifier = None
-        for m_key in metrics:
-            m_def = self.metrics.get(m_key)
-            if m_def and 'recipe' in m_def and m_def['recipe'].get('time_modifier'):
-                time_modifier = m_def['recipe']['time_modifier']
-                break
+        # Con period_variants cada variante aplica su propio modificador (ver _period_range)
+        time_modifier = None if period_variants else self._effective_time_modifier(metrics)
         
 
         month_operator = "="
@@ -300,55 +623,80 @@ class SmartQueryBuilder:
             col = self.tables[tbl]['date_column']
             date_col_to_use = col if "." in col else f"{tbl}.{col}"
     
-        if date_col_to_use:
+        variant_columns = None
+        series_range = None
+        date_upper = None  # fin (exclusivo) del rango de fechas de la query
+        if period_variants:
+            # Un solo scan: WHERE sobre la unión de rangos, una columna CASE por variante
+            variant_ranges = {
+                mod: self._period_range(target_year, target_month, mod) for mod in period_variants
+            }
+            selected = {m_key for m_key, _, _ in metric_aggs}
+            aggs_by_key = {m_key: (agg, inner) for m_key, agg, inner in metric_aggs}
+            variant_columns = {}
+            for mod, v_metrics in period_variants.items():
+                condition = None
+                if date_col_to_use:
+                    v_start, v_end = variant_ranges[mod]
+                    condition = f"{date_col_to_use} >= {params.bind(v_start)} AND {date_col_to_use} < {params.bind(v_end)}"
+                variant_columns[mod] = {}
+                for m_key in v_metrics:
+                    if m_key not in selected or m_key in variant_columns[mod]:
+                        continue
+                    alias = f"{m_key}__{mod or 'current'}"
+                    agg, inner = aggs_by_key[m_key]
+                    selects.append(f"{self._aggregate_sql(agg, inner, condition)} as {alias}")
+                    variant_columns[mod][m_key] = alias
+
+            if date_col_to_use:
+                merged = []
+                for start, end in sorted(set(variant_ranges.values())):
+                    if merged and start <= merged[-1][1]:
+                        merged[-1][1] = max(merged[-1][1], end)
+                    else:
+                        merged.append([start, end])
+                date_upper = merged[-1][1]
+                if len(merged) == 1:
+                    wheres.append(f"{date_col_to_use} >= {params.bind(merged[0][0])}")
+                    wheres.append(f"{date_col_to_use} < {params.bind(merged[0][1])}")
+                else:
+                    ranges_sql = " OR ".join(
+                        f"({date_col_to_use} >= {params.bind(start)} AND {date_col_to_use} < {params.bind(end)})"
+                        for start, end in merged
+                    )
+                    wheres.append(f"({ranges_sql})")
+
+        elif date_col_to_use:
             if group_by_year_month:
                 # Multi-year series: GROUP BY year+month, no lower-bound filter
-                selects.insert(0, f"YEAR({date_col_to_use}) as anio")
-                selects.insert(1, f"MONTH({date_col_to_use}) as mes")
-                group_bys.insert(0, f"YEAR({date_col_to_use})")
-                group_bys.insert(1, f"MONTH({date_col_to_use})")
+                year_sql, month_sql = self.dialect.year(date_col_to_use), self.dialect.month(date_col_to_use)
+                selects.insert(0, f"{year_sql} as anio")
+                selects.insert(1, f"{month_sql} as mes")
+                group_bys.insert(0, year_sql)
+                group_bys.insert(1, month_sql)
                 end_m = target_month if target_month else 12
                 end_y = target_year if end_m < 12 else target_year + 1
                 end_m_next = end_m + 1 if end_m < 12 else 1
-                wheres.append(f"{date_col_to_use} < '{end_y}-{end_m_next:02d}-01'")
+                series_range = (None, f"{end_y}-{end_m_next:02d}-01")
+                wheres.append(f"{date_col_to_use} < {params.bind(series_range[1])}")
+                date_upper = series_range[1]
             else:
                 if group_by_month:
-                    selects.insert(0, f"MONTH({date_col_to_use}) as period")
-                    group_bys.insert(0, f"MONTH({date_col_to_use})")
+                    month_sql = self.dialect.month(date_col_to_use)
+                    selects.insert(0, f"{month_sql} as period")
+                    group_bys.insert(0, month_sql)
                     start, end = self._build_date_range(target_year)
+                    series_range = (start, end)
                 elif target_month is not None:
                     is_ytd = (time_modifier == 'ytd')
                     start, end = self._build_date_range(target_year, target_month, ytd=is_ytd)
                 else:
                     start, end = self._build_date_range(target_year)
-                wheres.append(f"{date_col_to_use} >= '{start}'")
-                wheres.append(f"{date_col_to_use} < '{end}'")
+                wheres.append(f"{date_col_to_use} >= {params.bind(start)}")
+                wheres.append(f"{date_col_to_use} < {params.bind(end)}")
+                date_upper = end
 
-        if page_filters:
-            _pf_list = page_filters if isinstance(page_filters, list) else [page_filters]
-            for pf in _pf_list:
-                if not isinstance(pf, dict) or "field" not in pf or "operator" not in pf or "value" not in pf:
-                    continue
-                field = pf.get("field", "")
-                if "." not in field:
-                    continue
-                table_alias, column = field.split(".", 1)
-                if table_alias not in used_tables or table_alias not in self.tables:
-                    continue
-                col_name = f"{table_alias}.{column}"
-                op = pf["operator"].strip().upper()
-                val = pf["value"]
-                if isinstance(val, list):
-                    if not val:
-                        continue
-                    clean_vals = [f"'{x}'" if isinstance(x, str) else str(x) for x in val]
-                    if op == "NOT IN":
-                        wheres.append(f"{col_name} NOT IN ({', '.join(clean_vals)})")
-                    else:
-                        wheres.append(f"{col_name} IN ({', '.join(clean_vals)})")
-                else:
-                    clean_val = f"'{val}'" if isinstance(val, str) else str(val)
-                    wheres.append(f"{col_name} {pf['operator']} {clean_val}")
+        wheres.extend(self._page_filter_wheres(page_filters, used_tables, params))
 
         if filters:
             ignore_keys = ['year', 'month']
@@ -374,32 +722,184 @@ class SmartQueryBuilder:
                 if isinstance(v, dict) and "operator" in v and "value" in v:
                     op = v["operator"]
                     val = v["value"]
-                    clean_val = f"'{val}'" if isinstance(val, str) else str(val)
-                    wheres.append(f"{col_name} {op} {clean_val}")
+                    wheres.append(f"{col_name} {op} {params.bind(val)}")
 
                 # CASO 2: Lista de valores (IN)
                 elif isinstance(v, list):
                     if not v: continue
-                    clean_vals = [f"'{x}'" if isinstance(x, str) else str(x) for x in v]
+                    clean_vals = [params.bind(x) for x in v]
                     wheres.append(f"{col_name} IN ({', '.join(clean_vals)})")
 
                 # CASO 3: Filtro Normal (Igualdad)
                 else:
-                    clean_val = f"'{v}'" if isinstance(v, str) else str(v)
-                    wheres.append(f"{col_name} = {clean_val}")
-
-        where_sql = " WHERE " + " AND ".join(wheres) if wheres else ""
-
+                    wheres.append(f"{col_name} = {params.bind(v)}")
 
         group_by_clause = f"GROUP BY {', '.join(group_bys)}" if group_bys else ""
 
-        query = f"""
+        def _render(extra_wheres=(), extra_params=None):
+            all_wheres = wheres + list(extra_wheres)
+            where_sql = " WHERE " + " AND ".join(all_wheres) if all_wheres else ""
+            return SqlQuery.build(f"""
             SELECT {', '.join(selects)}
             FROM {fact_def['table_name']} as {fact_alias}
             {joins_sql}
             {where_sql}
             {group_by_clause}
+        """, {**params, **(extra_params or {})})
+
+        query = _render()
+
+        build = {"type": "sql", "query": query}
+        if variant_columns is not None:
+            build["variant_columns"] = variant_columns
+        if open_period_start and date_upper:
+            if date_upper <= open_period_start:
+                build["closed_period"] = True
+            elif series_range and (series_range[0] is None or series_range[0] < open_period_start):
+                cut = f"p{len(params)}"
+                build["period_split"] = {
+                    "closed": _render([f"{date_col_to_use} < :{cut}"], {cut: open_period_start}),
+                    "open": _render([f"{date_col_to_use} >= :{cut}"], {cut: open_period_start}),
+                }
+        return build
+    # Agregaciones que se pueden re-agregar desde un cubo (suma de parciales)
+    CUBE_AGGREGATIONS = ("SUM", "COUNT")
+
+    def _cube_joins(self, fact_alias: str, dim_tables: set, required_tables: set):
+        """JOINs del cubo: LEFT para tablas que sólo aportan columnas de filtro, el tipo
+        de la metadata para las requeridas (page_filters). Devuelve (sql, tablas unidas)."""
+        joins_sql = ""
+        processed_joins = set()
+        for target in sorted(dim_tables | required_tables):
+            for next_alias, join_def in self._find_join_path(fact_alias, target) or []:
+                next_table_def = self.tables.get(next_alias)
+                if next_alias in processed_joins or not next_table_def:
+                    continue
+                j_type = join_def.get('type', 'INNER') if next_alias in required_tables else 'LEFT'
+                joins_sql += f" {j_type} JOIN {next_table_def['table_name']} as {next_alias} ON {join_def.get('on')}"
+                processed_joins.add(next_alias)
+        return joins_sql, processed_joins
+
+    def _column_path_tables(self, fact_alias: str, column: str):
+        """Tablas a unir para leer la columna; None si no hay camino de JOIN."""
+        tbl = column.split(".", 1)[0]
+        if tbl == fact_alias:
+            return set()
+        path = self._find_join_path(fact_alias, tbl)
+        return {neighbor for neighbor, _ in path} if path else None
+
+    @_memoized
+    def get_cube_fanout_query(self, fact_alias: str, columns: list, date_from: str, date_to: str):
         """
+        Cuenta las filas de la tabla de hechos en el rango ("base") y las que quedan tras
+        unir el camino de cada columna ("c<i>"). Si un JOIN es 1:N las cuentas difieren y
+        esa columna no puede entrar al cubo sin duplicar las medidas.
+        """
+        fact_def = self.tables.get(fact_alias)
+        if not fact_def or not fact_def.get('date_column'):
+            return {"error": f"La tabla '{fact_alias}' no tiene date_column propia"}
+        date_col = f"{fact_alias}.{fact_def['date_column']}"
+        params = QueryParams()
+        where_sql = f"WHERE {date_col} >= {params.bind(date_from)} AND {date_col} < {params.bind(date_to)}"
+        base_from = f"FROM {fact_def['table_name']} as {fact_alias}"
+
+        selects = [f"(SELECT COUNT(*) {base_from} {where_sql}) as base"]
+        checked = {}
+        for col in columns:
+            tables = self._column_path_tables(fact_alias, col)
+            if not tables:
+                continue
+            alias = f"c{len(checked)}"
+            joins_sql, _ = self._cube_joins(fact_alias, tables, set())
+            selects.append(f"(SELECT COUNT(*) {base_from}{joins_sql} {where_sql}) as {alias}")
+            checked[alias] = col
+        return {"type": "sql", "query": SqlQuery.build(f"SELECT {', '.join(selects)}", params), "checked_columns": checked}
+
+    @_memoized
+    def get_cube_query(self, fact_alias: str, measures: dict, columns: list, date_from: str, date_to: str, page_filters=None):
+        """
+        Query del cubo local (modo cubo de DataManager): una fila por año, mes y combinación
+        de columnas de filtro, con medidas aditivas de la tabla de hechos.
+
+        measures: {alias: (aggregation, column)} con aggregation en CUBE_AGGREGATIONS.
+        Las tablas que sólo aportan columnas de filtro entran con LEFT JOIN: get_dataframe_query
+        sólo hace ese JOIN cuando el filtro está activo, así el total sin filtros coincide
+        (siempre que el JOIN no sea 1:N, ver get_cube_fanout_query).
+        Las columnas sin camino de JOIN se devuelven en "ignored_columns" (get_dataframe_query
+        también descarta esos filtros).
+        """
+        fact_def = self.tables.get(fact_alias)
+        if not fact_def or not fact_def.get('date_column'):
+            return {"error": f"La tabla '{fact_alias}' no tiene date_column propia"}
+        date_col = f"{fact_alias}.{fact_def['date_column']}"
+
+        dim_tables, required_tables = set(), set()
+        kept_columns, ignored_columns = [], []
+        for col in columns:
+            tables = self._column_path_tables(fact_alias, col)
+            if tables is None:
+                ignored_columns.append(col)
+                continue
+            dim_tables.update(tables)
+            kept_columns.append(col)
 
-
-        return {"type": "sql", "query": query}
\ No newline at end of file
+        _pf_list = page_filters if isinstance(page_filters, list) else ([page_filters] if page_filters else [])
+        for pf in _pf_list:
+            if not isinstance(pf, dict) or "." not in pf.get("field", ""):
+                continue
+            tbl = pf["field"].split(".", 1)[0]
+            if tbl == fact_alias or tbl not in self.tables:
+                continue
+            path = self._find_join_path(fact_alias, tbl)
+            if path:
+                required_tables.update(neighbor for neighbor, _ in path)
+
+        joins_sql, processed_joins = self._cube_joins(fact_alias, dim_tables, required_tables)
+
+        year_sql, month_sql = self.dialect.year(date_col), self.dialect.month(date_col)
+        selects = [f"{year_sql} as anio", f"{month_sql} as mes"]
+        group_bys = [year_sql, month_sql]
+        for col in kept_columns:
+            selects.append(f"{col} as {self.dialect.quote_alias(col)}")
+            group_bys.append(col)
+        for alias, (agg, column) in measures.items():
+            selects.append(f"{self._aggregate_sql(agg, self._column_expr(column, fact_alias))} as {alias}")
+
+        params = QueryParams()
+        wheres = [f"{date_col} >= {params.bind(date_from)}", f"{date_col} < {params.bind(date_to)}"]
+        wheres.extend(self._page_filter_wheres(page_filters, {fact_alias} | processed_joins, params))
+
+        query = SqlQuery.build(f"""
+            SELECT {', '.join(selects)}
+            FROM {fact_def['table_name']} as {fact_alias}
+            {joins_sql}
+            WHERE {' AND '.join(wheres)}
+            GROUP BY {', '.join(group_bys)}
+        """, params)
+        return {"type": "sql", "query": query, "columns": kept_columns, "ignored_columns": ignored_columns}
+
+
+_builder_pool = {}
+_builder_pool_lock = threading.Lock()
+
+
+def get_query_builder(tenant_db=None, dialect: SqlDialect = None) -> SmartQueryBuilder: # type: ignore
+    """
+    Builder compartido del tenant (metadata defaults + metadata/tenants/<db>), con su
+    índice de JOINs y expresiones compiladas. Se reconstruye sólo cuando MetadataEngine
+    entrega un contexto nuevo (cambió algún JSON o hubo reload()).
+    Sin dialect, compila para el motor de la BD del tenant (db_helper.get_dialect).
+    """
+    tenant_db = tenant_db if isinstance(tenant_db, str) and tenant_db else None
+    dialect = dialect or get_dialect(tenant_db)
+    context = MetadataEngine().get_context(tenant_db)
+    pool_key = (tenant_db, dialect.name)
+    builder = _builder_pool.get(pool_key)
+    if builder is not None and builder.meta is context:
+        return builder
+    with _builder_pool_lock:
+        builder = _builder_pool.get(pool_key)
+        if builder is None or builder.meta is not context:
+            builder = SmartQueryBuilder(tenant_db=tenant_db, dialect=dialect)
+            _builder_pool[pool_key] = builder
+        return builder
@@ -0,0 +1,210 @@
+"""
+Resultado de una query en forma columnar.
+
+execute_dynamic_query devolvía una lista de dicts (un dict por fila con las claves
+repetidas). ResultSet guarda una tupla de nombres de columna y un arreglo por
+columna: NumPy (int64 / float64 + máscara de nulos) para las numéricas y listas con
+valores deduplicados para etiquetas, fechas y mixtas. Ocupa varias veces menos en
+las cachés (y en su pickle) y permite agregar columnas completas con NumPy.
+
+Sigue siendo una secuencia de filas: len(), rs[0], iteración, rs[:15] y sorted()
+entregan dicts construidos al vuelo, así el código que hace row.get(...) no cambia.
+Los Decimal de SQL Server se guardan como float64 (todo consumidor los pasa por
+_clean_val) y se entregan como float.
+"""
+import sys
+from collections.abc import Sequence
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+# (valores, nulos) — valores: np.ndarray o list; nulos: máscara bool o None si no hay
+_Column = Tuple[Any, Optional[np.ndarray]]
+
+
+def _encode(values: List[Any]) -> _Column:
+    kinds = {type(v) for v in values if v is not None}
+    nulls = None
+    if kinds and kinds <= {int, float, Decimal}:
+        is_null = [v is None for v in values]
+        if any(is_null):
+            nulls = np.array(is_null, dtype=bool)
+        try:
+            if kinds == {int}:
+                return np.array([0 if v is None else v for v in values], dtype=np.int64), nulls
+            return np.array([np.nan if v is None else float(v) for v in values], dtype=np.float64), nulls
+        except OverflowError:
+            pass
+    # Etiquetas: un solo objeto por valor distinto (el driver crea un str nuevo por fila)
+    canon: Dict[Any, Any] = {}
+    out = []
+    for v in values:
+        try:
+            out.append(canon.setdefault(v, v))
+        except TypeError:
+            out.append(v)
+    return out, None
+
+
+def _decode(column: _Column) -> List[Any]:
+    values, nulls = column
+    if isinstance(values, list):
+        return values
+    out = values.tolist()
+    if nulls is not None:
+        for i in np.flatnonzero(nulls).tolist():
+            out[i] = None
+    return out
+
+
+class ResultSet(Sequence):
+    __slots__ = ("columns", "_data", "_len")
+
+    def __init__(self, columns: Iterable[str], data: Mapping[str, _Column], length: int) -> None:
+        self.columns: Tuple[str, ...] = tuple(columns)
+        self._data: Dict[str, _Column] = dict(data)
+        self._len = length
+
+    @classmethod
+    def from_records(cls, keys: Iterable[str], records: List[Tuple[Any, ...]]) -> "ResultSet":
+        """Desde las tuplas de un cursor (result.keys(), result.fetchall())."""
+        names = tuple(keys)
+        by_column = list(zip(*records)) if records else [()] * len(names)
+        return cls(names, {name: _encode(list(vals)) for name, vals in zip(names, by_column)}, len(records))
+
+    @classmethod
+    def from_columns(cls, columns: Mapping[str, List[Any]]) -> "ResultSet":
+        lengths = {len(v) for v in columns.values()}
+        return cls(columns, {name: _encode(list(vals)) for name, vals in columns.items()}, lengths.pop() if lengths else 0)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Mapping[str, Any]]) -> "ResultSet":
+        if isinstance(rows, ResultSet):
+            return rows
+        rows = list(rows)
+        names = list(dict.fromkeys(k for r in rows for k in r))
+        return cls.from_columns({name: [r.get(name) for r in rows] for name in names})
+
+    @classmethod
+    def concat(cls, parts: Iterable[Iterable[Mapping[str, Any]]]) -> "ResultSet":
+        sets = [cls.from_rows(p) for p in parts]
+        sets = [s for s in sets if s._len] or sets[:1]
+        if not sets:
+            return cls((), {}, 0)
+        names = list(dict.fromkeys(c for s in sets for c in s.columns))
+        data: Dict[str, _Column] = {}
+        for name in names:
+            cols = [s._data.get(name) for s in sets]
+            same_dtype = all(c is not None and not isinstance(c[0], list) for c in cols) and \
+                len({c[0].dtype for c in cols}) == 1
+            if same_dtype:
+                nulls = None
+                if any(c[1] is not None for c in cols):
+                    nulls = np.concatenate([
+                        c[1] if c[1] is not None else np.zeros(len(c[0]), dtype=bool) for c in cols
+                    ])
+                data[name] = (np.concatenate([c[0] for c in cols]), nulls)
+            else:
+                merged: List[Any] = []
+                for s, c in zip(sets, cols):
+                    merged.extend(_decode(c) if c is not None else [None] * s._len)
+                data[name] = _encode(merged)
+        return cls(names, data, sum(s._len for s in sets))
+
+    # --- acceso columnar ---
+
+    def column(self, name: str) -> Any:
+        """Columna completa: np.ndarray (nulos como NaN en float64) o lista."""
+        values, nulls = self._data[name]
+        if nulls is not None and values.dtype == np.int64:
+            values = np.where(nulls, np.nan, values)
+        return values
+
+    def values(self, name: str) -> List[Any]:
+        """Columna como lista de valores Python (None para nulos); [None] * len si no existe."""
+        column = self._data.get(name)
+        return _decode(column) if column is not None else [None] * self._len
+
+    def select(self, mapping: Mapping[str, str]) -> "ResultSet":
+        """Proyección {columna origen: columna destino} sin copiar los arreglos."""
+        data = {
+            dest: self._data.get(src) or ([None] * self._len, None)
+            for src, dest in mapping.items()
+        }
+        return ResultSet(data, data, self._len)
+
+    def drop(self, names: Iterable[str]) -> "ResultSet":
+        names = set(names)
+        keep = [c for c in self.columns if c not in names]
+        return ResultSet(keep, {c: self._data[c] for c in keep}, self._len)
+
+    def take(self, indices: Any) -> "ResultSet":
+        idx = np.asarray(indices, dtype=np.intp)
+        data: Dict[str, _Column] = {}
+        for name, (values, nulls) in self._data.items():
+            if isinstance(values, list):
+                data[name] = ([values[i] for i in idx.tolist()], None)
+            else:
+                data[name] = (values[idx], nulls[idx] if nulls is not None else None)
+        return ResultSet(self.columns, data, len(idx))
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        return list(self)
+
+    @property
+    def nbytes(self) -> int:
+        """Memoria aproximada: arreglos NumPy más punteros y valores distintos de las listas."""
+        total = 0
+        for values, nulls in self._data.values():
+            if isinstance(values, list):
+                total += 8 * len(values) + sum(sys.getsizeof(v) for v in {id(v): v for v in values}.values())
+            else:
+                total += values.nbytes
+            total += nulls.nbytes if nulls is not None else 0
+        return total
+
+    # --- vista de filas (compatibilidad con List[Dict]) ---
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        names = self.columns
+        for vals in zip(*(_decode(self._data[c]) for c in names)):
+            yield dict(zip(names, vals))
+
+    def __getitem__(self, index: Any) -> Any:
+        if isinstance(index, slice):
+            return self.take(range(*index.indices(self._len)))
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("ResultSet index out of range")
+        row = {}
+        for name in self.columns:
+            values, nulls = self._data[name]
+            if nulls is not None and nulls[index]:
+                row[name] = None
+            else:
+                v = values[index]
+                row[name] = v.item() if isinstance(v, np.generic) else v
+        return row
+
+    def __eq__(self, other: Any) -> bool:
+        if isinstance(other, (ResultSet, list)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        return f"ResultSet({self._len} filas, columnas={list(self.columns)})"
+
+    def __getstate__(self) -> Dict[str, Any]:
+        return {"columns": self.columns, "data": self._data, "len": self._len}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.columns = state["columns"]
+        self._data = state["data"]
+        self._len = state["len"]
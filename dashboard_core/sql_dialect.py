@@ -0,0 +1,226 @@
+"""
+Dialectos SQL: lo que SmartQueryBuilder, el motor de diagnóstico y db_helper emiten
+distinto según el motor de la fuente de datos.
+
+    SQL Server   el de producción (pool de db_helper vía pyodbc); genera el mismo texto
+                 de siempre: YEAR() / MONTH(), alias '...', OFFSET ... FETCH NEXT y
+                 SET LOCK_TIMEOUT al abrir cada conexión
+    SQLite       motor embebido (benchmarks/, pruebas locales): strftime, LIMIT y
+                 PRAGMA busy_timeout
+    DuckDB       motor embebido columnar (lee Parquet directo): YEAR() / MONTH() nativos,
+                 date_diff y LIMIT
+
+Las recetas de metrics.json están escritas en SQL Server (DATEDIFF(day, ...), GETDATE(),
+ISNULL); translate() las reescribe al dialecto de la fuente, así la misma metadata y
+los mismos planes de pantalla corren en cualquiera de los tres.
+
+El dialecto de cada fuente lo resuelve db_helper.get_dialect(db_name): el del engine
+registrado con register_engine, o SQL Server para el pool normal.
+"""
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+
+# nombre de la función → reescritura (recibe los argumentos ya traducidos)
+CallRewriter = Callable[[List[str]], str]
+
+
+def _split_args(text: str) -> List[str]:
+    """Argumentos de nivel superior de una llamada (respeta paréntesis y literales '...')."""
+    args, depth, quote, start = [], 0, False, 0
+    for i, ch in enumerate(text):
+        if ch == "'":
+            quote = not quote
+        elif quote:
+            continue
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "," and depth == 0:
+            args.append(text[start:i].strip())
+            start = i + 1
+    tail = text[start:].strip()
+    if tail or args:
+        args.append(tail)
+    return args
+
+
+def _rewrite_calls(sql: str, rewriters: Dict[str, CallRewriter]) -> str:
+    """Reescribe NOMBRE(args) para los nombres de rewriters, de adentro hacia afuera."""
+    if not rewriters:
+        return sql
+    pattern = re.compile(r"\b(" + "|".join(map(re.escape, rewriters)) + r")\s*\(", re.IGNORECASE)
+    out, pos = [], 0
+    while True:
+        match = pattern.search(sql, pos)
+        if match is None:
+            out.append(sql[pos:])
+            return "".join(out)
+        # Si cae dentro de un literal '...', no es una llamada
+        if sql.count("'", 0, match.start()) % 2:
+            out.append(sql[pos:match.end()])
+            pos = match.end()
+            continue
+        depth, quote, end = 1, False, None
+        for i in range(match.end(), len(sql)):
+            ch = sql[i]
+            if ch == "'":
+                quote = not quote
+            elif quote:
+                continue
+            elif ch == "(":
+                depth += 1
+            elif ch == ")":
+                depth -= 1
+                if depth == 0:
+                    end = i
+                    break
+        if end is None:
+            out.append(sql[pos:])
+            return "".join(out)
+        inner = _rewrite_calls(sql[match.end():end], rewriters)
+        out.append(sql[pos:match.start()])
+        out.append(rewriters[match.group(1).upper()](_split_args(inner)))
+        pos = end + 1
+
+
+class SqlDialect:
+    """SQL Server (el dialecto base: lo que el builder emitía antes de los dialectos)."""
+    name = "mssql"
+    # Nivel de aislamiento del pool (create_engine(isolation_level=...)); None = el del motor
+    isolation_level: Optional[str] = "READ UNCOMMITTED"
+
+    def year(self, expr: str) -> str:
+        return f"YEAR({expr})"
+
+    def month(self, expr: str) -> str:
+        return f"MONTH({expr})"
+
+    def quote_alias(self, alias: str) -> str:
+        return f"'{alias}'"
+
+    def limit_clause(self, limit: int, order_by: str = "1") -> str:
+        """Sufijo para devolver sólo las primeras `limit` filas (en orden determinista)."""
+        return f" ORDER BY {order_by} OFFSET 0 ROWS FETCH NEXT {int(limit)} ROWS ONLY"
+
+    def session_statements(self, timeout_seconds: int) -> List[str]:
+        """Sentencias a ejecutar una vez por conexión física del pool."""
+        return [f"SET LOCK_TIMEOUT {int(timeout_seconds) * 1000};"]
+
+    def _rewriters(self) -> Dict[str, CallRewriter]:
+        return {}
+
+    def translate(self, expr: str) -> str:
+        """Expresión de receta (escrita para SQL Server) en este dialecto."""
+        return _rewrite_calls(expr, self._rewriters())
+
+    def __repr__(self) -> str:
+        return f"<SqlDialect {self.name}>"
+
+
+SqlServerDialect = SqlDialect
+
+
+def _datediff_args(args: List[str]) -> Tuple[str, str, str]:
+    if len(args) != 3:
+        raise ValueError(f"DATEDIFF espera 3 argumentos: {args}")
+    return args[0].strip().strip("'").lower(), args[1], args[2]
+
+
+class SqliteDialect(SqlDialect):
+    name = "sqlite"
+    isolation_level = None
+
+    def year(self, expr: str) -> str:
+        return f"CAST(strftime('%Y', {expr}) AS INTEGER)"
+
+    def month(self, expr: str) -> str:
+        return f"CAST(strftime('%m', {expr}) AS INTEGER)"
+
+    def quote_alias(self, alias: str) -> str:
+        return '"' + alias.replace('"', '""') + '"'
+
+    def limit_clause(self, limit: int, order_by: str = "1") -> str:
+        return f" ORDER BY {order_by} LIMIT {int(limit)}"
+
+    def session_statements(self, timeout_seconds: int) -> List[str]:
+        return [f"PRAGMA busy_timeout = {int(timeout_seconds) * 1000}"]
+
+    def _datediff(self, args: List[str]) -> str:
+        unit, start, end = _datediff_args(args)
+        if unit in ("day", "dd", "d"):
+            return f"CAST(julianday(date({end})) - julianday(date({start})) AS INTEGER)"
+        if unit in ("month", "mm", "m"):
+            return (
+                f"((CAST(strftime('%Y', {end}) AS INTEGER) - CAST(strftime('%Y', {start}) AS INTEGER)) * 12"
+                f" + CAST(strftime('%m', {end}) AS INTEGER) - CAST(strftime('%m', {start}) AS INTEGER))"
+            )
+        if unit in ("year", "yy", "yyyy"):
+            return f"(CAST(strftime('%Y', {end}) AS INTEGER) - CAST(strftime('%Y', {start}) AS INTEGER))"
+        raise ValueError(f"DATEDIFF({unit}, ...) no soportado en SQLite")
+
+    def _rewriters(self) -> Dict[str, CallRewriter]:
+        return {
+            "YEAR": lambda a: self.year(a[0]),
+            "MONTH": lambda a: self.month(a[0]),
+            "DAY": lambda a: f"CAST(strftime('%d', {a[0]}) AS INTEGER)",
+            "GETDATE": lambda a: "datetime('now', 'localtime')",
+            "DATEDIFF": self._datediff,
+            "ISNULL": lambda a: f"IFNULL({', '.join(a)})",
+            "LEN": lambda a: f"LENGTH({a[0]})",
+        }
+
+
+class DuckDbDialect(SqlDialect):
+    name = "duckdb"
+    isolation_level = None
+
+    def quote_alias(self, alias: str) -> str:
+        return '"' + alias.replace('"', '""') + '"'
+
+    def limit_clause(self, limit: int, order_by: str = "1") -> str:
+        return f" ORDER BY {order_by} LIMIT {int(limit)}"
+
+    def session_statements(self, timeout_seconds: int) -> List[str]:
+        return []
+
+    def _datediff(self, args: List[str]) -> str:
+        unit, start, end = _datediff_args(args)
+        unit = {"dd": "day", "d": "day", "mm": "month", "m": "month", "yy": "year", "yyyy": "year"}.get(unit, unit)
+        return f"date_diff('{unit}', CAST({start} AS DATE), CAST({end} AS DATE))"
+
+    def _rewriters(self) -> Dict[str, CallRewriter]:
+        return {
+            "GETDATE": lambda a: "current_timestamp",
+            "DATEDIFF": self._datediff,
+            "ISNULL": lambda a: f"COALESCE({', '.join(a)})",
+            "LEN": lambda a: f"LENGTH({a[0]})",
+        }
+
+
+SQL_SERVER = SqlServerDialect()
+SQLITE = SqliteDialect()
+DUCKDB = DuckDbDialect()
+
+_DIALECTS = {d.name: d for d in (SQL_SERVER, SQLITE, DUCKDB)}
+# engine.dialect.name de SQLAlchemy → dialecto
+_ENGINE_NAMES = {"mssql": SQL_SERVER, "sqlite": SQLITE, "duckdb": DUCKDB}
+
+
+def get_sql_dialect(name: Optional[str]) -> SqlDialect:
+    """Dialecto por nombre ("mssql" | "sqlite" | "duckdb"); None → SQL Server."""
+    if not name:
+        return SQL_SERVER
+    dialect = _DIALECTS.get(name.lower())
+    if dialect is None:
+        raise ValueError(f"Dialecto SQL desconocido: '{name}' (opciones: {', '.join(sorted(_DIALECTS))})")
+    return dialect
+
+
+def dialect_for_engine(engine) -> SqlDialect:
+    """Dialecto que corresponde a un engine de SQLAlchemy (por engine.dialect.name)."""
+    name = getattr(getattr(engine, "dialect", None), "name", None)
+    dialect = _ENGINE_NAMES.get(name)
+    if dialect is None:
+        raise ValueError(f"No hay dialecto SQL para el engine '{name}'")
+    return dialect
@@ -0,0 +1,66 @@
+"""
+Query parametrizada: plantilla SQL con parámetros con nombre (:p0, :p1, ...) y sus valores.
+
+SmartQueryBuilder ya no incrusta años, fechas ni valores de filtro como literales:
+la misma forma de query produce el mismo texto para cualquier periodo, filtro o
+tenant, y SQL Server reutiliza el plan compilado (sp_prepexec vía pyodbc) en vez de
+compilar uno por combinación. db_helper la ejecuta con text(query.text) y los
+parámetros enlazados; los str van como VARCHAR (ver db_helper._statement) para no
+forzar conversiones implícitas sobre columnas varchar indexadas.
+
+Es inmutable y hasheable (plantilla + parámetros), así DataManager la usa igual que
+antes el texto SQL: como clave de planes, resultados, cachés y snapshots.
+"""
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, Tuple, Union
+
+
+class QueryParams(dict):
+    """Acumula parámetros en orden de aparición; bind() devuelve el marcador."""
+
+    def bind(self, value: Any) -> str:
+        name = f"p{len(self)}"
+        self[name] = value
+        return f":{name}"
+
+
+@dataclass(frozen=True)
+class SqlQuery:
+    text: str
+    params: Tuple[Tuple[str, Any], ...] = ()
+
+    @classmethod
+    def build(cls, text: str, params: Dict[str, Any]) -> "SqlQuery":
+        return cls(text, tuple(params.items()))
+
+    @property
+    def bound(self) -> Dict[str, Any]:
+        return dict(self.params)
+
+    def append(self, suffix: str) -> "SqlQuery":
+        """Misma query con texto agregado al final (ORDER BY / OFFSET ...)."""
+        return SqlQuery(self.text.rstrip() + suffix, self.params)
+
+    def cache_text(self) -> str:
+        """Plantilla + parámetros en forma estable, para derivar claves de caché."""
+        if not self.params:
+            return self.text
+        return self.text + "\n-- " + json.dumps(self.params, default=str)
+
+    def __str__(self) -> str:
+        return self.text
+
+
+Query = Union[str, SqlQuery]
+
+
+def query_cache_text(query: Query) -> str:
+    return query.cache_text() if isinstance(query, SqlQuery) else query
+
+
+def split_query(query: Query) -> Tuple[str, Dict[str, Any]]:
+    """(texto, parámetros) para ejecutar tanto SqlQuery como SQL plano."""
+    if isinstance(query, SqlQuery):
+        return query.text, query.bound
+    return query, {}
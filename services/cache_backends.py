@@ -0,0 +1,640 @@
+"""
+Backends de caché para DataManager (caché de pantallas y de resultados SQL).
+
+Todos exponen la misma interfaz tipo dict sobre CacheEntry, más TTL por entrada:
+
+    backend[key] = CacheEntry(data, ts)          # TTL por defecto del backend
+    backend.set(key, entry, ttl=300)             # TTL explícito (None = sin expiración)
+    entry = backend.get(key)                     # None si no existe o ya expiró
+
+Implementaciones:
+    - InProcessCacheBackend: LRU en memoria del proceso.
+    - SQLiteCacheBackend: archivo SQLite (WAL + mmap) compartido por todos los
+      workers de gunicorn en el mismo host.
+    - RedisCacheBackend: cualquier servidor con protocolo Redis (redis-server,
+      KeyDB, Dragonfly o un stand-in local); el cliente puede inyectarse.
+
+Selección con CACHE_BACKEND=memory|sqlite|redis (ver create_cache_backend).
+
+Memoria y SQLite son LRU acotados por bytes aproximados (tamaño serializado),
+con un sub-presupuesto por tenant: el prefijo de la clave antes de "::" es el
+fingerprint de la BD, así un cliente grande sólo desaloja sus propias entradas.
+En Redis el tope lo pone el servidor (maxmemory + allkeys-lru).
+
+SQLite y Redis guardan las entradas como pickle firmado con HMAC-SHA256 (clave
+derivada de SECRET_KEY): una entrada sin firma válida se trata como miss y nunca
+se deserializa, así quien pueda escribir en el archivo o en el servidor no ejecuta
+código en los workers sin conocer SECRET_KEY.
+"""
+import hashlib
+import hmac
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from config import Config
+from dashboard_core.result_set import ResultSet
+
+Json = Union[Dict[str, Any], List[Any]]
+
+
+@dataclass
+class CacheEntry:
+    data: Json
+    ts: float
+
+
+# Payloads mayores a este tamaño se comprimen antes de guardarse
+_COMPRESS_MIN_BYTES = 4096
+_RAW = b"\x00"
+_ZLIB = b"\x01"
+
+
+_SIGNATURE_BYTES = 32
+_signing_key: Optional[bytes] = None
+
+
+def _signature(body: bytes) -> bytes:
+    global _signing_key
+    if _signing_key is None:
+        _signing_key = hashlib.sha256(b"analitica-cache\x00" + Config.SECRET_KEY.encode("utf-8")).digest()
+    return hmac.new(_signing_key, body, hashlib.sha256).digest()
+
+
+def signing_key_configured() -> bool:
+    """False con la SECRET_KEY de desarrollo (pública en config.py): sus firmas no
+    protegen un almacén compartido."""
+    return bool(Config.SECRET_KEY) and Config.SECRET_KEY != Config.DEFAULT_SECRET_KEY
+
+
+def serialize_entry(entry: CacheEntry) -> bytes:
+    """Firma HMAC + pickle (conserva Decimal/datetime de las filas) + zlib para payloads grandes."""
+    raw = pickle.dumps((entry.ts, entry.data), protocol=pickle.HIGHEST_PROTOCOL)
+    body = _ZLIB + zlib.compress(raw, 1) if len(raw) >= _COMPRESS_MIN_BYTES else _RAW + raw
+    return _signature(body) + body
+
+
+def deserialize_entry(blob: bytes) -> Optional[CacheEntry]:
+    """None si la firma no corresponde (entrada ajena, alterada o de otra SECRET_KEY)."""
+    signature, body = bytes(blob[:_SIGNATURE_BYTES]), bytes(blob[_SIGNATURE_BYTES:])
+    if not body or not hmac.compare_digest(signature, _signature(body)):
+        print("⚠️ CacheBackend: entrada con firma inválida, se descarta sin deserializar")
+        return None
+    raw = zlib.decompress(body[1:]) if body[:1] == _ZLIB else body[1:]
+    ts, data = pickle.loads(raw)
+    return CacheEntry(data=data, ts=ts)
+
+
+def approx_entry_bytes(entry: CacheEntry) -> int:
+    """Tamaño aproximado en memoria: el pickle sin comprimir es proporcional a las
+    filas guardadas y mucho más barato que recorrer los objetos con sys.getsizeof.
+    Un ResultSet ya conoce su tamaño columnar (el pickle de sus arreglos lo sobrestima)."""
+    if isinstance(entry.data, ResultSet):
+        return entry.data.nbytes + 64
+    try:
+        return len(pickle.dumps(entry.data, protocol=pickle.HIGHEST_PROTOCOL)) + 64
+    except Exception:
+        return 1024
+
+
+def tenant_of(key: str) -> str:
+    # Las claves de DataManager empiezan con el fingerprint de la BD ("<fp>::...")
+    return key.split("::", 1)[0]
+
+
+class CacheBackend:
+    """Interfaz común. Las subclases implementan get/set/pop/scan/clear/__len__."""
+
+    name = "base"
+
+    def __init__(
+        self,
+        namespace: str,
+        default_ttl: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        tenant_max_bytes: Optional[int] = None,
+    ):
+        self.namespace = namespace
+        self.default_ttl = default_ttl
+        self.max_bytes = max_bytes
+        # Sub-presupuesto por tenant; por defecto una fracción del total
+        if tenant_max_bytes is None and max_bytes:
+            tenant_max_bytes = int(max_bytes * Config.CACHE_TENANT_MAX_FRACTION)
+        self.tenant_max_bytes = tenant_max_bytes
+        self.counters: Dict[str, int] = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "rejected": 0}
+
+    def get(self, key: str, default: Any = None) -> Optional[CacheEntry]:
+        raise NotImplementedError
+
+    def set(self, key: str, entry: CacheEntry, ttl: Optional[int] = None) -> None:
+        raise NotImplementedError
+
+    def peek(self, key: str) -> Optional[CacheEntry]:
+        """Como get() pero sin contar hit/miss ni actualizar el orden LRU (inspección)."""
+        raise NotImplementedError
+
+    def pop(self, key: str, default: Any = None) -> Optional[CacheEntry]:
+        raise NotImplementedError
+
+    def scan(self, suffix: str = "") -> Iterator[Tuple[str, CacheEntry]]:
+        """Entradas vigentes cuya clave termina en `suffix`."""
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def prune_expired(self) -> int:
+        """Elimina entradas expiradas; devuelve cuántas se borraron."""
+        return 0
+
+    def usage(self) -> Tuple[int, Dict[str, int]]:
+        """(bytes totales, bytes por tenant) según el backend; -1 si no se conoce."""
+        return -1, {}
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de este proceso + ocupación actual del backend."""
+        total_bytes, tenant_bytes = self.usage()
+        stats: Dict[str, Any] = dict(self.counters)
+        lookups = stats["hits"] + stats["misses"]
+        stats.update({
+            "backend": self.name,
+            "namespace": self.namespace,
+            "hit_ratio": round(stats["hits"] / lookups, 4) if lookups else 0.0,
+            "entries": len(self),
+            "bytes": total_bytes,
+            "max_bytes": self.max_bytes,
+            "tenant_max_bytes": self.tenant_max_bytes,
+            "tenants": tenant_bytes,
+        })
+        return stats
+
+    def _count(self, counter: str, n: int = 1) -> None:
+        self.counters[counter] += n
+
+    def _expires_at(self, ttl: Optional[int]) -> Optional[float]:
+        ttl = self.default_ttl if ttl is None else ttl
+        return time.time() + ttl if ttl else None
+
+    # --- Azúcar tipo dict ---
+    def __getitem__(self, key: str) -> CacheEntry:
+        entry = self.get(key)
+        if entry is None:
+            raise KeyError(key)
+        return entry
+
+    def __setitem__(self, key: str, entry: CacheEntry) -> None:
+        self.set(key, entry)
+
+    def __delitem__(self, key: str) -> None:
+        self.pop(key)
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def items(self) -> Iterator[Tuple[str, CacheEntry]]:
+        return self.scan()
+
+    def keys(self) -> List[str]:
+        return [k for k, _ in self.scan()]
+
+
+class InProcessCacheBackend(CacheBackend):
+    """
+    LRU del proceso; los objetos se guardan sin serializar. Cada tenant tiene su
+    propio OrderedDict (orden de uso), así el desalojo por sub-presupuesto es O(1)
+    y el desalojo global toma la entrada menos reciente entre las cabezas de cada tenant.
+    """
+
+    name = "memory"
+
+    def __init__(self, namespace: str, default_ttl: Optional[int] = None, **budget: Any):
+        super().__init__(namespace, default_ttl, **budget)
+        # tenant -> OrderedDict[key, (entry, expires_at, size, last_access)]
+        self._tenants: Dict[str, "OrderedDict[str, Tuple[CacheEntry, Optional[float], int, float]]"] = {}
+        self._tenant_bytes: Dict[str, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _remove(self, tenant: str, key: str) -> None:
+        items = self._tenants.get(tenant)
+        if not items or key not in items:
+            return
+        _, _, size, _ = items.pop(key)
+        self._bytes -= size
+        self._tenant_bytes[tenant] -= size
+        if not items:
+            del self._tenants[tenant]
+            del self._tenant_bytes[tenant]
+
+    def _evict_lru(self, tenant: Optional[str] = None) -> None:
+        if tenant is None:
+            # Global: la entrada con el último acceso más antiguo entre todos los tenants
+            tenant = min(self._tenants, key=lambda t: next(iter(self._tenants[t].values()))[3])
+        oldest_key = next(iter(self._tenants[tenant]))
+        self._remove(tenant, oldest_key)
+        self._count("evictions")
+
+    def get(self, key: str, default: Any = None) -> Optional[CacheEntry]:
+        tenant = tenant_of(key)
+        with self._lock:
+            items = self._tenants.get(tenant)
+            item = items.get(key) if items else None
+            if item is None:
+                self._count("misses")
+                return default
+            entry, expires_at, size, _ = item
+            if expires_at is not None and expires_at <= time.time():
+                self._remove(tenant, key)
+                self._count("expirations")
+                self._count("misses")
+                return default
+            items[key] = (entry, expires_at, size, time.time())
+            items.move_to_end(key)
+            self._count("hits")
+            return entry
+
+    def peek(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            item = self._tenants.get(tenant_of(key), {}).get(key)
+        if item is None or (item[1] is not None and item[1] <= time.time()):
+            return None
+        return item[0]
+
+    def set(self, key: str, entry: CacheEntry, ttl: Optional[int] = None) -> None:
+        tenant = tenant_of(key)
+        size = approx_entry_bytes(entry) if (self.max_bytes or self.tenant_max_bytes) else 0
+        with self._lock:
+            self._remove(tenant, key)
+            if (self.tenant_max_bytes and size > self.tenant_max_bytes) or (self.max_bytes and size > self.max_bytes):
+                # Un resultado más grande que el presupuesto vaciaría la caché sin servir de nada
+                self._count("rejected")
+                return
+            self._tenants.setdefault(tenant, OrderedDict())[key] = (entry, self._expires_at(ttl), size, time.time())
+            self._tenant_bytes[tenant] = self._tenant_bytes.get(tenant, 0) + size
+            self._bytes += size
+            while self.tenant_max_bytes and self._tenant_bytes.get(tenant, 0) > self.tenant_max_bytes:
+                self._evict_lru(tenant)
+            while self.max_bytes and self._bytes > self.max_bytes:
+                self._evict_lru()
+
+    def pop(self, key: str, default: Any = None) -> Optional[CacheEntry]:
+        tenant = tenant_of(key)
+        with self._lock:
+            item = self._tenants.get(tenant, {}).get(key)
+            self._remove(tenant, key)
+        return item[0] if item else default
+
+    def scan(self, suffix: str = "") -> Iterator[Tuple[str, CacheEntry]]:
+        now = time.time()
+        with self._lock:
+            snapshot = [(k, item) for items in self._tenants.values() for k, item in items.items()]
+        for key, (entry, expires_at, _, _) in snapshot:
+            if key.endswith(suffix) and (expires_at is None or expires_at > now):
+                yield key, entry
+
+    def clear(self) -> None:
+        with self._lock:
+            self._tenants.clear()
+            self._tenant_bytes.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return sum(len(items) for items in self._tenants.values())
+
+    def prune_expired(self) -> int:
+        now = time.time()
+        with self._lock:
+            expired = [
+                (tenant, k) for tenant, items in self._tenants.items()
+                for k, (_, exp, _, _) in items.items() if exp is not None and exp <= now
+            ]
+            for tenant, k in expired:
+                self._remove(tenant, k)
+            self._count("expirations", len(expired))
+        return len(expired)
+
+    def usage(self) -> Tuple[int, Dict[str, int]]:
+        with self._lock:
+            return self._bytes, dict(self._tenant_bytes)
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    Archivo SQLite compartido por los workers del host. WAL permite lectores
+    concurrentes con un escritor; mmap_size hace que las lecturas sean páginas
+    mapeadas en memoria en lugar de read() por bloque. El presupuesto de bytes
+    se aplica sobre el payload guardado, desalojando por last_access.
+    """
+
+    name = "sqlite"
+
+    # Resolución con la que se actualiza last_access en lecturas (evita un UPDATE por hit)
+    _TOUCH_SECONDS = 5.0
+
+    def __init__(self, namespace: str, default_ttl: Optional[int] = None, path: Optional[str] = None, **budget: Any):
+        super().__init__(namespace, default_ttl, **budget)
+        # Ruta explícita en un directorio de la app: un archivo en /tmp lo puede plantar cualquiera
+        self.path = path or Config.CACHE_SQLITE_PATH
+        if not self.path:
+            raise ValueError("CACHE_BACKEND=sqlite requiere CACHE_SQLITE_PATH (un directorio propio de la app)")
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), mode=0o700, exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            " namespace TEXT NOT NULL, key TEXT NOT NULL, expires_at REAL, payload BLOB NOT NULL,"
+            " PRIMARY KEY (namespace, key))"
+        )
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(cache_entries)")}
+        for column, ddl in (("tenant", "TEXT NOT NULL DEFAULT ''"), ("size", "INTEGER NOT NULL DEFAULT 0"),
+                            ("last_access", "REAL NOT NULL DEFAULT 0")):
+            if column not in existing:
+                conn.execute(f"ALTER TABLE cache_entries ADD COLUMN {column} {ddl}")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_entries_exp ON cache_entries (expires_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_cache_entries_lru ON cache_entries (namespace, tenant, last_access)")
+
+    def _conn(self) -> sqlite3.Connection:
+        # sqlite3.Connection no se comparte entre hilos: una por hilo
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA mmap_size={Config.CACHE_SQLITE_MMAP_BYTES}")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str, default: Any = None) -> Optional[CacheEntry]:
+        now = time.time()
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT payload, expires_at, last_access FROM cache_entries WHERE namespace = ? AND key = ?",
+            (self.namespace, key),
+        ).fetchone()
+        if row is None:
+            self._count("misses")
+            return default
+        payload, expires_at, last_access = row
+        if expires_at is not None and expires_at <= now:
+            conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key))
+            self._count("expirations")
+            self._count("misses")
+            return default
+        entry = deserialize_entry(payload)
+        if entry is None:
+            conn.execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key))
+            self._count("misses")
+            return default
+        if now - last_access > self._TOUCH_SECONDS:
+            conn.execute(
+                "UPDATE cache_entries SET last_access = ? WHERE namespace = ? AND key = ?", (now, self.namespace, key)
+            )
+        self._count("hits")
+        return entry
+
+    def peek(self, key: str) -> Optional[CacheEntry]:
+        row = self._conn().execute(
+            "SELECT payload, expires_at FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return None
+        return deserialize_entry(row[0])
+
+    def set(self, key: str, entry: CacheEntry, ttl: Optional[int] = None) -> None:
+        blob = serialize_entry(entry)
+        tenant = tenant_of(key)
+        if (self.tenant_max_bytes and len(blob) > self.tenant_max_bytes) or (self.max_bytes and len(blob) > self.max_bytes):
+            self._count("rejected")
+            self.pop(key)
+            return
+        conn = self._conn()
+        conn.execute(
+            "INSERT OR REPLACE INTO cache_entries (namespace, key, tenant, size, last_access, expires_at, payload)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (self.namespace, key, tenant, len(blob), time.time(), self._expires_at(ttl), sqlite3.Binary(blob)),
+        )
+        if self.tenant_max_bytes:
+            self._evict_over_budget(conn, self.tenant_max_bytes, tenant)
+        if self.max_bytes:
+            self._evict_over_budget(conn, self.max_bytes)
+
+    def _evict_over_budget(self, conn: sqlite3.Connection, budget: int, tenant: Optional[str] = None) -> None:
+        scope_sql = "namespace = ?" + (" AND tenant = ?" if tenant is not None else "")
+        scope = (self.namespace,) + ((tenant,) if tenant is not None else ())
+        used = conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM cache_entries WHERE {scope_sql}", scope).fetchone()[0]
+        if used <= budget:
+            return
+        victims = []
+        for key, size in conn.execute(
+            f"SELECT key, size FROM cache_entries WHERE {scope_sql} ORDER BY last_access", scope
+        ):
+            if used <= budget:
+                break
+            victims.append((self.namespace, key))
+            used -= size
+        conn.executemany("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", victims)
+        self._count("evictions", len(victims))
+
+    def pop(self, key: str, default: Any = None) -> Optional[CacheEntry]:
+        row = self._conn().execute(
+            "SELECT payload FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key)
+        ).fetchone()
+        self._conn().execute("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key))
+        entry = deserialize_entry(row[0]) if row else None
+        return default if entry is None else entry
+
+    def scan(self, suffix: str = "") -> Iterator[Tuple[str, CacheEntry]]:
+        pattern = "%" + suffix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        rows = self._conn().execute(
+            "SELECT key, payload FROM cache_entries WHERE namespace = ? AND key LIKE ? ESCAPE '\\'"
+            " AND (expires_at IS NULL OR expires_at > ?)",
+            (self.namespace, pattern, time.time()),
+        ).fetchall()
+        for key, payload in rows:
+            if key.endswith(suffix):  # LIKE no distingue mayúsculas en ASCII
+                entry = deserialize_entry(payload)
+                if entry is not None:
+                    yield key, entry
+
+    def clear(self) -> None:
+        self._conn().execute("DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,))
+
+    def __len__(self) -> int:
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM cache_entries WHERE namespace = ?", (self.namespace,)
+        ).fetchone()[0]
+
+    def prune_expired(self) -> int:
+        cur = self._conn().execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND expires_at IS NOT NULL AND expires_at <= ?",
+            (self.namespace, time.time()),
+        )
+        removed = cur.rowcount or 0
+        self._count("expirations", removed)
+        return removed
+
+    def usage(self) -> Tuple[int, Dict[str, int]]:
+        rows = self._conn().execute(
+            "SELECT tenant, SUM(size) FROM cache_entries WHERE namespace = ? GROUP BY tenant", (self.namespace,)
+        ).fetchall()
+        tenants = {tenant: int(size or 0) for tenant, size in rows}
+        return sum(tenants.values()), tenants
+
+
+class RedisUnavailableError(RuntimeError):
+    """CACHE_BACKEND=redis sin el paquete redis instalado: error de configuración."""
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Protocolo Redis. Sólo usa GET/SET PX/DEL/SCAN, así que funciona contra
+    redis-server o cualquier stand-in compatible (p. ej. fakeredis en local):
+    basta con pasar `client`. El TTL lo aplica el servidor.
+    """
+
+    name = "redis"
+
+    def __init__(
+        self, namespace: str, default_ttl: Optional[int] = None, url: Optional[str] = None, client: Any = None, **budget: Any
+    ):
+        super().__init__(namespace, default_ttl, **budget)
+        try:
+            import redis  # sólo se requiere con CACHE_BACKEND=redis (ver requirements.txt)
+        except ImportError as e:
+            if client is None:
+                raise RedisUnavailableError("CACHE_BACKEND=redis requiere el paquete 'redis' (pip install redis)") from e
+            redis = None
+        if client is None:
+            client = redis.Redis.from_url(url or Config.CACHE_REDIS_URL)
+        # Errores de red / servidor que degradan a "sin caché" en lugar de romper la pantalla
+        self._errors: Tuple[type, ...] = (
+            (redis.exceptions.RedisError,) if redis is not None else (ConnectionError, TimeoutError, OSError)
+        )
+        self._last_error_log = 0.0
+        self.counters["errors"] = 0
+        self.client = client
+        self._prefix = f"analitica:{namespace}:"
+
+    # Un error de Redis se reporta a lo más una vez por este intervalo
+    _ERROR_LOG_SECONDS = 60.0
+
+    def _unavailable(self, op: str, exc: Exception) -> None:
+        """Redis caído después del arranque: la lectura cuenta como miss y la escritura se
+        omite (la pantalla sigue saliendo de SQL Server); el aviso se limita por tiempo."""
+        self._count("errors")
+        now = time.time()
+        if now - self._last_error_log >= self._ERROR_LOG_SECONDS:
+            self._last_error_log = now
+            print(f"⚠️ CacheBackend redis [{self.namespace}]: {op} falló ({exc}); se omite la caché")
+
+    def _read(self, key: str) -> Optional[bytes]:
+        try:
+            return self.client.get(self._prefix + key)
+        except self._errors as e:
+            self._unavailable("GET", e)
+            return None
+
+    def get(self, key: str, default: Any = None) -> Optional[CacheEntry]:
+        blob = self._read(key)
+        entry = deserialize_entry(blob) if blob else None
+        self._count("hits" if entry is not None else "misses")
+        return default if entry is None else entry
+
+    def peek(self, key: str) -> Optional[CacheEntry]:
+        blob = self._read(key)
+        return deserialize_entry(blob) if blob else None
+
+    def set(self, key: str, entry: CacheEntry, ttl: Optional[int] = None) -> None:
+        ttl = self.default_ttl if ttl is None else ttl
+        try:
+            self.client.set(self._prefix + key, serialize_entry(entry), px=int(ttl * 1000) if ttl else None)
+        except self._errors as e:
+            self._unavailable("SET", e)
+
+    def pop(self, key: str, default: Any = None) -> Optional[CacheEntry]:
+        blob = self._read(key)
+        try:
+            self.client.delete(self._prefix + key)
+        except self._errors as e:
+            self._unavailable("DEL", e)
+        entry = deserialize_entry(blob) if blob else None
+        return default if entry is None else entry
+
+    @staticmethod
+    def _glob_escape(text: str) -> str:
+        return "".join("\\" + c if c in "*?[]\\" else c for c in text)
+
+    def scan(self, suffix: str = "") -> Iterator[Tuple[str, CacheEntry]]:
+        match = self._glob_escape(self._prefix) + "*" + self._glob_escape(suffix)
+        try:
+            for raw_key in self.client.scan_iter(match=match):
+                full_key = raw_key.decode("utf-8") if isinstance(raw_key, bytes) else raw_key
+                blob = self.client.get(full_key)
+                entry = deserialize_entry(blob) if blob else None
+                if entry is not None:
+                    yield full_key[len(self._prefix):], entry
+        except self._errors as e:
+            self._unavailable("SCAN", e)
+
+    def clear(self) -> None:
+        try:
+            keys = list(self.client.scan_iter(match=self._glob_escape(self._prefix) + "*"))
+            if keys:
+                self.client.delete(*keys)
+        except self._errors as e:
+            self._unavailable("CLEAR", e)
+
+    def __len__(self) -> int:
+        try:
+            return sum(1 for _ in self.client.scan_iter(match=self._glob_escape(self._prefix) + "*"))
+        except self._errors as e:
+            self._unavailable("SCAN", e)
+            return 0
+
+
+_BACKENDS = {
+    InProcessCacheBackend.name: InProcessCacheBackend,
+    SQLiteCacheBackend.name: SQLiteCacheBackend,
+    RedisCacheBackend.name: RedisCacheBackend,
+}
+
+
+def create_cache_backend(
+    namespace: str,
+    default_ttl: Optional[int] = None,
+    kind: Optional[str] = None,
+    max_bytes: Optional[int] = None,
+    tenant_max_bytes: Optional[int] = None,
+) -> CacheBackend:
+    """Crea el backend configurado en CACHE_BACKEND. Sin SECRET_KEY propia, sin
+    CACHE_SQLITE_PATH o si el servidor / archivo no responden cae a memoria; si falta
+    el paquete redis falla (RedisUnavailableError)."""
+    kind = (kind or Config.CACHE_BACKEND or "memory").lower()
+    budget = {"max_bytes": max_bytes, "tenant_max_bytes": tenant_max_bytes}
+    backend_cls = _BACKENDS.get(kind)
+    if backend_cls is None:
+        print(f"⚠️ CacheBackend: tipo desconocido '{kind}', usando memoria")
+        return InProcessCacheBackend(namespace, default_ttl, **budget)
+    if backend_cls is not InProcessCacheBackend and not signing_key_configured():
+        # Firmas con una clave pública no protegen nada: no se deserializa de un almacén compartido
+        print(f"⚠️ CacheBackend: '{kind}' requiere una SECRET_KEY propia (no la de desarrollo), usando memoria")
+        return InProcessCacheBackend(namespace, default_ttl, **budget)
+    try:
+        backend = backend_cls(namespace, default_ttl, **budget)
+        if isinstance(backend, RedisCacheBackend):
+            backend.client.ping()
+        return backend
+    except RedisUnavailableError:
+        raise
+    except Exception as e:
+        print(f"⚠️ CacheBackend: no se pudo iniciar '{kind}' ({e}), usando memoria")
+        return InProcessCacheBackend(namespace, default_ttl, **budget)
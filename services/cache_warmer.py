@@ -0,0 +1,193 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from config import Config
+from services.data_manager import DataManager, data_manager
+
+
+class CacheWarmer:
+    """
+    Pre-calienta en segundo plano la vista por defecto (periodo actual) de cada pantalla
+    para los tenants activos, de modo que el primer usuario de la mañana no espere a la BD.
+
+    Corre en un hilo daemon con su propio event loop, una pantalla a la vez y con tope
+    de concurrencia bajo; cede el paso mientras haya queries interactivas en vuelo.
+    Con varios workers de gunicorn sólo corre en uno (el que toma el lock de archivo
+    LOCK_FILE). Con CACHE_BACKEND=sqlite/redis la actividad de tenants y las pantallas
+    calientes se comparten entre workers; con memoria el warmer sólo ve los tenants que
+    atendió su propio worker y sólo ese worker aprovecha lo que calienta.
+    """
+
+    LOCK_FILE = os.path.join(tempfile.gettempdir(), "analitica_cache_warmer.lock")
+
+    YIELD_POLL_SECONDS = 0.5
+    YIELD_MAX_WAIT_SECONDS = 30.0
+
+    def __init__(
+        self,
+        manager: DataManager,
+        *,
+        interval_seconds: int,
+        active_seconds: int,
+        max_concurrency: int,
+    ) -> None:
+        self.manager = manager
+        self.interval_seconds = max(30, interval_seconds)
+        self.active_seconds = active_seconds
+        self.max_concurrency = max(1, max_concurrency)
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._cycles = 0
+        self._current: Optional[Dict[str, Any]] = None
+        self._last_cycle: Optional[Dict[str, Any]] = None
+        self._tenants: Dict[str, Dict[str, Any]] = {}
+        self._recent: Deque[Dict[str, Any]] = deque(maxlen=50)
+        self._lock_file = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _acquire_leader_lock(self) -> bool:
+        """Lock exclusivo de archivo: lo conserva el proceso mientras viva."""
+        if self._lock_file is not None:
+            return True
+        try:
+            import fcntl
+        except ImportError:  # Windows (desarrollo local, un solo proceso)
+            return True
+        handle = open(self.LOCK_FILE, "a")
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            handle.close()
+            return False
+        self._lock_file = handle
+        return True
+
+    def start(self) -> None:
+        if self.running:
+            return
+        if not self._acquire_leader_lock():
+            print(f"🔥 CacheWarmer: otro worker ya pre-calienta (pid {os.getpid()} no lo inicia)")
+            return
+        if (Config.CACHE_BACKEND or "memory").lower() == "memory":
+            print("⚠️ CacheWarmer: CACHE_BACKEND=memory, sólo se calienta la caché de este worker")
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="cache-warmer", daemon=True)
+        self._thread.start()
+        print(f"🔥 CacheWarmer: iniciado (cada {self.interval_seconds}s, concurrencia {self.max_concurrency})")
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            # Primer ciclo tras un intervalo corto: da tiempo a que las páginas registren sus filtros
+            while not self._stop.wait(min(60, self.interval_seconds) if self._cycles == 0 else self.interval_seconds):
+                try:
+                    loop.run_until_complete(self.run_cycle())
+                except Exception as e:
+                    print(f"⚠️ CacheWarmer: error en ciclo de pre-calentamiento — {e}")
+        finally:
+            loop.close()
+
+    async def _yield_to_interactive(self) -> None:
+        # Las queries del warmer sólo están en vuelo durante su propia pantalla,
+        # así que entre pantallas cualquier query en vuelo es de un usuario
+        waited = 0.0
+        while self.manager.get_query_stats()["inflight"] > 0 and waited < self.YIELD_MAX_WAIT_SECONDS:
+            await asyncio.sleep(self.YIELD_POLL_SECONDS)
+            waited += self.YIELD_POLL_SECONDS
+
+    async def run_cycle(self) -> Dict[str, Any]:
+        """Un recorrido completo: cada tenant activo × cada pantalla del SCREEN_MAP."""
+        tenants = self.manager.active_tenants(self.active_seconds)
+        jobs = [
+            (tenant, screen_id)
+            for tenant in tenants
+            for screen_id in self.manager.get_screen_map(tenant)
+        ]
+        summary: Dict[str, Any] = {
+            "started_at": time.time(),
+            "tenants": len(tenants),
+            "screens_total": len(jobs),
+            "warmed": 0, "fresh": 0, "skipped": 0, "failed": 0,
+            "executed": 0, "cache_hits": 0, "coalesced": 0, "rows": 0, "db_seconds": 0.0,
+        }
+        for done, (tenant, screen_id) in enumerate(jobs):
+            if self._stop.is_set():
+                break
+            with self._lock:
+                self._current = {"tenant": tenant, "screen": screen_id, "done": done, "total": len(jobs)}
+            await self._yield_to_interactive()
+            try:
+                result = await self.manager.warm_screen(
+                    screen_id, tenant,
+                    max_age_seconds=self.interval_seconds,
+                    max_concurrency=self.max_concurrency,
+                )
+            except Exception as e:
+                print(f"⚠️ CacheWarmer [{tenant}/{screen_id}]: {e}")
+                result = {"status": "failed", "error": str(e)}
+            self._record(summary, tenant, screen_id, result)
+
+        summary["finished_at"] = time.time()
+        summary["seconds"] = summary["finished_at"] - summary["started_at"]
+        with self._lock:
+            self._cycles += 1
+            self._current = None
+            self._last_cycle = summary
+        if summary["warmed"] or summary["failed"]:
+            print(
+                f"🔥 CacheWarmer: {summary['warmed']} pantallas calentadas, {summary['failed']} fallidas, "
+                f"{summary['executed']} queries en {summary['seconds']:.1f}s"
+            )
+        return summary
+
+    def _record(self, summary: Dict[str, Any], tenant: str, screen_id: str, result: Dict[str, Any]) -> None:
+        status = result.get("status", "skipped")
+        bucket = status if status in ("warmed", "fresh", "failed") else "skipped"
+        summary[bucket] += 1
+        for field in ("executed", "cache_hits", "coalesced", "rows", "db_seconds"):
+            summary[field] += result.get(field, 0)
+        with self._lock:
+            per_tenant = self._tenants.setdefault(tenant, {"warmed": 0, "failed": 0, "executed": 0, "seconds": 0.0})
+            if bucket in ("warmed", "failed"):
+                per_tenant[bucket] += 1
+            per_tenant["executed"] += result.get("executed", 0)
+            per_tenant["seconds"] += result.get("seconds", 0.0)
+            if bucket == "warmed":
+                per_tenant["last_warmed_at"] = time.time()
+                self._recent.append({"tenant": tenant, "screen": screen_id, "at": time.time(), **result})
+
+    def status(self) -> Dict[str, Any]:
+        """Progreso y costo del pre-calentamiento para el endpoint interno."""
+        with self._lock:
+            return {
+                "running": self.running,
+                "interval_seconds": self.interval_seconds,
+                "max_concurrency": self.max_concurrency,
+                "cycles": self._cycles,
+                "current": dict(self._current) if self._current else None,
+                "last_cycle": dict(self._last_cycle) if self._last_cycle else None,
+                "active_tenants": self.manager.active_tenants(self.active_seconds),
+                "tenants": {t: dict(v) for t, v in self._tenants.items()},
+                "recent": list(self._recent),
+            }
+
+
+cache_warmer = CacheWarmer(
+    data_manager,
+    interval_seconds=Config.CACHE_WARMER_INTERVAL_SECONDS,
+    active_seconds=Config.CACHE_WARMER_ACTIVE_SECONDS,
+    max_concurrency=Config.CACHE_WARMER_CONCURRENCY,
+)
@@ -1,35 +1,75 @@
 from decimal import Decimal
+import concurrent.futures
+from collections import OrderedDict
 import hashlib
 import json
 import re
+import threading
 import time
 import math
-from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Union, Callable
+from typing import Any, Dict, List, Optional, Tuple, Union, Callable
 
 from dash import no_update
-from flask import session
-
-from dashboard_core.query_builder import SmartQueryBuilder
-from dashboard_core.db_helper import execute_dynamic_query
+from flask import has_request_context, session
+
+from config import Config
+from dashboard_core.query_builder import SmartQueryBuilder, get_query_builder
+from services.cache_backends import CacheEntry, create_cache_backend
+from services.formula_engine import compile_formula, precompile_formulas
+from services.table_pipeline import TableBuilder
+from services.screen_cube import ScreenCube, period_index
+from services.screen_plan import ScreenPlan, compile_screen_plan
+from services.snapshot_store import SnapshotStore
+from dashboard_core.db_helper import QUERY_SLOTS, QuerySlotTimeout, execute_dynamic_query
+from dashboard_core.result_set import ResultSet
+from dashboard_core.sql_query import Query, query_cache_text, split_query
 from utils.helpers import format_value
 from dash import no_update, html
 from components.skeleton import get_skeleton
 import asyncio
+import contextlib
+import contextvars
 
 Json = Union[Dict[str, Any], List[Any]]
 PathList = List[Union[str, int]]
 
-@dataclass
-class CacheEntry:
-    data: Json
-    ts: float
+# Costo de las queries de una reconstrucción (lo fijan warm_screen y benchmarks/);
+# las tareas de asyncio.gather heredan el contexto, así que todas suman al mismo dict.
+# _compute_screen suma además los segundos por fase: plan, fetch (BD / cubos) y
+# transform (inyección en Python).
+_query_cost: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar("dm_query_cost", default=None)
+
+
+def _add_query_cost(field: str, amount: float = 1) -> None:
+    cost = _query_cost.get()
+    if cost is not None:
+        cost[field] = cost.get(field, 0) + amount
+
+
+@contextlib.contextmanager
+def track_query_cost():
+    """Entrega el dict donde se acumula el costo de lo que se reconstruya dentro del
+    bloque (también dentro de asyncio.run, que copia el contexto)."""
+    cost: Dict[str, float] = {}
+    token = _query_cost.set(cost)
+    try:
+        yield cost
+    finally:
+        _query_cost.reset(token)
+
+
+# Builder del tenant de la pantalla en construcción (lo fija _build_screen; ver DataManager.qb)
+_active_qb: contextvars.ContextVar[Optional[SmartQueryBuilder]] = contextvars.ContextVar("dm_query_builder", default=None)
 
 class DataManager:
     _instance: Optional["DataManager"] = None
     SCREEN_MAP: Dict[str, Dict[str, Any]] = {}
+    MONTH_NAMES = (
+        "enero", "febrero", "marzo", "abril", "mayo", "junio",
+        "julio", "agosto", "septiembre", "octubre", "noviembre", "diciembre"
+    )
     
     def __new__(cls) -> "DataManager":
         if cls._instance is None:
@@ -38,14 +78,69 @@ class DataManager:
         return cls._instance
     
     def _initialize(self) -> None:
-        self.qb = SmartQueryBuilder()
-        self.cache = {}
-        self.query_cache = {}
-        self._tenant_screen_cache: Dict[str, Dict[str, Any]] = {}
+        for bad in get_query_builder().join_index_report()["undefined_targets"]:
+            print(f"⚠️ DataManager: join '{bad['table']}.{bad['join']}' apunta a tabla no definida '{bad['target']}'")
         self.DEFAULT_TTL_SECONDS = 60
+        self.REVALIDATE_POLL_MS = 2000
+        # Backend configurable (CACHE_BACKEND); con sqlite/redis los workers comparten resultados
+        self.cache = create_cache_backend(
+            "screen", default_ttl=Config.CACHE_SCREEN_RETENTION_SECONDS, max_bytes=Config.CACHE_SCREEN_MAX_BYTES
+        )
+        self.query_cache = create_cache_backend(
+            "query", default_ttl=self.DEFAULT_TTL_SECONDS * 4, max_bytes=Config.CACHE_QUERY_MAX_BYTES
+        )
+        # Filas y duración de la última ejecución de cada query (explain_screen)
+        self.query_history = create_cache_backend(
+            "query_history", default_ttl=Config.QUERY_HISTORY_RETENTION_SECONDS, max_bytes=Config.QUERY_HISTORY_MAX_BYTES
+        )
+        # Último acceso por tenant (cache_warmer): en el backend para que el worker del
+        # pre-calentador vea también las sesiones atendidas por los demás workers
+        self.tenant_activity = create_cache_backend(
+            "tenant_activity", default_ttl=Config.CACHE_WARMER_ACTIVE_SECONDS
+        )
+        self._last_cache_prune = 0.0
+        self._table_builder = TableBuilder(self._clean_val, self._format_val)
+        # (tenant, pantalla) -> ScreenPlan compilado
+        self._screen_plans: Dict[Tuple[str, str], ScreenPlan] = {}
+        # Snapshots en disco de periodos cerrados (opcional, SNAPSHOT_STORE_ENABLED)
+        self.snapshots: Optional[SnapshotStore] = None
+        if Config.SNAPSHOT_STORE_ENABLED:
+            try:
+                self.snapshots = SnapshotStore()
+            except Exception as e:
+                print(f"⚠️ DataManager: no se pudo abrir el almacén de snapshots ({e}), se omite")
+        self._tenant_screen_cache: Dict[str, Dict[str, Any]] = {}
+        # Tope de queries simultáneas por tenant: lo aplica db_helper para todo el proceso
+        # (un semáforo por BD del tamaño del pool); aquí sólo se usa para estimar latencias
+        self.MAX_CONCURRENT_QUERIES_PER_TENANT = QUERY_SLOTS
+        # Single-flight: cada callback de Dash corre en su propio loop/hilo, así que
+        # las queries en vuelo se comparten con concurrent.futures (no asyncio.Future).
+        self._inflight_queries: Dict[str, concurrent.futures.Future] = {}
+        self._inflight_lock = threading.Lock()
+        # Stale-while-revalidate: refresh en segundo plano por clave de pantalla
+        self._revalidating: Dict[str, concurrent.futures.Future] = {}
+        self._revalidate_lock = threading.Lock()
+        self._bg_loop: Optional[asyncio.AbstractEventLoop] = None
+        self.query_stats: Dict[str, int] = {"executed": 0, "cache_hits": 0, "coalesced": 0}
+        # Última escritura de actividad por tenant en este proceso (limita las escrituras a
+        # tenant_activity) y filtros registrados por pantalla, usados por el pre-calentador
+        # de caché (services/cache_warmer.py)
+        self._tenant_activity: Dict[str, float] = {}
+        self._screen_filter_ids: Dict[str, List[str]] = {}
+        # Modo cubo: cubos ya construidos, ligados al ts de la entrada de caché de la que
+        # salen (con sqlite/redis cada get() deserializa un objeto nuevo)
+        self._cube_memo: "OrderedDict[str, Tuple[float, ScreenCube]]" = OrderedDict()
+        self._cube_memo_lock = threading.Lock()
+        self.CUBE_MEMO_SIZE = 32
         self._screens_base_dir: Optional[Path] = None
         self._load_screen_configs()
 
+    @property
+    def qb(self) -> SmartQueryBuilder:
+        """Builder del pool para el tenant activo (metadata/tenants/<db>); fuera de una
+        construcción de pantalla, el de la metadata por defecto."""
+        return _active_qb.get() or get_query_builder()
+
     def _get_tenant_key(self, db_config: Any) -> Optional[str]:
         """Obtiene el identificador de tenant (nombre de carpeta) desde session current_db o db_config."""
         if db_config is None:
@@ -141,6 +236,7 @@ class DataManager:
                     "inject_paths": {}
                 }
                 merged[screen_id] = {**defaults, **config}
+            self._precompile_formulas(overlay, tenant_key)
             self._tenant_screen_cache[tenant_key] = merged
             return merged
         except Exception as e:
@@ -161,7 +257,14 @@ class DataManager:
                 "inject_paths": {}
             }
             self.SCREEN_MAP[screen_id] = {**defaults, **config} # type: ignore
-    
+        self._precompile_formulas(self.SCREEN_MAP, "default")
+
+    @staticmethod
+    def _precompile_formulas(screen_map: Dict[str, Any], origin: str) -> None:
+        # Compila (y valida) todas las fórmulas al cargar: refresh_screen sólo las reutiliza
+        for text, error in precompile_formulas(screen_map):
+            print(f"⚠️ DataManager: fórmula rechazada en screens '{origin}' ({error}): {text[:120]}")
+
     def _get_minimal_config(self) -> Dict[str, Dict[str, Any]]:
         return {
             "home": {
@@ -180,8 +283,11 @@ class DataManager:
         self.cache.clear()
         self._tenant_screen_cache.clear()
     
-    def _db_fingerprint(self) -> str:
-        db_config = session.get("current_db")
+    def _db_fingerprint(self, db_config: Any = None) -> str:
+        # Sin argumento usa la BD de la sesión; el hilo de revalidación pasa la BD explícita.
+        # Fuera de una petición (CLI: manage.py explain_screen sin --tenant) no hay sesión.
+        if db_config is None and has_request_context():
+            db_config = session.get("current_db")
         if not db_config: 
             return "no-db"
         try:
@@ -196,10 +302,10 @@ class DataManager:
         ignore_values = ["Todas", "Todos", "All", "Todo", None, ""]
         return {k: v for k, v in filters.items() if v not in ignore_values}
     
-    def _cache_key(self, screen_id: str, filters: Optional[Dict] = None) -> str:
+    def _cache_key(self, screen_id: str, filters: Optional[Dict] = None, db_config: Any = None) -> str:
         normalized = self._normalize_filters(filters)
         f_str = json.dumps(normalized, sort_keys=True, default=str) if normalized else "no_filters"
-        return f"{self._db_fingerprint()}::{screen_id}::{f_str}"
+        return f"{self._db_fingerprint(db_config)}::{screen_id}::{f_str}"
     
     def _is_fresh(self, entry: CacheEntry, ttl: int) -> bool:
         return (time.time() - entry.ts) <= ttl
@@ -257,34 +363,594 @@ class DataManager:
         except Exception:
             return "N/A"
 
-    def _sql_cache_key(self, sql: str) -> str:
-        # Incluye fingerprint de la BD para evitar mezclar resultados entre conexiones
-        digest = hashlib.sha256(sql.encode("utf-8")).hexdigest()
-        return f"{self._db_fingerprint()}::sql::{digest}"
-
-    def _prune_query_cache(self) -> None:
-        # Limpieza simple para evitar crecimiento infinito
-        if len(self.query_cache) <= 500:
-            return
+    def _sql_cache_key(self, sql: Query, db_config: Any = None) -> str:
+        # Incluye fingerprint de la BD donde corre la query para no mezclar resultados entre
+        # conexiones; una SqlQuery se identifica por plantilla + parámetros
+        digest = hashlib.sha256(query_cache_text(sql).encode("utf-8")).hexdigest()
+        return f"{self._db_fingerprint(db_config)}::sql::{digest}"
+
+    def _open_period_start(self) -> str:
+        """Primer día del periodo abierto: el mes en curso, o el anterior durante los
+        primeros CACHE_CLOSED_PERIOD_GRACE_DAYS días (ajustes tardíos de cierre)."""
+        today = datetime.now()
+        year, month = today.year, today.month
+        if today.day <= Config.CACHE_CLOSED_PERIOD_GRACE_DAYS:
+            year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+        return f"{year}-{month:02d}-01"
+
+    def _prune_caches(self) -> None:
+        # El tope de bytes lo aplica el LRU de cada backend; aquí sólo se purgan
+        # las entradas vencidas, como mucho una vez por minuto
         now = time.time()
-        stale_keys = [k for k, e in self.query_cache.items() if (now - e.ts) > (self.DEFAULT_TTL_SECONDS * 4)]
-        for k in stale_keys[:300]:
-            self.query_cache.pop(k, None)
-
-    async def _execute_query_cached(self, db_config: Any, sql: str, ttl: int) -> Any:
-        key = self._sql_cache_key(sql)
+        if (now - self._last_cache_prune) < self.DEFAULT_TTL_SECONDS:
+            return
+        self._last_cache_prune = now
+        self.query_cache.prune_expired()
+        self.cache.prune_expired()
+        self.tenant_activity.prune_expired()
+        self.query_history.prune_expired()
+        if self.snapshots:
+            self.snapshots.maybe_compact()
+
+    def get_query_stats(self) -> Dict[str, Any]:
+        """Contadores de ejecución: queries reales, hits de caché y llamadas
+        coalescidas (round trips ahorrados al esperar una query idéntica en vuelo)."""
+        with self._inflight_lock:
+            stats = dict(self.query_stats)
+            stats["inflight"] = len(self._inflight_queries)
+        stats["backend"] = self.query_cache.name
+        stats["compile"] = SmartQueryBuilder.compile_stats()
+        return stats
+
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Hits, misses, desalojos y ocupación (total y por tenant) de ambas cachés
+        y, si está activo, del almacén de snapshots."""
+        stats = {"screen": self.cache.stats(), "query": self.query_cache.stats()}
+        if self.snapshots:
+            stats["snapshots"] = self.snapshots.stats()
+        return stats
+
+    def _history_keys(self, sql: Query, db_config: Any) -> Tuple[str, str]:
+        """(clave exacta, clave de plantilla): la plantilla estima una query con otros parámetros."""
+        fp = self._db_fingerprint(db_config)
+        exact = hashlib.sha256(query_cache_text(sql).encode("utf-8")).hexdigest()
+        template = hashlib.sha256(split_query(sql)[0].encode("utf-8")).hexdigest()
+        return f"{fp}::hist::{exact}", f"{fp}::hist-tpl::{template}"
+
+    def _record_query_history(self, sql: Query, db_config: Any, rows: int, seconds: float) -> None:
+        entry = CacheEntry(data={"rows": rows, "seconds": round(seconds, 4)}, ts=time.time())
+        try:
+            for key in self._history_keys(sql, db_config):
+                self.query_history.set(key, entry)
+        except Exception as e:
+            print(f"⚠️ DataManager: no se pudo registrar el historial de la query — {e}")
+
+    def _query_estimate(self, sql: Query, db_config: Any) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        exact_key, template_key = self._history_keys(sql, db_config)
+        for key, source in ((exact_key, "exact"), (template_key, "template")):
+            entry = self.query_history.peek(key)
+            if entry is not None:
+                return entry.data, source
+        return None, None
+
+    async def _execute_query_cached(
+        self, db_config: Any, sql: str, ttl: int, store_ttl: Optional[int] = None,
+        stamps: Optional[Dict[str, float]] = None,
+    ) -> Any:
+        """stamps, si se pasa, recibe {sql: ts} de la entrada de caché que respalda las filas."""
+        key = self._sql_cache_key(sql, db_config)
 
         entry = self.query_cache.get(key)
         if entry and self._is_fresh(entry, ttl):
+            with self._inflight_lock:
+                self.query_stats["cache_hits"] += 1
+            _add_query_cost("cache_hits")
+            if stamps is not None:
+                stamps[sql] = entry.ts
             return entry.data  # rows cacheados
 
-        #print(f"🔍 SQL:\n{sql.strip()}\n")
-        rows = await execute_dynamic_query(db_config, sql)
-        # Guarda incluso [] para evitar repetir hits en queries que “no traen nada”
-        self.query_cache[key] = CacheEntry(data=rows, ts=time.time())
+        with self._inflight_lock:
+            inflight = self._inflight_queries.get(key)
+            is_leader = inflight is None
+            if is_leader:
+                # Re-chequeo: otra llamada pudo guardar el resultado mientras esperábamos el lock
+                entry = self.query_cache.get(key)
+                if entry and self._is_fresh(entry, ttl):
+                    self.query_stats["cache_hits"] += 1
+                    _add_query_cost("cache_hits")
+                    if stamps is not None:
+                        stamps[sql] = entry.ts
+                    return entry.data
+                inflight = concurrent.futures.Future()
+                self._inflight_queries[key] = inflight
+                self.query_stats["executed"] += 1
+            else:
+                self.query_stats["coalesced"] += 1
+
+        if not is_leader:
+            _add_query_cost("coalesced")
+            return await asyncio.wrap_future(inflight)
+
+        try:
+            #print(f"🔍 SQL:\n{sql.strip()}\n")
+            started = time.perf_counter()
+            try:
+                rows = await execute_dynamic_query(db_config, sql)
+            except QuerySlotTimeout:
+                # No llegó a la BD: vacío para esta pantalla, pero nada en caché ni historial
+                inflight.set_result([])
+                return []
+            elapsed = time.perf_counter() - started
+            _add_query_cost("executed")
+            _add_query_cost("db_seconds", elapsed)
+            self._record_query_history(sql, db_config, len(rows or []), elapsed)
+            _add_query_cost("rows", len(rows or []))
+            # Guarda incluso [] para evitar repetir hits en queries que “no traen nada”;
+            # un [] (que también puede ser un error SQL) nunca se guarda con el TTL largo
+            stored = CacheEntry(data=rows, ts=time.time())
+            self.query_cache.set(key, stored, ttl=store_ttl if rows else None)
+            if stamps is not None:
+                stamps[sql] = stored.ts
+            self._prune_caches()
+            inflight.set_result(rows)
+            return rows
+        except BaseException as exc:
+            inflight.set_exception(exc)
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight_queries.pop(key, None)
+
+    async def _execute_queries_concurrently(
+        self, db_config: Any, sqls: List[str], tenant_key: Optional[str], max_concurrency: Optional[int] = None,
+        sql_ttls: Optional[Dict[str, int]] = None, stamps: Optional[Dict[str, float]] = None,
+    ) -> Dict[str, Any]:
+        """Ejecuta en paralelo las queries únicas de la lista; el tope por tenant lo
+        aplica db_helper en cada ejecución contra la BD.
+        Devuelve {sql: rows}; una query que falla queda como None.
+        max_concurrency fija además un tope propio más bajo (trabajo de baja prioridad);
+        sql_ttls asigna a queries concretas un TTL propio (periodos cerrados);
+        stamps recibe el ts de caché de cada resultado (ver _execute_query_cached)."""
+        unique_sqls = list(dict.fromkeys(sql for sql in sqls if sql))
+        if not unique_sqls:
+            return {}
+        sem = asyncio.Semaphore(max_concurrency) if max_concurrency else contextlib.nullcontext()
+
+        async def _run(sql: str) -> Any:
+            async with sem:
+                ttl = (sql_ttls or {}).get(sql)
+                return await self._execute_query_cached(
+                    db_config, sql, ttl or self.DEFAULT_TTL_SECONDS, store_ttl=ttl, stamps=stamps,
+                )
+
+        outcomes = await asyncio.gather(*(_run(sql) for sql in unique_sqls), return_exceptions=True)
+        return {
+            sql: (None if isinstance(out, BaseException) else out)
+            for sql, out in zip(unique_sqls, outcomes)
+        }
+
+    def explain_screen(
+        self, screen_id: str, filters: Optional[Dict] = None, tenant: Any = None, *, db_config: Any = None,
+    ) -> Json:
+        """
+        Dry-run de una carga de pantalla: compila el plan con los filtros y devuelve, sin
+        ejecutar nada, cada sentencia SQL que emitiría con su estado de caché (hit / stale /
+        miss / snapshot), duplicados, solicitudes y targets que la consumen, filas y
+        duración de su última ejecución (historial exacto o de la misma plantilla) y la
+        latencia estimada del camino crítico con el tope de concurrencia del tenant.
+        tenant es la BD como en session["current_db"]; db_config, si difiere, la conexión.
+        En modo cubo lista las queries sin cubo (cota superior: el cubo responde parte).
+        """
+        db_config = db_config if db_config is not None else tenant
+        tenant_key = self._get_tenant_key(tenant)
+        cfg = self.get_screen_map(tenant_key).get(screen_id)
+        if not cfg:
+            return {"screen_id": screen_id, "tenant": tenant_key, "error": "pantalla no encontrada"}
+        if filters:
+            filters = self._translate_filters(screen_id, filters, tenant_db=tenant_key or "")
+
+        token = _active_qb.set(get_query_builder(tenant_key))
+        try:
+            screen_plan = self._screen_plan(screen_id, cfg, tenant_key)
+            plan = self._plan_screen_queries(screen_plan, filters, fuse=True)
+        finally:
+            _active_qb.reset(token)
+
+        consumers = screen_plan.consumers()
+        requests_by_sql: Dict[Any, List[int]] = {}
+        for req_id, sql in plan["request_sql"].items():
+            requests_by_sql.setdefault(sql, []).append(req_id)
+
+        closed_ttl = Config.CACHE_CLOSED_PERIOD_TTL_SECONDS
+        statements: List[Dict[str, Any]] = []
+        seen: Dict[str, int] = {}
+        for sql in plan["queries"]:
+            split = plan["period_splits"].get(sql)
+            if split:
+                pieces = [(split["closed"], "closed", closed_ttl), (split["open"], "open", self.DEFAULT_TTL_SECONDS)]
+            else:
+                ttl = closed_ttl if sql in plan["closed_queries"] else self.DEFAULT_TTL_SECONDS
+                pieces = [(sql, "closed" if sql in plan["closed_queries"] else None, ttl)]
+            req_ids = requests_by_sql.get(sql, [])
+            for piece, part, ttl in pieces:
+                text, params = split_query(piece)
+                stmt: Dict[str, Any] = {
+                    "index": len(statements),
+                    "sql": text.strip(),
+                    "params": params,
+                    "period": part,
+                    "ttl": ttl,
+                    "requests": req_ids,
+                    "targets": sorted({name for r in req_ids for name in consumers.get(r, ())}),
+                    "duplicate_of": seen.get(query_cache_text(piece)),
+                }
+                seen.setdefault(query_cache_text(piece), stmt["index"])
+
+                entry = self.query_cache.peek(self._sql_cache_key(piece, db_config))
+                if entry is not None and self._is_fresh(entry, ttl):
+                    stmt["cache"] = "hit"
+                elif part == "closed" and self.snapshots and tenant_key and self.snapshots.exists(tenant_key, piece):
+                    stmt["cache"] = "snapshot"
+                else:
+                    stmt["cache"] = "stale" if entry is not None else "miss"
+
+                estimate, source = self._query_estimate(piece, db_config)
+                stmt["estimated_rows"] = estimate["rows"] if estimate else None
+                stmt["estimated_seconds"] = estimate["seconds"] if estimate else None
+                stmt["estimate_source"] = source
+                statements.append(stmt)
+
+        to_execute = [s for s in statements if s["duplicate_of"] is None and s["cache"] in ("miss", "stale")]
+        known = sorted(s["estimated_seconds"] for s in to_execute if s["estimated_seconds"] is not None)
+        fallback = known[len(known) // 2] if known else None
+        durations = [s["estimated_seconds"] if s["estimated_seconds"] is not None else fallback for s in to_execute]
+        concurrency = self.MAX_CONCURRENT_QUERIES_PER_TENANT
+        critical_path = None
+        if all(d is not None for d in durations):
+            # Las sentencias corren en paralelo con el semáforo del tenant: makespan
+            # de asignar la más larga primero al slot que se libera antes
+            slots = [0.0] * concurrency
+            for d in sorted(durations, reverse=True):
+                slots[slots.index(min(slots))] += d
+            critical_path = round(max(slots), 4)
+
+        return {
+            "screen_id": screen_id,
+            "tenant": tenant_key,
+            "filters": filters or {},
+            "cube_mode": bool(cfg.get("cube")),
+            "statements": statements,
+            "summary": {
+                "requests": len(plan["requests"]),
+                "statements": len(statements),
+                "fused_requests": sum(len(ids) for ids in plan["fused_requests"].values()),
+                "duplicates": sum(1 for s in statements if s["duplicate_of"] is not None),
+                "cache_hits": sum(1 for s in statements if s["duplicate_of"] is None and s["cache"] in ("hit", "snapshot")),
+                "to_execute": len(to_execute),
+                "estimated_rows": sum(s["estimated_rows"] or 0 for s in to_execute),
+                "latency_unknown": sum(1 for s in to_execute if s["estimated_seconds"] is None),
+                "concurrency": concurrency,
+                "critical_path_seconds": critical_path,
+            },
+        }
+
+    def _plan_rows(self, plan: Dict[str, Any], results: Dict[str, Any], req_id: Optional[int]) -> Any:
+        """Filas de una solicitud del plan. Si su query fue fusionada con otras, se
+        descartan las columnas de métricas ajenas para no contaminar la inyección
+        (o se renombran sus columnas de variante de periodo a la clave de la métrica)."""
+        sql = plan["request_sql"].get(req_id)
+        if not sql:
+            return None
+        rows = results.get(sql)
+        columns = plan["request_columns"].get(req_id)
+        if rows and columns:
+            return ResultSet.from_rows(rows).select(columns)
+        drop = plan["request_drop"].get(req_id)
+        if not rows or not drop:
+            return rows
+        return ResultSet.from_rows(rows).drop(drop)
+
+    def _screen_plan(self, screen_id: str, cfg: Dict[str, Any], tenant_key: Optional[str]) -> ScreenPlan:
+        """Plan compilado de la pantalla; se recompila si cambia su configuración
+        (otro dict de screens) o la metadata del tenant."""
+        qb = self.qb
+        meta_version = getattr(qb, "meta_version", "")
+        key = (tenant_key or "", screen_id)
+        screen_plan = self._screen_plans.get(key)
+        if screen_plan is None or not screen_plan.is_valid_for(cfg, meta_version):
+            screen_plan = compile_screen_plan(
+                screen_id, cfg, qb.metrics, tenant=tenant_key or "", meta_version=meta_version
+            )
+            self._screen_plans[key] = screen_plan
+        return screen_plan
+
+    def _plan_screen_queries(self, screen_plan: ScreenPlan, filters: Optional[Dict], fuse: bool = True) -> Dict[str, Any]:
+        """
+        Fase de planeación de refresh_screen: instancia las solicitudes del plan
+        compilado con los filtros de la llamada, sin ejecutar nada. Al final,
+        SmartQueryBuilder.plan_fused_queries fusiona las solicitudes compatibles y
+        la fase de inyección consume las filas con la misma forma que antes.
+        Con fuse=False sólo se registran las solicitudes (el modo cubo fusiona después
+        las que no puede responder).
+        """
+        plan: Dict[str, Any] = {
+            "kpi": {}, "chart": {}, "categorical": {}, "table": {},
+            "requests": screen_plan.requests(filters), "request_sql": {}, "request_drop": {}, "request_columns": {}, "queries": [],
+            "fused_requests": {}, "period_splits": {}, "closed_queries": set(), "cube_results": {},
+        }
+        for target in screen_plan.targets:
+            plan[target.kind][target.key] = list(target.batches) if target.kind == "kpi" else list(target.inputs)
+
+        if fuse:
+            self._fuse_plan(plan, plan["requests"])
+        return plan
+
+    def _fuse_plan(self, plan: Dict[str, Any], requests: List[Dict[str, Any]]) -> Dict[str, Any]:
+        fused = self.qb.plan_fused_queries(requests, open_period_start=self._open_period_start())
+        for req_id, target in fused["mapping"].items():
+            query = fused["queries"][target["query_index"]]
+            if not query.get("query"):
+                continue
+            plan["request_sql"][req_id] = query["query"]
+            if target.get("columns"):
+                # Variantes de periodo fusionadas: columnas "<métrica>__<variante>"
+                plan["request_columns"][req_id] = target["columns"]
+                continue
+            foreign = set(query["metrics"]) - set(target["metrics"])
+            if foreign:
+                plan["request_drop"][req_id] = frozenset(foreign)
+        plan["queries"] = [q["query"] for q in fused["queries"] if q.get("query")]
+        # Series mensuales: los meses cerrados se cachean con TTL largo y sólo el abierto se re-consulta
+        plan["period_splits"] = {q["query"]: q["period_split"] for q in fused["queries"] if q.get("period_split")}
+        plan["closed_queries"] = {q["query"] for q in fused["queries"] if q.get("closed_period")}
+        plan["fused_requests"] = {
+            q["query"]: q["request_ids"]
+            for q in fused["queries"] if q.get("query") and len(q["request_ids"]) > 1
+        }
+        return plan
+
+    def _cube_columns(self, cfg: Dict[str, Any]) -> List[str]:
+        """Columnas WHERE de los filtros declarados que entran al cubo ("cube": true = todos,
+        o "cube": {"filters": [...]} para excluir filtros de alta cardinalidad)."""
+        cube_spec = cfg.get("cube")
+        filter_specs: Dict[str, Any] = cfg.get("filters", {}) or {}
+        keys = cube_spec.get("filters") if isinstance(cube_spec, dict) and cube_spec.get("filters") else list(filter_specs)
+        columns = [self._filter_where_column(filter_specs[k]) for k in keys if isinstance(filter_specs.get(k), dict)]
+        return list(dict.fromkeys(c for c in columns if c and "." in c))
+
+    def _cube_metric(self, m_key: str) -> Optional[Tuple[str, str, str]]:
+        """(tabla, agregación, columna) si la métrica es re-agregable desde un cubo."""
+        m_def = self.qb.metrics.get(m_key)
+        if not m_def or m_def.get("type") in ("derived", "placeholder"):
+            return None
+        recipe = m_def.get("recipe", {})
+        agg = recipe.get("aggregation", "SUM")
+        if agg not in self.qb.CUBE_AGGREGATIONS or not recipe.get("table") or not recipe.get("column"):
+            return None
+        return recipe["table"], agg, recipe["column"]
+
+    async def _load_screen_cubes(
+        self, cfg: Dict[str, Any], requests: List[Dict[str, Any]], filters: Optional[Dict],
+        db_config: Any, tenant_key: Optional[str], max_concurrency: Optional[int] = None,
+    ) -> Dict[str, ScreenCube]:
+        """Un cubo por tabla de hechos (año objetivo y anterior, por mes y columnas de filtro).
+        La query del cubo no depende de los filtros de catálogo, así que cambiar un filtro
+        reutiliza las filas cacheadas y el cubo ya construido."""
+        columns = self._cube_columns(cfg)
+        measures_by_fact: Dict[str, Dict[Tuple[str, str], str]] = {}
+        for req in requests:
+            for m_key in req["metrics"]:
+                spec = self._cube_metric(m_key)
+                if spec:
+                    fact_measures = measures_by_fact.setdefault(spec[0], {})
+                    fact_measures.setdefault(spec[1:], f"m{len(fact_measures)}")
+        if not measures_by_fact:
+            return {}
+
+        year, _ = self.qb._resolve_target_period(filters)
+        date_from, date_to = f"{year - 1}-01-01", f"{year + 1}-01-01"
+
+        # Columnas cuyo JOIN es 1:N duplicarían las medidas: quedan fuera del cubo y sus
+        # filtros se resuelven por SQL. La cardinalidad es del esquema: se cachea con TTL largo.
+        checks = {fact: self.qb.get_cube_fanout_query(fact, columns, date_from, date_to) for fact in measures_by_fact}
+        checks = {fact: c for fact, c in checks.items() if c.get("query")}
+        counts = await self._execute_queries_concurrently(
+            db_config, [c["query"] for c in checks.values()], tenant_key, max_concurrency,
+            {c["query"]: Config.CACHE_CLOSED_PERIOD_TTL_SECONDS for c in checks.values()},
+        )
+
+        builds = {}
+        for fact, check in checks.items():
+            rows = counts.get(check["query"])
+            if not rows:
+                continue
+            fanout = {col for alias, col in check["checked_columns"].items() if rows[0].get(alias) != rows[0].get("base")}
+            measures = {alias: spec for spec, alias in sorted(measures_by_fact[fact].items(), key=lambda kv: kv[1])}
+            build = self.qb.get_cube_query(
+                fact, measures, [c for c in columns if c not in fanout], date_from, date_to, cfg.get("page_filter", [])
+            )
+            if build.get("query"):
+                builds[fact] = (build, measures)
+        stamps: Dict[str, float] = {}
+        results = await self._execute_queries_concurrently(
+            db_config, [b["query"] for b, _ in builds.values()], tenant_key, max_concurrency, stamps=stamps,
+        )
+
+        cubes: Dict[str, ScreenCube] = {}
+        for fact, (build, measures) in builds.items():
+            rows = results.get(build["query"])
+            if not rows:
+                continue
+            if len(rows) > Config.CUBE_MAX_ROWS:
+                print(f"⚠️ DataManager: cubo de '{fact}' con {len(rows)} filas excede CUBE_MAX_ROWS, se usa SQL")
+                continue
+            memo_key = self._sql_cache_key(build["query"], db_config)
+            stamp = stamps.get(build["query"])
+            with self._cube_memo_lock:
+                memo = self._cube_memo.get(memo_key)
+                if memo is not None and stamp is not None and memo[0] == stamp:
+                    self._cube_memo.move_to_end(memo_key)
+                    cubes[fact] = memo[1]
+                    continue
+            cube = ScreenCube(
+                rows, build["columns"], measures,
+                date_from=date_from, date_to=date_to, ignored_columns=build["ignored_columns"],
+            )
+            # Sin ts (resultado compartido de una query en vuelo) no se memoriza
+            if stamp is not None:
+                with self._cube_memo_lock:
+                    self._cube_memo[memo_key] = (stamp, cube)
+                    while len(self._cube_memo) > self.CUBE_MEMO_SIZE:
+                        self._cube_memo.popitem(last=False)
+            cubes[fact] = cube
+        return cubes
+
+    def _answer_from_cubes(self, plan: Dict[str, Any], req: Dict[str, Any], cubes: Dict[str, ScreenCube]) -> bool:
+        """Resuelve la solicitud con el cubo si reproduce la misma semántica que su SQL
+        (métricas aditivas de una tabla, periodo cubierto, filtros sobre columnas del cubo).
+        Las filas quedan en plan["cube_results"] bajo una clave sintética."""
+        if not cubes:
+            return False
+        dims = list(req["dimensions"] or [])
+        if "__year_month__" in dims:
+            return False
+
+        fact = None
+        outputs: Dict[str, str] = {}
+        for m_key in req["metrics"]:
+            m_def = self.qb.metrics.get(m_key)
+            if not m_def or m_def.get("type") in ("derived", "placeholder"):
+                continue
+            spec = self._cube_metric(m_key)
+            if spec is None or (fact is not None and spec[0] != fact) or spec[0] not in cubes:
+                return False
+            fact = spec[0]
+            alias = cubes[fact].measure_index.get(spec[1:])
+            if alias is None:
+                return False
+            outputs[m_key] = alias
+        if not outputs:
+            return False
+        cube = cubes[fact]
+
+        group_by = []
+        for dim in dims:
+            if dim == "__month__":
+                group_by.insert(0, ("period", "__month__"))
+                continue
+            col = dim if "." in dim else f"{fact}.{dim}"
+            if col not in cube.codes:
+                return False
+            group_by.append((dim, col))
+
+        cube_filters: Dict[str, Any] = {}
+        for k, v in (req["filters"] or {}).items():
+            if k in ("year", "month") or v in ("Todas", "Todos", "All", None):
+                continue
+            col = k if "." in k else f"{fact}.{k}"
+            if col in cube.ignored_columns:
+                continue
+            if col not in cube.codes or isinstance(v, dict) or v == []:
+                return False
+            cube_filters[col] = v
+
+        year, month = self.qb._resolve_target_period(req["filters"])
+        modifier = self.qb._effective_time_modifier(req["metrics"])
+        if "__month__" in dims:
+            start, end = self.qb._build_date_range(year - 1 if modifier == "previous_year" else year)
+        else:
+            start, end = self.qb._period_range(year, month, modifier)
+        start_p, end_p = period_index(start), period_index(end)
+        if not cube.covers(start_p, end_p):
+            return False
+
+        key = f"cube::{req['id']}"
+        plan["cube_results"][key] = cube.aggregate(cube.mask(start_p, end_p, cube_filters), outputs, group_by)
+        plan["request_sql"][req["id"]] = key
+        return True
+
+    async def _execute_plan_queries(
+        self, plan: Dict[str, Any], db_config: Any, tenant_key: Optional[str], max_concurrency: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Ejecuta las queries del plan. Una serie partida corre como dos queries (meses
+        cerrados con TTL largo, periodo abierto con el normal) y sus filas se unen bajo
+        la query original, así la inyección no distingue entre ambos casos."""
+        closed_ttl = Config.CACHE_CLOSED_PERIOD_TTL_SECONDS
+        sqls: List[str] = []
+        sql_ttls: Dict[str, int] = {}
+        for sql in plan["queries"]:
+            split = plan["period_splits"].get(sql)
+            if split:
+                sqls.extend([split["closed"], split["open"]])
+                sql_ttls[split["closed"]] = closed_ttl
+            else:
+                sqls.append(sql)
+                if sql in plan["closed_queries"]:
+                    sql_ttls[sql] = closed_ttl
+
+        # Periodos cerrados: primero el almacén de snapshots en disco, luego la BD
+        snapshot_rows: Dict[str, Any] = {}
+        if self.snapshots and tenant_key:
+            for sql in sql_ttls:
+                try:
+                    rows = self.snapshots.get(tenant_key, sql)
+                except Exception as e:
+                    print(f"⚠️ DataManager: error leyendo snapshot — {e}")
+                    rows = None
+                if rows is not None:
+                    snapshot_rows[sql] = rows
+            sqls = [sql for sql in sqls if sql not in snapshot_rows]
+
+        results = await self._execute_queries_concurrently(db_config, sqls, tenant_key, max_concurrency, sql_ttls)
+        if self.snapshots and tenant_key:
+            for sql in sql_ttls:
+                # [] también es lo que devuelve execute_dynamic_query ante un error SQL: no se persiste
+                if sql not in snapshot_rows and results.get(sql):
+                    try:
+                        self.snapshots.put(tenant_key, sql, results[sql])
+                    except Exception as e:
+                        print(f"⚠️ DataManager: error guardando snapshot — {e}")
+            results.update(snapshot_rows)
+        for sql, split in plan["period_splits"].items():
+            closed_rows, open_rows = results.pop(split["closed"], None), results.pop(split["open"], None)
+            results[sql] = None if closed_rows is None or open_rows is None else ResultSet.concat([closed_rows, open_rows])
+        return results
 
-        self._prune_query_cache()
-        return rows
+    async def _retry_failed_fusions(
+        self, plan: Dict[str, Any], results: Dict[str, Any], db_config: Any, tenant_key: Optional[str],
+        max_concurrency: Optional[int] = None,
+    ) -> None:
+        """Si una query fusionada falla, una métrica rota no debe dejar en cero a todas
+        las demás: se re-ejecuta cada solicitud con su propia query, como antes de fusionar.
+        execute_dynamic_query devuelve [] ante errores SQL."""
+        requests_by_id = {r["id"]: r for r in plan["requests"]}
+        failed = [
+            sql for sql, req_ids in plan["fused_requests"].items()
+            if results.get(sql) is None
+            # Un agregado sin dimensiones siempre trae una fila; vacío = error SQL
+            or (not results[sql] and not requests_by_id[req_ids[0]]["dimensions"])
+        ]
+        if not failed:
+            return
+        retry_sqls = []
+        for sql in failed:
+            print(f"⚠️ DataManager: query fusionada falló, re-ejecutando {len(plan['fused_requests'][sql])} solicitudes por separado")
+            for req_id in plan["fused_requests"][sql]:
+                req = requests_by_id[req_id]
+                try:
+                    build = self.qb.get_dataframe_query(
+                        req["metrics"], req["dimensions"], filters=req["filters"], page_filters=req["page_filters"]
+                    )
+                except Exception as e:
+                    print(f"⚠️ DataManager: no se pudo compilar la solicitud {req_id}: {e}")
+                    continue
+                if not build or not build.get("query"):
+                    continue
+                plan["request_sql"][req_id] = build["query"]
+                plan["request_drop"].pop(req_id, None)
+                plan["request_columns"].pop(req_id, None)
+                retry_sqls.append(build["query"])
+        results.update(await self._execute_queries_concurrently(db_config, retry_sqls, tenant_key, max_concurrency))
 
     def get_screen(
         self,
@@ -306,43 +972,168 @@ class DataManager:
             filters = self._translate_filters(screen_id, filters, tenant_db=tenant_key)
 
         ttl = int(cfg.get("ttl_seconds") or self.DEFAULT_TTL_SECONDS)
-        if db_name is not None:
-            try:
-                raw = json.dumps(db_name, sort_keys=True, default=str).encode("utf-8")
-            except Exception:
-                raw = str(db_name).encode("utf-8")
-            fingerprint = hashlib.sha256(raw).hexdigest()[:16]
-            normalized = self._normalize_filters(filters)
-            f_str = json.dumps(normalized, sort_keys=True, default=str) if normalized else "no_filters"
-            key = f"{fingerprint}::{screen_id}::{f_str}"
-        else:
-            key = self._cache_key(screen_id, filters)
+        key = self._cache_key(screen_id, filters, db_config=db_name)
         
-        if not force_base and use_cache and key in self.cache:
-            entry = self.cache[key]
+        entry = self.cache.get(key) if (not force_base and use_cache) else None
+        if entry is not None:
             if allow_stale or self._is_fresh(entry, ttl):
-                return entry.data
+                return self._with_freshness(entry, ttl, key)
 
         if allow_stale and use_cache and not force_base:
             normalized = self._normalize_filters(filters)
             f_str = json.dumps(normalized, sort_keys=True, default=str) if normalized else "no_filters"
             suffix = f"::{screen_id}::{f_str}"
-            for k, entry in self.cache.items():
-                if k.endswith(suffix) and entry.data:
-                    return entry.data
+            for k, entry in self.cache.scan(suffix):
+                if entry.data:
+                    return self._with_freshness(entry, ttl, k)
 
         return {}
 
+    def _with_freshness(self, entry: CacheEntry, ttl: int, cache_key: str) -> Json:
+        """Copia superficial del payload con el marcador "_freshness" para la UI:
+        fresh (dentro del TTL), revalidating (hay un refresh en segundo plano) o stale."""
+        data = entry.data
+        if not isinstance(data, dict) or not data:
+            return data
+        if self._is_fresh(entry, ttl):
+            status = "fresh"
+        elif self.is_revalidating(cache_key):
+            status = "revalidating"
+        else:
+            status = "stale"
+        return {**data, "_freshness": {"status": status, "updated_at": entry.ts}}
+
+    def is_revalidating(self, cache_key: str) -> bool:
+        with self._revalidate_lock:
+            return cache_key in self._revalidating
+
+    def _revalidation_loop(self) -> asyncio.AbstractEventLoop:
+        # Loop propio en un hilo daemon: los refresh en segundo plano sobreviven al request
+        with self._revalidate_lock:
+            if self._bg_loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="screen-revalidation", daemon=True).start()
+                self._bg_loop = loop
+            return self._bg_loop
+
+    def _schedule_revalidation(
+        self, screen_id: str, cfg: Dict[str, Any], filters: Optional[Dict], *,
+        db_config: Any, tenant_key: Optional[str], cache_key: str,
+    ) -> None:
+        """Lanza (una sola vez por clave) la reconstrucción de la pantalla en segundo plano."""
+        loop = self._revalidation_loop()
+        with self._revalidate_lock:
+            if cache_key in self._revalidating:
+                return
+            self._revalidating[cache_key] = asyncio.run_coroutine_threadsafe(
+                self._revalidate(screen_id, cfg, filters, db_config=db_config, tenant_key=tenant_key, cache_key=cache_key),
+                loop,
+            )
+
+    async def _revalidate(
+        self, screen_id: str, cfg: Dict[str, Any], filters: Optional[Dict], *,
+        db_config: Any, tenant_key: Optional[str], cache_key: str,
+    ) -> None:
+        try:
+            await self._build_screen(
+                screen_id, cfg, filters, db_config=db_config, tenant_key=tenant_key, cache_key=cache_key, use_cache=True
+            )
+        except Exception as e:
+            print(f"⚠️ DataManager [{screen_id}]: error al revalidar en segundo plano — {e}")
+        finally:
+            with self._revalidate_lock:
+                self._revalidating.pop(cache_key, None)
+
+    # Resolución del último acceso: a lo más una escritura por tenant y minuto por proceso
+    TENANT_ACTIVITY_RESOLUTION_SECONDS = 60.0
+
+    def record_tenant_activity(self, current_db: Any, databases: Optional[List[Dict[str, Any]]] = None) -> None:
+        """Marca como activos la BD en uso y las BDs a las que tiene acceso la sesión."""
+        now = time.time()
+        tenants = [self._get_tenant_key(db) for db in (databases or []) if isinstance(db, (dict, str))]
+        tenants.append(self._get_tenant_key(current_db))
+        for tenant in tenants:
+            if not tenant or now - self._tenant_activity.get(tenant, 0.0) < self.TENANT_ACTIVITY_RESOLUTION_SECONDS:
+                continue
+            self._tenant_activity[tenant] = now
+            self.tenant_activity.set(f"{tenant}::activity", CacheEntry(data=tenant, ts=now))
+
+    def active_tenants(self, max_idle_seconds: float) -> List[str]:
+        """Tenants vistos en los últimos max_idle_seconds (por cualquier worker si el backend
+        es compartido), del más reciente al más antiguo."""
+        cutoff = time.time() - max_idle_seconds
+        recent = [(entry.ts, entry.data) for _, entry in self.tenant_activity.scan("::activity") if entry.ts >= cutoff]
+        return [tenant for ts, tenant in sorted(recent, reverse=True)]
+
+    async def warm_screen(
+        self,
+        screen_id: str,
+        tenant_db: str,
+        filters: Optional[Dict] = None,
+        *,
+        max_age_seconds: Optional[float] = None,
+        max_concurrency: Optional[int] = 1,
+    ) -> Dict[str, Any]:
+        """
+        Pre-calcula la pantalla de un tenant sin sesión de Flask (por defecto con los
+        filtros del periodo actual) y la deja en caché. Omite entradas con menos de
+        max_age_seconds (por defecto el TTL de la pantalla) o ya en revalidación.
+        Devuelve el estado y el costo: queries ejecutadas, hits, filas y segundos.
+        """
+        tenant_key = self._get_tenant_key(tenant_db)
+        screen_map = self.get_screen_map(tenant_key)
+        cfg = screen_map.get(screen_id) if screen_map else None
+        if not cfg or not tenant_key:
+            return {"status": "skipped"}
+        if filters is None:
+            filters = self.default_screen_filters(screen_id)
+        if filters:
+            filters = self._translate_filters(screen_id, filters, tenant_db=tenant_key)
+
+        cache_key = self._cache_key(screen_id, filters, db_config=tenant_key)
+        max_age = max_age_seconds if max_age_seconds is not None else int(cfg.get("ttl_seconds") or self.DEFAULT_TTL_SECONDS)
+        entry = self.cache.get(cache_key)
+        if entry is not None and self._is_fresh(entry, max_age):
+            return {"status": "fresh"}
+        if self.is_revalidating(cache_key):
+            return {"status": "revalidating"}
+
+        cost: Dict[str, float] = {}
+        token = _query_cost.set(cost)
+        started = time.perf_counter()
+        try:
+            await self._build_screen(
+                screen_id, cfg, filters, db_config=tenant_key, tenant_key=tenant_key,
+                cache_key=cache_key, use_cache=True, max_concurrency=max_concurrency,
+            )
+        finally:
+            _query_cost.reset(token)
+        return {"status": "warmed", "seconds": time.perf_counter() - started, **cost}
+
     def _safe_eval_formula(self, formula: str, row_dict: Dict[str, Any]) -> float:
         try:
             safe_dict = {k: self._clean_val(v) for k, v in row_dict.items()}
-            result = eval(formula, {"__builtins__": {}}, safe_dict)
+            result = compile_formula(formula)(safe_dict)
             return self._clean_val(result)
         except Exception:
             return 0.0
 
-    async def refresh_screen(self, screen_id: str, filters: Optional[Dict] = None, *, use_cache: bool = True, db_config: Any = None) -> Json:
+    async def refresh_screen(
+        self,
+        screen_id: str,
+        filters: Optional[Dict] = None,
+        *,
+        use_cache: bool = True,
+        db_config: Any = None,
+        stale_while_revalidate: bool = True,
+    ) -> Json:
+        """
+        Devuelve la pantalla con marcador "_freshness". Con stale_while_revalidate, una
+        entrada vencida se sirve de inmediato y se reconstruye en segundo plano
+        (una sola reconstrucción por clave); sólo una pantalla sin caché espera a la BD.
+        """
         tenant_key = self._get_tenant_key(db_config or session.get("current_db"))
+        self.record_tenant_activity(tenant_key, session.get("databases"))
         screen_map = self.get_screen_map(tenant_key)
         cfg = screen_map.get(screen_id) if screen_map else {}
         if not cfg:
@@ -351,72 +1142,98 @@ class DataManager:
             filters = self._translate_filters(screen_id, filters, tenant_db=tenant_key)
 
         cache_key = self._cache_key(screen_id, filters)
+        ttl = int(cfg.get("ttl_seconds") or 30)
 
-        if use_cache and cache_key in self.cache:
-            entry = self.cache[cache_key]
-            if self._is_fresh(entry, int(cfg.get("ttl_seconds") or 30)):
-                return entry.data
-
-
-        data: Json = {}
+        entry = self.cache.get(cache_key) if use_cache else None
+        if entry is not None:
+            if self._is_fresh(entry, ttl):
+                return self._with_freshness(entry, ttl, cache_key)
 
         if not db_config:
             db_config = session.get("current_db")
 
         if not db_config:
+            data: Json = {}
             if use_cache:
                 self.cache[cache_key] = CacheEntry(data=data, ts=time.time())
             return data
-        
-        inject_paths = cfg.get("inject_paths", {})
-        
-        kpi_roadmap = cfg.get("kpi_roadmap", {})
-        
-        for group_key, spec in kpi_roadmap.items():
 
-            if not isinstance(spec, dict):
-                print(f"⚠️ DataManager: spec para '{group_key}' no es dict (tipo: {type(spec).__name__}), skipping...")
-                continue
-            
-            dims = spec.get("dimensions", [])
-            raw_metrics = spec.get("metrics", [])
-            
-
-            metric_batches = []
-            if raw_metrics and isinstance(raw_metrics[0], list):
-                metric_batches = raw_metrics
-            else:
-                metric_batches = [raw_metrics] if raw_metrics else []
-            
-            fixed_filters_raw = spec.get("fixed_filters", {})
-            fixed_filters_per_batch = isinstance(fixed_filters_raw, list)
+        if entry is not None and entry.data and stale_while_revalidate:
+            self._schedule_revalidation(
+                screen_id, cfg, filters, db_config=db_config, tenant_key=tenant_key, cache_key=cache_key
+            )
+            return self._with_freshness(entry, ttl, cache_key)
 
-            row_context = {}
+        data = await self._build_screen(
+            screen_id, cfg, filters, db_config=db_config, tenant_key=tenant_key, cache_key=cache_key, use_cache=use_cache
+        )
+        return self._with_freshness(CacheEntry(data=data, ts=time.time()), ttl, cache_key)
 
+    async def _build_screen(
+        self,
+        screen_id: str,
+        cfg: Dict[str, Any],
+        filters: Optional[Dict],
+        *,
+        db_config: Any,
+        tenant_key: Optional[str],
+        cache_key: str,
+        use_cache: bool,
+        max_concurrency: Optional[int] = None,
+    ) -> Json:
+        """Ejecuta las queries de la pantalla e inyecta los resultados. No lee la sesión
+        de Flask: también corre en el hilo de revalidación y en el pre-calentador."""
+        token = _active_qb.set(get_query_builder(tenant_key))
+        try:
+            return await self._compute_screen(
+                screen_id, cfg, filters, db_config=db_config, tenant_key=tenant_key,
+                cache_key=cache_key, use_cache=use_cache, max_concurrency=max_concurrency,
+            )
+        finally:
+            _active_qb.reset(token)
 
-            for batch_idx, batch in enumerate(metric_batches):
-                if not batch: continue
-                combined_filters = (filters or {}).copy()
-                if fixed_filters_per_batch:
-                    if batch_idx < len(fixed_filters_raw):
-                        ff = fixed_filters_raw[batch_idx]
-                        if isinstance(ff, dict):
-                            combined_filters.update(ff)
-                        elif isinstance(ff, list):
-                            for f in ff:
-                                if isinstance(f, dict):
-                                    combined_filters.update(f)
-                elif isinstance(fixed_filters_raw, dict):
-                    combined_filters.update(fixed_filters_raw)
+    async def _compute_screen(
+        self,
+        screen_id: str,
+        cfg: Dict[str, Any],
+        filters: Optional[Dict],
+        *,
+        db_config: Any,
+        tenant_key: Optional[str],
+        cache_key: str,
+        use_cache: bool,
+        max_concurrency: Optional[int] = None,
+    ) -> Json:
+        """Cuerpo de _build_screen, con el builder del tenant ya activo en _active_qb."""
+        data: Json = {}
+        started = time.perf_counter()
+
+        # Planeación: todas las queries de la pantalla se ejecutan en paralelo y
+        # la inyección de abajo lee los resultados ya resueltos.
+        cube_mode = bool(cfg.get("cube"))
+        screen_plan = self._screen_plan(screen_id, cfg, tenant_key)
+        plan = self._plan_screen_queries(screen_plan, filters, fuse=not cube_mode)
+        fetch_started = time.perf_counter()
+        _add_query_cost("plan_seconds", fetch_started - started)
+        if cube_mode:
+            # Modo cubo: lo que el cubo local puede responder no va a la BD
+            cubes = await self._load_screen_cubes(cfg, plan["requests"], filters, db_config, tenant_key, max_concurrency)
+            pending = [req for req in plan["requests"] if not self._answer_from_cubes(plan, req, cubes)]
+            self._fuse_plan(plan, pending)
+        results = await self._execute_plan_queries(plan, db_config, tenant_key, max_concurrency)
+        results.update(plan["cube_results"])
+        await self._retry_failed_fusions(plan, results, db_config, tenant_key, max_concurrency)
+        transform_started = time.perf_counter()
+        _add_query_cost("fetch_seconds", transform_started - fetch_started)
+
+        for target in screen_plan.targets_of("kpi"):
+            row_context = {}
+
+            for batch, req_id in plan["kpi"].get(target.key, []):
                 try:
-                    build = self.qb.get_dataframe_query(batch, dims, filters=combined_filters, page_filters=cfg.get("page_filter", []))
-                    if build and "query" in build:
-                        print(f"🔍 Query de KPI {group_key}->{batch}: {build['query']}")
-                        rows = await self._execute_query_cached(db_config, build["query"], self.DEFAULT_TTL_SECONDS)
+                    if req_id in plan["request_sql"]:
+                        rows = self._plan_rows(plan, results, req_id)
                         if not rows and db_config: continue
-                        if rows is None or (not rows and db_config):
-                            print(f"🛑 Abortando carga de {screen_id}: BD no disponible o error crítico.")
-                            break
                         if rows:
 
                             for k, v in rows[0].items():
@@ -424,113 +1241,38 @@ class DataManager:
                 except Exception:
                     pass
 
-
-            for col_def in spec.get("columns", []):
-                target_key = col_def.get("target")
-
-                path = inject_paths.get(f"{group_key}.{target_key}") or inject_paths.get(target_key)
-
-                if not path: continue
-
-                val = 0.0
-                
-
-                if "formula" in col_def:
-                    f_str = col_def["formula"]
+            for output in target.outputs:
+                if output.formula is not None:
                     try:
-                        if "lambda" in f_str:
-
-                            calc_func = eval(f_str, {"__builtins__": {}})
-                            val = calc_func(row_context)
-                        else:
-                            val = eval(f_str, {"__builtins__": {}}, row_context)
+                        val = compile_formula(output.formula)(row_context)
                     except Exception:
                         val = 0.0
-
                 else:
-                    data_key = col_def.get("key")
-                    val = row_context.get(data_key, 0.0)
-
+                    val = row_context.get(output.key, 0.0)
 
                 clean_val = self._clean_val(val)
-                self._set_path(data, path, clean_val)
-
-                if path and len(path) > 1:
-                    leaf = path[-1]
-                    parent_path = path[:-1]
-                    kpi_key = path[-2] if len(path) >= 2 else ""
-
-                    is_count_kpi = kpi_key in ("total_trips", "total_kilometers", "units_used", "customers_served", "real_kilometers", "workshop_entries", "items_registered", "items_with_stock", "items_without_stock")
-
-                    is_decimal_kpi = kpi_key in ("real_yield", "liters_consumed", "avg_collection_days", "average_payment_days")
-                    is_percent_kpi = kpi_key in ("availability_percent", "compliance_level")
-                    fmt = "integer" if is_count_kpi else ("percent" if is_percent_kpi else ("decimal" if is_decimal_kpi else "currency"))
-                    if leaf == "value" or leaf == "current_value":
-                        self._set_path(data, parent_path + ["value_formatted"], self._format_val(clean_val, fmt))
-                    elif leaf == "target":
-                        self._set_path(data, parent_path + ["target_formatted"], self._format_val(clean_val, fmt))
-
-                    if kpi_key in ("avg_collection_days", "average_payment_days"):
-                        self._set_path(data, parent_path + ["vs_last_year_formatted"], "none")
-                        self._set_path(data, parent_path + ["label_prev_year"], "Vs 2025")
-                    elif kpi_key == "availability_percent":
-                        self._set_path(data, parent_path + ["vs_last_year_formatted"], None)
-                        self._set_path(data, parent_path + ["vs_last_year_delta"], None)
-                        self._set_path(data, parent_path + ["vs_last_year_delta_formatted"], None)
-                    elif leaf == "vs_last_year_value":
-                        self._set_path(data, parent_path + ["vs_last_year_formatted"], self._format_val(clean_val, fmt))
-                    elif leaf == "ytd_value":
-                        self._set_path(data, parent_path + ["ytd_formatted"], self._format_val(clean_val, fmt))
-                    elif leaf in ("trips_meta", "trips_previous", "trips_ytd", "kms_meta", "kms_anterior", "kms_ytd", "kms_valor"):
-                        fmt_leaf = "integer" if "trips" in leaf or "kms" in leaf else "currency"
-                        self._set_path(data, parent_path + [leaf + "_formatted"], self._format_val(clean_val, fmt_leaf))
-                    elif "delta" in leaf or "variance" in leaf:
-                        self._set_path(data, parent_path + [leaf + "_formatted"], self._format_delta(clean_val))
-
-
-
-
-        chart_roadmap = cfg.get("chart_roadmap", {})
-        for chart_key, spec in chart_roadmap.items():
-            path = inject_paths.get(chart_key)
-            if not path: continue
-
-
-            if not isinstance(spec, dict):
-                print(f"⚠️ DataManager: spec para chart '{chart_key}' no es dict (tipo: {type(spec).__name__}), skipping...")
-                continue
+                self._set_path(data, output.path, clean_val)
 
-            fixed_filters_raw = spec.get("fixed_filters", {})
-            fixed_filters_per_batch = isinstance(fixed_filters_raw, list)
-
-            chart_batches = []
-            if "metrics" in spec: 
-                raw_c = spec["metrics"]
-                chart_batches = raw_c if (raw_c and isinstance(raw_c[0], list)) else [raw_c]
-                series_defs = spec.get("columns", [])
-            else:
-                chart_batches = [[v for v in spec.values() if isinstance(v, str)]]
-                series_defs = [{"key": v, "series": k} for k, v in spec.items() if isinstance(v, str)]
+                for derived_path, op, arg in output.derived:
+                    if op == "format":
+                        self._set_path(data, derived_path, self._format_val(clean_val, arg))
+                    elif op == "delta":
+                        self._set_path(data, derived_path, self._format_delta(clean_val))
+                    else:
+                        self._set_path(data, derived_path, arg)
 
-            spec_dims = spec.get("dimensions", ["__month__"])
-            is_ym_mode = "__year_month__" in spec_dims
-            dim_arg = ["__year_month__"] if is_ym_mode else ["__month__"]
+        for target in screen_plan.targets_of("chart"):
+            chart_key, path = target.key, target.path
+            if not path: continue
+            path = list(path)
+            series_defs = target.series
+            is_ym_mode = target.year_month
             temp_results: Dict[Any, Any] = {} if is_ym_mode else {i: {} for i in range(1, 13)}
 
-            for batch_idx, batch in enumerate(chart_batches):
+            for req_id in plan["chart"].get(chart_key, []):
                 try:
-                    combined_filters = (filters or {}).copy()
-                    if fixed_filters_per_batch:
-                        if batch_idx < len(fixed_filters_raw):
-                            ff = fixed_filters_raw[batch_idx]
-                            if isinstance(ff, dict):
-                                combined_filters.update(ff)
-                    elif isinstance(fixed_filters_raw, dict):
-                        combined_filters.update(fixed_filters_raw)
-
-                    build = self.qb.get_dataframe_query(batch, dim_arg, filters=combined_filters, page_filters=cfg.get("page_filter", []))
-                    if build and "query" in build:
-                        rows = await self._execute_query_cached(db_config, build["query"], self.DEFAULT_TTL_SECONDS)
+                    if req_id in plan["request_sql"]:
+                        rows = self._plan_rows(plan, results, req_id)
                         if not rows and db_config: continue
                         if rows:
                             for r in rows:
@@ -581,7 +1323,7 @@ class DataManager:
                     is_tooltip = s_def.get("role") == "tooltip"
                     if formula_str:
                         try:
-                            calc_func = eval(formula_str, {"__builtins__": {}}) if "lambda" in formula_str else None
+                            calc_func = compile_formula(formula_str) if "lambda" in formula_str else None
                             vals = []
                             for yk in sorted_yk:
                                 row = temp_results.get(yk, {})
@@ -615,7 +1357,7 @@ class DataManager:
                     is_tooltip = s_def.get("role") == "tooltip"
                     if formula_str:
                         try:
-                            calc_func = eval(formula_str, {"__builtins__": {}}) if "lambda" in formula_str else None
+                            calc_func = compile_formula(formula_str) if "lambda" in formula_str else None
                             vals = []
                             for m in range(1, 13):
                                 row = temp_results.get(m, {})
@@ -641,26 +1383,16 @@ class DataManager:
             if has_valid:
                 self._set_path(data, path + ["data"], chart_data)
 
-        for chart_key, spec in cfg.get("categorical_roadmap", {}).items():
-            path = inject_paths.get(chart_key)
+        for target in screen_plan.targets_of("categorical"):
+            chart_key, spec, path = target.key, target.spec, target.path
             if not path: continue
-            
-
-            if not isinstance(spec, dict):
-                print(f"⚠️ DataManager: spec para categorical '{chart_key}' no es dict (tipo: {type(spec).__name__}), skipping...")
-                continue
+            path = list(path)
 
             try:
-                combined_filters = (filters or {}).copy()
-                ff = spec.get("fixed_filters", {})
-                if isinstance(ff, dict):
-                    combined_filters.update(ff)
-                
-                dims = [spec.get("dimension")] if isinstance(spec.get("dimension"), str) else spec.get("dimensions", [])
+                dims = list(target.dimensions)
+                mets = list(target.metrics)
                 raw_mets = spec.get("metrics", [])
 
-                mets = raw_mets[0] if raw_mets and isinstance(raw_mets[0], list) else (raw_mets if isinstance(raw_mets, list) else [spec.get("kpi")] if spec.get("kpi") else [])
-
                 chart_data = {"labels": [], "values": [], "categories": [], "series": [{"name": "Valor", "data": []}]}
                 has_data = False
 
@@ -674,7 +1406,7 @@ class DataManager:
                     series_name = (value_col.get("series") or "Valor") if value_col else "Valor"
                     formula_str = value_col.get("formula") if value_col else None
                     value_key = value_col.get("key") if value_col else None
-                    calc_func = eval(formula_str, {"__builtins__": {}}) if formula_str and "lambda" in formula_str else None
+                    calc_func = compile_formula(formula_str) if formula_str and "lambda" in formula_str else None
 
                     if not dims:
                         pass
@@ -683,30 +1415,20 @@ class DataManager:
                         # run one query per group, then merge rows by dimension key.
                         # This avoids INNER JOIN blowup when metrics live in different tables.
                         if raw_mets and isinstance(raw_mets[0], list):
-                            all_mets = [m for sublist in raw_mets for m in sublist]
-                            _mfact = {}
-                            for mk in all_mets:
-                                m_def = self.qb.metrics.get(mk)
-                                if not m_def or m_def.get("type") in ("derived", "placeholder"): continue
-                                tbl = m_def.get("recipe", {}).get("table")
-                                if tbl: _mfact.setdefault(tbl, []).append(mk)
                             _rmap = {}
-                            for _grp in _mfact.values():
-                                _gb = self.qb.get_dataframe_query(_grp, dims, filters=combined_filters, page_filters=cfg.get("page_filter", []))
-                                if _gb and "query" in _gb:
-                                    _gr = await self._execute_query_cached(db_config, _gb["query"], self.DEFAULT_TTL_SECONDS)
+                            for _req in plan["categorical"].get(chart_key, []):
+                                if _req in plan["request_sql"]:
+                                    _gr = self._plan_rows(plan, results, _req)
                                     if _gr:
                                         for r in _gr:
                                             _rk = tuple(str(r.get(d, "")) for d in dims)
                                             _rmap.setdefault(_rk, {}).update(r)
                             rows = list(_rmap.values()) if _rmap else []
                         else:
-                            if not mets: rows = []
-                            else:
-                                build = self.qb.get_dataframe_query(mets, dims, filters=combined_filters, page_filters=cfg.get("page_filter", []))
-                                rows = []
-                                if build and "query" in build:
-                                    rows = await self._execute_query_cached(db_config, build["query"], self.DEFAULT_TTL_SECONDS) or []
+                            rows = []
+                            for _req in plan["categorical"].get(chart_key, []):
+                                if _req in plan["request_sql"]:
+                                    rows = self._plan_rows(plan, results, _req) or []
 
                         if not rows and db_config: continue
                         if rows:
@@ -770,7 +1492,7 @@ class DataManager:
                                         ec_key = ec.get("key")
                                         ec_name = ec.get("series") or ec.get("key", "Serie")
                                         ec_type = ec.get("type", "bar")
-                                        ec_calc = eval(ec_formula, {"__builtins__": {}}) if ec_formula and "lambda" in ec_formula else None
+                                        ec_calc = compile_formula(ec_formula) if ec_formula and "lambda" in ec_formula else None
                                         ec_by_lbl = {}
                                         for r, _ in computed_rows:
                                             lbl = str(r.get(label_key, "N/A")) if label_key else "N/A"
@@ -787,15 +1509,14 @@ class DataManager:
                                             chart_data["series"].append({"name": ec_name, "data": ec_data, "type": ec_type})
                 else:
 
-                    mets = [spec.get("kpi")] if isinstance(spec.get("kpi"), str) else mets
-                    build = self.qb.get_dataframe_query(mets, dims, filters=combined_filters, page_filters=cfg.get("page_filter", []))
-                    if build and "query" in build:
-                        rows = await self._execute_query_cached(db_config, build["query"], self.DEFAULT_TTL_SECONDS)
+                    _reqs = plan["categorical"].get(chart_key, [])
+                    if _reqs and _reqs[0] in plan["request_sql"]:
+                        rows = self._plan_rows(plan, results, _reqs[0])
                         if not rows and db_config: continue
                         if rows:
                             has_data = True
                             val_key = mets[0] if mets else "value"
-                            rows.sort(key=lambda x: self._clean_val(x.get(val_key, 0)), reverse=True)
+                            rows = sorted(rows, key=lambda x: self._clean_val(x.get(val_key, 0)), reverse=True)
                             for r in rows[:15]:
                                 lbl = "N/A"
                                 for k in r.keys():
@@ -814,154 +1535,45 @@ class DataManager:
                 pass
 
 
-        for table_key, spec in cfg.get("table_roadmap", {}).items():
-            path = inject_paths.get(table_key)
-            if not path: continue
-
-
-            if not isinstance(spec, dict):
-                print(f"⚠️ DataManager: spec para table '{table_key}' no es dict (tipo: {type(spec).__name__}), skipping...")
-                continue
+        for target in screen_plan.targets_of("table"):
+            if not target.path: continue
 
-            dims = spec.get("dimensions", [])
-            raw_mets = spec.get("metrics", [])
-
-            if raw_mets and isinstance(raw_mets[0], list):
-                mets = [m for batch in raw_mets for m in batch]
-            else:
-                mets = raw_mets if isinstance(raw_mets, list) else []
-            combined_filters = (filters or {}).copy()
-            combined_filters.update(spec.get("fixed_filters", {}))
-
-
-            metrics_by_fact = {}
-            for m_key in mets:
-                m_def = self.qb.metrics.get(m_key)
-                if not m_def or m_def.get("type") == "derived": continue
-                tbl = m_def.get("recipe", {}).get("table")
-                if tbl: metrics_by_fact.setdefault(tbl, []).append(m_key)
-
-            results_map = {}
-            has_data = False
-            
-            for fact_tbl, grp_mets in metrics_by_fact.items():
+            parts = []
+            for req_id in plan["table"].get(target.key, []):
                 try:
-                    build = self.qb.get_dataframe_query(grp_mets, dims, filters=combined_filters, page_filters=cfg.get("page_filter", []))
-                    if build and "query" in build:
-                        rows = await self._execute_query_cached(db_config, build["query"], self.DEFAULT_TTL_SECONDS)
-                        if not rows and db_config: continue
+                    if req_id in plan["request_sql"]:
+                        rows = self._plan_rows(plan, results, req_id)
                         if rows:
-                            has_data = True
-                            for r in rows:
-
-                                rk = tuple(r.get(d) for d in dims) if len(dims) > 1 else list(r.values())[0]
-                                results_map.setdefault(rk, {}).update(r)
+                            parts.append(rows)
                 except Exception:
                     pass
 
-            if not has_data: continue
-
-
-            col_totals = {}
-            temp_rows = []
-            
-            for row in results_map.values():
-
-                for m in mets:
-                    val = self._clean_val(row.get(m))
-                    row[m] = val
-                    if isinstance(val, (int, float)):
-                        col_totals[m] = col_totals.get(m, 0) + val
-                
-
-                for col in spec.get("columns", []):
-                    if "formula" in col:
-                        f_str = col["formula"]
-                        col_key = col.get("key") or (col.get("label") or "").strip().replace(" ", "_").replace(".", "_").lower() or ""
-                        if not col_key:
-                            continue
-                        try:
-
-                            raw_val = None
-                            if "lambda" in f_str:
-                                calc_func = eval(f_str, {"__builtins__": {}})
-                                raw_val = calc_func(row)
-                            else:
-                                raw_val = eval(f_str, {"__builtins__": {}}, row)
-
-
-                            
-
-                            if col.get("format") == "text":
-                                row[col_key] = str(raw_val) if raw_val is not None else ""
-                            
-
-                            elif isinstance(raw_val, str):
-                                try:
-                                    clean_test = raw_val.replace('%', '').replace('+', '').replace(',', '').replace('$', '').strip()
-                                    if not clean_test: raise ValueError()
-                                    float(clean_test)
-
-                                    row[col_key] = self._clean_val(raw_val)
-                                except ValueError:
-
-                                    row[col_key] = raw_val
-                            
-
-                            else:
-                                row[col_key] = self._clean_val(raw_val)
-
-                        except Exception:
-                            row[col_key] = "" if col.get("format") == "text" else 0.0
-
-                temp_rows.append(row)
+            if not parts: continue
 
-
-            for row in temp_rows:
-                for col in spec.get("columns", []):
-                    if "formula" in col:
-                        col_key = col.get("key") or (col.get("label") or "").strip().replace(" ", "_").replace(".", "_").lower() or ""
-                        if col_key:
-                            v = row.get(col_key)
-                            if isinstance(v, (int, float)):
-                                col_totals[col_key] = col_totals.get(col_key, 0) + v
-
-
-            headers = [c.get("label", "") for c in spec.get("columns", [])]
-            final_rows = []
-
-            for idx, row in enumerate(temp_rows):
-                disp = []
-                for col in spec.get("columns", []):
-                    if col.get("role") == "row_number":
-                        disp.append(str(idx + 1))
-                        continue
-                    ck = col.get("key") or (col.get("label") or "").strip().replace(" ", "_").replace(".", "_").lower() or ""
-                    val = row.get(ck)
-                    
-
-                    if col.get("is_total_ratio"):
-                        nk = col.get("numerator_key", ck)
-                        val = self._safe_divide(row.get(nk, 0), col_totals.get(nk, 0))
-                    
-
-                    f = col.get("format")
-                    if f == "currency": disp.append(self._format_val(val, "currency"))
-                    elif f == "percent": disp.append(f"{self._clean_val(val):.2%}")
-                    elif f == "integer": disp.append(f"{int(self._clean_val(val)):,}")
-                    else: disp.append(str(val) if val is not None else "")
-                
-                final_rows.append(disp)
-                
-            self._set_path(data, path, {"headers": headers, "rows": final_rows})
+            self._set_path(
+                data, list(target.path),
+                self._table_builder.build(target.spec, parts, list(target.dimensions), list(target.metrics)),
+            )
+        _add_query_cost("transform_seconds", time.perf_counter() - transform_started)
 
         if use_cache:
             self.cache[cache_key] = CacheEntry(data=data, ts=time.time())
         
         return data
 
+    @staticmethod
+    def _filter_where_column(spec: Dict[str, Any]) -> Optional[str]:
+        # Determine the actual WHERE column
+        where_col: Optional[str] = spec.get("where_column")
+        if not where_col:
+            cols = spec.get("columns", [])
+            # For concat filters use the last column (most specific);
+            # for single-column filters use the only column.
+            where_col = cols[-1] if cols else None
+        return where_col
+
     def _translate_filters(self, screen_id: str, filters: Dict, tenant_db: Any = None) -> Dict:
-        screen_map = self.get_screen_map(tenant_db or session.get("current_db"))
+        screen_map = self.get_screen_map(tenant_db if tenant_db is not None else session.get("current_db"))
         screen = screen_map.get(screen_id, {})
         filter_specs: Dict = screen.get("filters", {})
         if not filter_specs:
@@ -977,13 +1589,7 @@ class DataManager:
                 # Unknown key — pass as-is so QB qualifies it with fact table
                 translated[k] = v
                 continue
-            # Determine the actual WHERE column
-            where_col: Optional[str] = spec.get("where_column")
-            if not where_col:
-                cols = spec.get("columns", [])
-                # For concat filters use the last column (most specific);
-                # for single-column filters use the only column.
-                where_col = cols[-1] if cols else None
+            where_col = self._filter_where_column(spec)
             if where_col:
                 translated[where_col] = v
             else:
@@ -1061,6 +1667,43 @@ class DataManager:
         except Exception:
             pass
 
+    def _parse_dash_filters(self, fids: Optional[List[str]], vals: List[Any]) -> Dict[str, Any]:
+        out = {}
+        for i, fid in enumerate(fids or []):
+            if i >= len(vals):
+                break
+            val = vals[i]
+            # Strip the first dash-segment (page prefix, e.g. "ops", "bank")
+            # so "ops-tipo-unidad" → "tipo-unidad" and "ops-empresa" → "empresa".
+            # This avoids single-segment collisions like "ops-unidad" == "ops-tipo-unidad"
+            # which the old last-segment extraction produced.
+            parts = fid.split("-")
+            key = "-".join(parts[1:]) if len(parts) > 1 else fid
+            key = key.replace("__", ".")
+            if key == "year":
+                out["year"] = val if val else str(datetime.now().year)
+            elif key == "month":
+                out["month"] = val if val else self.MONTH_NAMES[datetime.now().month - 1]
+            elif val:
+                out[key] = val
+        return out
+
+    def _apply_period_defaults(self, filters: Dict[str, Any], fids: List[str]) -> Dict[str, Any]:
+        if any(f == "year" or f.endswith("-year") for f in fids) and "year" not in filters:
+            filters["year"] = str(datetime.now().year)
+        if any(f == "month" or f.endswith("-month") for f in fids) and "month" not in filters:
+            filters["month"] = self.MONTH_NAMES[datetime.now().month - 1]
+        return filters
+
+    def default_screen_filters(self, screen_id: str) -> Dict[str, Any]:
+        """Filtros con los que la UI abre la pantalla (periodo actual, sin filtros de
+        catálogo). Si la pantalla aún no registró sus callbacks se asume año + mes."""
+        fids = self._screen_filter_ids.get(screen_id)
+        if fids is None:
+            fids = ["year", "month"]
+        filters = self._parse_dash_filters(fids, [None] * len(fids))
+        return self._apply_period_defaults(filters, fids)
+
     def dash_ids(self, screen_id, prefix=None):
         base = f"{prefix}__{screen_id}" if prefix else screen_id
         return {
@@ -1069,6 +1712,7 @@ class DataManager:
             "kpi_store": f"{base}__kpi_st",
             "chart_store": f"{base}__cha_st",
             "table_store": f"{base}__tab_st",
+            "revalidate_interval": f"{base}__reval",
             "body": f"{base}__body"
         }
     
@@ -1081,7 +1725,9 @@ class DataManager:
             dcc.Store(id=ids["chart_store"], data=0),
             dcc.Store(id=ids["table_store"], data=0),
             dcc.Store(id=ids["token_store"], data=0),
-            dcc.Interval(id=ids["auto_interval"], interval=interval_ms, max_intervals=max_intervals)
+            dcc.Interval(id=ids["auto_interval"], interval=interval_ms, max_intervals=max_intervals),
+            # Sondeo mientras se revalida en segundo plano una pantalla servida "stale"
+            dcc.Interval(id=ids["revalidate_interval"], interval=self.REVALIDATE_POLL_MS, disabled=True),
         ], ids
 
     def register_dash_refresh_callbacks(
@@ -1102,9 +1748,9 @@ class DataManager:
         apply_trigger_id  → Input adicional: clic en botón "Aplicar" dispara el refresh
                             (necesario cuando se usan manual_filter_ids).
         """
-        from dash import callback, Input, Output, State
+        from dash import callback, ctx, Input, Output, State
         ids = self.dash_ids(screen_id, prefix=prefix)
-        inputs = [Input(ids["auto_interval"], "n_intervals")]
+        inputs = [Input(ids["auto_interval"], "n_intervals"), Input(ids["revalidate_interval"], "n_intervals")]
         if filter_ids:
             inputs.extend([Input(fid, "value") for fid in filter_ids])
         if apply_trigger_id:
@@ -1113,35 +1759,13 @@ class DataManager:
         if manual_filter_ids:
             state.extend([State(fid, "value") for fid in manual_filter_ids])
 
-        _MONTH_NAMES = (
-            "enero", "febrero", "marzo", "abril", "mayo", "junio",
-            "julio", "agosto", "septiembre", "octubre", "noviembre", "diciembre"
-        )
-
-        def _parse_filter_list(fids, vals):
-            out = {}
-            for i, fid in enumerate(fids or []):
-                if i >= len(vals):
-                    break
-                val = vals[i]
-                # Strip the first dash-segment (page prefix, e.g. "ops", "bank")
-                # so "ops-tipo-unidad" → "tipo-unidad" and "ops-empresa" → "empresa".
-                # This avoids single-segment collisions like "ops-unidad" == "ops-tipo-unidad"
-                # which the old last-segment extraction produced.
-                parts = fid.split("-")
-                key = "-".join(parts[1:]) if len(parts) > 1 else fid
-                key = key.replace("__", ".")
-                if key == "year":
-                    out["year"] = val if val else str(datetime.now().year)
-                elif key == "month":
-                    out["month"] = val if val else _MONTH_NAMES[datetime.now().month - 1]
-                elif val:
-                    out[key] = val
-            return out
+        # El pre-calentador de caché reconstruye la vista por defecto con estos ids
+        self._screen_filter_ids[screen_id] = (filter_ids or []) + (manual_filter_ids or [])
 
         outputs = [Output(ids["token_store"], "data")]
         if global_token_output_id:
             outputs.append(Output(global_token_output_id, "data", allow_duplicate=True))
+        outputs.append(Output(ids["revalidate_interval"], "disabled"))
 
         n_filter  = len(filter_ids)        if filter_ids        else 0
         n_apply   = 1                      if apply_trigger_id  else 0
@@ -1149,32 +1773,34 @@ class DataManager:
 
         prevent_initial = "initial_duplicate" if global_token_output_id else False
         @callback(outputs, inputs, state, prevent_initial_call=prevent_initial)
-        async def _auto_refresh(n_intervals, *args):
+        async def _auto_refresh(n_intervals, n_revalidate, *args):
             filter_values  = list(args[:n_filter])
             # apply_click sits between filter_ids and state args
             manual_values  = list(args[n_filter + n_apply + 1 : n_filter + n_apply + 1 + n_manual])
             selected_db    = args[n_filter + n_apply] if len(args) > n_filter + n_apply else None
 
-            filters = _parse_filter_list(filter_ids, filter_values)
+            filters = self._parse_dash_filters(filter_ids, filter_values)
             # manual filters: merge but do NOT override auto filter values
-            manual_filters = _parse_filter_list(manual_filter_ids, manual_values)
+            manual_filters = self._parse_dash_filters(manual_filter_ids, manual_values)
             for k, v in manual_filters.items():
                 if k not in filters:
                     filters[k] = v
-
-            all_fids = (filter_ids or []) + (manual_filter_ids or [])
-            if any(f == "year" or f.endswith("-year") for f in all_fids) and "year" not in filters:
-                filters["year"] = str(datetime.now().year)
-            if any(f == "month" or f.endswith("-month") for f in all_fids) and "month" not in filters:
-                filters["month"] = _MONTH_NAMES[datetime.now().month - 1]
+            self._apply_period_defaults(filters, (filter_ids or []) + (manual_filter_ids or []))
+            screen_data = None
             try:
-                await self.refresh_screen(screen_id, filters=filters, use_cache=True, db_config=selected_db)
+                screen_data = await self.refresh_screen(screen_id, filters=filters, use_cache=True, db_config=selected_db)
             except Exception as e:
                 print(f"⚠️ DataManager [{screen_id}]: error en refresh, usando caché si existe — {e}")
+            freshness = screen_data.get("_freshness", {}) if isinstance(screen_data, dict) else {}
+            revalidating = freshness.get("status") == "revalidating"
+
             token_data = json.dumps(filters)
+            if revalidating and ctx.triggered_id == ids["revalidate_interval"]:
+                # Sigue en segundo plano: no re-renderizar el mismo dato stale en cada sondeo
+                token_data = no_update
             if global_token_output_id:
-                return [token_data, token_data]
-            return token_data
+                return [token_data, token_data, not revalidating]
+            return [token_data, not revalidating]
 
         @callback(Output(body_output_id, "children"), Input(ids["token_store"], "data"))
         def _rerender(token_data):
@@ -1199,6 +1825,12 @@ class DataManager:
 
             content = render_body(screen_data)
 
+            freshness = screen_data.get("_freshness", {}) if isinstance(screen_data, dict) else {}
+            if freshness.get("status") in ("stale", "revalidating"):
+                updated = datetime.fromtimestamp(freshness.get("updated_at") or time.time()).strftime("%H:%M")
+                badge = html.Div(f"Actualizando… (datos de las {updated})", className="data-freshness-badge")
+                return html.Div([badge, content], className="page-content-loaded")
+
             return html.Div(content, className="page-content-loaded")
 
         # Skeleton feedback: fires immediately when filters change (before async data fetch)
@@ -1243,7 +1875,8 @@ class DataManager:
         if not col_parts:
             return []
 
-        tables_meta = self.qb.tables
+        qb = get_query_builder(tenant_key)
+        tables_meta = qb.tables
         seen_tbls: List[str] = []
         for tbl, _ in col_parts:
             if tbl not in seen_tbls:
@@ -1261,7 +1894,7 @@ class DataManager:
         for tbl in seen_tbls[:-1]:
             if tbl in processed:
                 continue
-            path = self.qb._find_join_path(from_tbl, tbl)
+            path = qb._find_join_path(from_tbl, tbl)
             if path:
                 for next_alias, join_def in path:
                     if next_alias in processed:
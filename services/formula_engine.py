@@ -0,0 +1,308 @@
+"""
+Fórmulas de screens.json compiladas una sola vez y ejecutadas en un sandbox.
+
+Dos formas, como hasta ahora:
+    "lambda r: r['ingreso'] / r['viajes'] if r.get('viajes') else 0"  → se llama con la fila
+    "(ingreso or 0) / (viajes or 1) if viajes else 0"                  → nombres = claves de la fila
+
+compile_formula() valida el AST contra una lista blanca (aritmética, comparaciones,
+and/or/not, if-else, r['k'], r.get('k', d), f-strings y abs/min/max/round), lo compila
+y lo guarda por texto; refresh_screen ya no llama eval() por fila ni por refresco.
+Una fórmula rechazada no se ejecuta: al llamarla lanza FormulaError y los llamadores
+la tratan como cualquier error de fórmula (valor 0 / vacío).
+
+Formula.evaluate_columns() es el modo vectorizado: evalúa la fórmula sobre columnas
+NumPy completas con la misma semántica fila a fila (short-circuit de and/or/if incluido);
+las filas donde la versión por fila habría fallado (división entre cero) quedan en NaN.
+"""
+import ast
+import operator
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+SAFE_FUNCTIONS: Dict[str, Callable[..., Any]] = {"abs": abs, "min": min, "max": max, "round": round}
+
+_ALLOWED_NODES = (
+    ast.Expression, ast.Lambda, ast.arguments, ast.arg, ast.Load,
+    ast.Constant, ast.Name, ast.Attribute, ast.Subscript, ast.Call,
+    ast.BinOp, ast.UnaryOp, ast.BoolOp, ast.Compare, ast.IfExp,
+    ast.JoinedStr, ast.FormattedValue,
+    ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow,
+    ast.USub, ast.UAdd, ast.Not, ast.And, ast.Or,
+    ast.Eq, ast.NotEq, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.In, ast.NotIn, ast.Is, ast.IsNot,
+)
+
+_VEC_BINOPS = {
+    ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply,
+    ast.Div: np.true_divide, ast.FloorDiv: np.floor_divide, ast.Mod: np.mod,
+}
+_VEC_COMPARE = {
+    ast.Eq: operator.eq, ast.NotEq: operator.ne, ast.Lt: operator.lt,
+    ast.LtE: operator.le, ast.Gt: operator.gt, ast.GtE: operator.ge,
+}
+_VEC_FUNCTIONS = {"abs": np.abs, "min": np.minimum, "max": np.maximum}
+
+
+class FormulaError(ValueError):
+    pass
+
+
+class _Validator(ast.NodeVisitor):
+    """Recorre el AST: rechaza lo que no está en la lista blanca, junta las claves de la
+    fila que usa la fórmula y decide si admite el modo vectorizado."""
+
+    def __init__(self, arg: Optional[str]) -> None:
+        self.arg = arg
+        self.fields: List[str] = []
+        self.vectorizable = True
+
+    def _field(self, key: str) -> None:
+        if key not in self.fields:
+            self.fields.append(key)
+
+    def _row_key(self, node: ast.AST) -> str:
+        if not (isinstance(node, ast.Constant) and isinstance(node.value, str)):
+            raise FormulaError("las claves de la fila deben ser texto literal")
+        return node.value
+
+    def _is_row(self, node: ast.AST) -> bool:
+        return self.arg is not None and isinstance(node, ast.Name) and node.id == self.arg
+
+    def generic_visit(self, node: ast.AST) -> None:
+        if not isinstance(node, _ALLOWED_NODES):
+            raise FormulaError(f"expresión no permitida: {type(node).__name__}")
+        super().generic_visit(node)
+
+    def visit_Lambda(self, node: ast.Lambda) -> None:
+        raise FormulaError("lambda anidada no permitida")
+
+    def visit_Name(self, node: ast.Name) -> None:
+        if node.id.startswith("__"):
+            raise FormulaError(f"nombre no permitido: {node.id}")
+        if self._is_row(node):
+            raise FormulaError(f"'{self.arg}' sólo admite {self.arg}['clave'] o {self.arg}.get(...)")
+        if node.id in SAFE_FUNCTIONS:
+            raise FormulaError(f"'{node.id}' sólo puede llamarse")
+        if self.arg is not None:
+            raise FormulaError(f"nombre desconocido: {node.id}")
+        self._field(node.id)
+
+    def visit_Attribute(self, node: ast.Attribute) -> None:
+        raise FormulaError("acceso a atributos no permitido")
+
+    def visit_Subscript(self, node: ast.Subscript) -> None:
+        if not self._is_row(node.value):
+            raise FormulaError("sólo se permite indexar la fila")
+        self._field(self._row_key(node.slice))
+
+    def visit_Call(self, node: ast.Call) -> None:
+        if node.keywords:
+            raise FormulaError("argumentos con nombre no permitidos")
+        func = node.func
+        if isinstance(func, ast.Attribute) and func.attr == "get" and self._is_row(func.value):
+            if not 1 <= len(node.args) <= 2:
+                raise FormulaError("get() recibe clave y default opcional")
+            self._field(self._row_key(node.args[0]))
+            for a in node.args[1:]:
+                self.visit(a)
+            return
+        if isinstance(func, ast.Name) and func.id in SAFE_FUNCTIONS:
+            if func.id not in _VEC_FUNCTIONS or (func.id != "abs" and len(node.args) < 2):
+                self.vectorizable = False
+            for a in node.args:
+                self.visit(a)
+            return
+        raise FormulaError("sólo se permiten r.get() y abs/min/max/round")
+
+    def visit_Constant(self, node: ast.Constant) -> None:
+        if not isinstance(node.value, (int, float)):
+            self.vectorizable = False
+
+    def visit_BinOp(self, node: ast.BinOp) -> None:
+        if type(node.op) not in _VEC_BINOPS:
+            self.vectorizable = False
+        self.generic_visit(node)
+
+    def visit_Compare(self, node: ast.Compare) -> None:
+        if any(type(op) not in _VEC_COMPARE for op in node.ops):
+            self.vectorizable = False
+        self.generic_visit(node)
+
+    def visit_JoinedStr(self, node: ast.JoinedStr) -> None:
+        self.vectorizable = False
+        self.generic_visit(node)
+
+
+class Formula:
+    """Fórmula compilada. formula(fila) equivale al eval() anterior; fields son las
+    claves de la fila que lee."""
+
+    __slots__ = ("text", "is_lambda", "fields", "vectorizable", "error", "_fn", "_body")
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.is_lambda = False
+        self.fields: Tuple[str, ...] = ()
+        self.vectorizable = False
+        self.error: Optional[str] = None
+        self._fn: Optional[Callable[[Mapping[str, Any]], Any]] = None
+        self._body: Optional[ast.AST] = None
+        try:
+            tree = ast.parse(text.strip(), mode="eval")
+            body = tree.body
+            arg = None
+            if isinstance(body, ast.Lambda):
+                a = body.args
+                if a.posonlyargs or a.kwonlyargs or a.vararg or a.kwarg or a.defaults or len(a.args) != 1:
+                    raise FormulaError("la lambda debe recibir exactamente un argumento (la fila)")
+                arg = a.args[0].arg
+                body = body.body
+            validator = _Validator(arg)
+            validator.visit(body)
+            env = {"__builtins__": SAFE_FUNCTIONS}
+            code = compile(tree, "<formula>", "eval")
+            if arg is not None:
+                self._fn = eval(code, env)
+            else:
+                self._fn = lambda row: eval(code, env, row)
+            self.is_lambda = arg is not None
+            self.fields = tuple(validator.fields)
+            self.vectorizable = validator.vectorizable
+            self._body = body
+        except (SyntaxError, FormulaError, ValueError) as e:
+            self.error = str(e) or type(e).__name__
+
+    def __call__(self, row: Mapping[str, Any]) -> Any:
+        if self._fn is None:
+            raise FormulaError(self.error or "fórmula inválida")
+        return self._fn(row)
+
+    def evaluate_columns(self, columns: Mapping[str, np.ndarray], length: int) -> Optional[np.ndarray]:
+        """
+        Modo vectorizado: columns tiene un arreglo float64 de length elementos por cada
+        clave de fields, con todas las filas presentes y numéricas (ver numeric_columns). Devuelve un float64
+        por fila, NaN donde la evaluación fila a fila habría lanzado error; None si la
+        fórmula no es vectorizable.
+        """
+        if not self.vectorizable or self._body is None:
+            return None
+        if any(f not in columns for f in self.fields):
+            return None
+        with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+            values, errors = _vec(self._body, columns, length)
+            out = np.array(np.broadcast_to(values, (length,)), dtype=np.float64)
+        out[errors] = np.nan
+        return out
+
+
+def _truthy(values: np.ndarray) -> np.ndarray:
+    return values != 0
+
+
+def _vec(node: ast.AST, cols: Mapping[str, np.ndarray], n: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(valores, máscara de error) de un nodo; and/or/if sólo propagan el error de la rama tomada."""
+    no_error = np.zeros(n, dtype=bool)
+    if isinstance(node, ast.Constant):
+        return np.full(n, float(node.value)), no_error
+    if isinstance(node, ast.Name):
+        return cols[node.id], no_error
+    if isinstance(node, ast.Subscript):
+        return cols[node.slice.value], no_error  # type: ignore[attr-defined]
+    if isinstance(node, ast.Call):
+        if isinstance(node.func, ast.Attribute):
+            return cols[node.args[0].value], no_error  # type: ignore[attr-defined]
+        parts = [_vec(a, cols, n) for a in node.args]
+        fn = _VEC_FUNCTIONS[node.func.id]  # type: ignore[attr-defined]
+        values = parts[0][0] if fn is not np.abs else np.abs(parts[0][0])
+        for v, _ in parts[1:]:
+            values = fn(values, v)
+        return values, np.logical_or.reduce([e for _, e in parts])
+    if isinstance(node, ast.UnaryOp):
+        v, e = _vec(node.operand, cols, n)
+        if isinstance(node.op, ast.Not):
+            return (~_truthy(v)).astype(np.float64), e
+        return (-v if isinstance(node.op, ast.USub) else v), e
+    if isinstance(node, ast.BinOp):
+        lv, le = _vec(node.left, cols, n)
+        rv, re_ = _vec(node.right, cols, n)
+        op = type(node.op)
+        if op in (ast.Div, ast.FloorDiv, ast.Mod):
+            zero = rv == 0
+            return _VEC_BINOPS[op](lv, np.where(zero, 1.0, rv)), le | re_ | zero
+        return _VEC_BINOPS[op](lv, rv), le | re_
+    if isinstance(node, ast.BoolOp):
+        values, errors = _vec(node.values[0], cols, n)
+        is_or = isinstance(node.op, ast.Or)
+        for sub in node.values[1:]:
+            decided = _truthy(values) if is_or else ~_truthy(values)
+            v, e = _vec(sub, cols, n)
+            values = np.where(decided, values, v)
+            errors = errors | (~decided & e)
+        return values, errors
+    if isinstance(node, ast.Compare):
+        left, errors = _vec(node.left, cols, n)
+        result = np.ones(n, dtype=bool)
+        for op, comparator in zip(node.ops, node.comparators):
+            right, e = _vec(comparator, cols, n)
+            errors = errors | (result & e)
+            result = result & _VEC_COMPARE[type(op)](left, right)
+            left = right
+        return result.astype(np.float64), errors
+    if isinstance(node, ast.IfExp):
+        test, te = _vec(node.test, cols, n)
+        body, be = _vec(node.body, cols, n)
+        orelse, oe = _vec(node.orelse, cols, n)
+        taken = _truthy(test)
+        return np.where(taken, body, orelse), te | np.where(taken, be, oe)
+    raise FormulaError(f"no vectorizable: {type(node).__name__}")
+
+
+def numeric_columns(rows: List[Mapping[str, Any]], fields: Iterable[str]) -> Optional[Dict[str, np.ndarray]]:
+    """Columnas float64 de fields si todas las filas las traen con valor numérico; si no, None
+    (la fórmula se evalúa fila a fila: un KeyError o None fallaría distinto por fila)."""
+    columns: Dict[str, np.ndarray] = {}
+    for field in fields:
+        values = []
+        for row in rows:
+            v = row.get(field)
+            if not isinstance(v, (int, float)):
+                return None
+            values.append(v)
+        columns[field] = np.array(values, dtype=np.float64)
+    return columns
+
+
+_compiled: Dict[str, Formula] = {}
+_compiled_lock = threading.Lock()
+
+
+def compile_formula(text: str) -> Formula:
+    """Fórmula compilada y cacheada por texto."""
+    formula = _compiled.get(text)
+    if formula is None:
+        formula = Formula(text)
+        with _compiled_lock:
+            formula = _compiled.setdefault(text, formula)
+    return formula
+
+
+def precompile_formulas(config: Any) -> List[Tuple[str, str]]:
+    """Compila todas las "formula" de una configuración de pantallas; devuelve
+    [(texto, error)] de las rechazadas."""
+    rejected: List[Tuple[str, str]] = []
+    stack = [config]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            for key, value in node.items():
+                if key == "formula" and isinstance(value, str):
+                    formula = compile_formula(value)
+                    if formula.error:
+                        rejected.append((value, formula.error))
+                else:
+                    stack.append(value)
+        elif isinstance(node, list):
+            stack.extend(node)
+    return rejected
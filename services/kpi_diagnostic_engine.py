@@ -8,8 +8,9 @@ import logging
 from dataclasses import dataclass, field
 from typing import Any, Dict, List, Optional
 
-from dashboard_core.query_builder import SmartQueryBuilder
-from dashboard_core.db_helper import _execute_dynamic_query_sync
+from dashboard_core.query_builder import get_query_builder
+from dashboard_core.db_helper import QuerySlotTimeout, _execute_dynamic_query_sync, get_dialect
+from dashboard_core.sql_query import query_cache_text
 
 from services.widget_catalog_service import WidgetDefinition
 
@@ -64,7 +65,8 @@ def run_mode(
     mode: aggregate | timeseries | breakdown | detail | meta_compare
     """
     filters = _sanitize_filters(filters)
-    qb = SmartQueryBuilder(tenant_db=tenant_db)
+    # El SQL se compila para el motor de db_name (SQL Server, o la BD local registrada)
+    qb = get_query_builder(tenant_db, dialect=get_dialect(db_name))
     metrics = list(widget_definition.metric_keys) or []
     if not metrics and widget_definition.primary_metric:
         metrics = [widget_definition.primary_metric]
@@ -84,7 +86,7 @@ def run_mode(
         dims = list(widget_definition.dimensions) or []
         build = qb.get_dataframe_query(metrics, dims, filters=combined_filters)
         if build and build.get("query"):
-            build["query"] = build["query"].rstrip() + f" ORDER BY 1 OFFSET 0 ROWS FETCH NEXT {max(1, min(limit, 500))} ROWS ONLY"
+            build["query"] = build["query"].append(qb.dialect.limit_clause(max(1, min(limit, 500))))
     elif mode == "meta_compare":
         primary = widget_definition.primary_metric
         meta_key = widget_definition.meta_metric_key
@@ -93,16 +95,19 @@ def run_mode(
         agg_actual = qb.get_dataframe_query([primary], [], filters=combined_filters)
         rows_actual = []
         query_actual = None
-        if agg_actual and agg_actual.get("query"):
-            query_actual = agg_actual["query"]
-            rows_actual = _execute_dynamic_query_sync(db_name, query_actual)
         rows_meta = []
         query_meta = None
-        if meta_key:
-            agg_meta = qb.get_dataframe_query([meta_key], [], filters=combined_filters)
-            if agg_meta and agg_meta.get("query"):
-                query_meta = agg_meta["query"]
-                rows_meta = _execute_dynamic_query_sync(db_name, query_meta)
+        try:
+            if agg_actual and agg_actual.get("query"):
+                query_actual = agg_actual["query"]
+                rows_actual = _execute_dynamic_query_sync(db_name, query_actual)
+            if meta_key:
+                agg_meta = qb.get_dataframe_query([meta_key], [], filters=combined_filters)
+                if agg_meta and agg_meta.get("query"):
+                    query_meta = agg_meta["query"]
+                    rows_meta = _execute_dynamic_query_sync(db_name, query_meta)
+        except QuerySlotTimeout as e:
+            return {"mode": mode, "rows": [], "query_executed": None, "error": str(e)}
         out_rows = []
         if rows_actual:
             row = dict(rows_actual[0])
@@ -117,8 +122,8 @@ def run_mode(
         return {
             "mode": mode,
             "rows": out_rows,
-            "query_executed": query_actual or query_meta,
-            "queries": [q for q in [query_actual, query_meta] if q],
+            "query_executed": query_cache_text(query_actual or query_meta) if (query_actual or query_meta) else None,
+            "queries": [query_cache_text(q) for q in [query_actual, query_meta] if q],
         }
     else:
         return {"mode": mode, "rows": [], "query_executed": None, "error": f"Modo no soportado: {mode}"}
@@ -141,8 +146,8 @@ def run_mode(
         )
     except Exception as e:
         logger.exception("KPIDiagnosticEngine run_mode failed: %s", e)
-        return {"mode": mode, "rows": [], "query_executed": query, "error": str(e)}
-    return {"mode": mode, "rows": rows or [], "query_executed": query}
+        return {"mode": mode, "rows": [], "query_executed": query_cache_text(query), "error": str(e)}
+    return {"mode": mode, "rows": list(rows or []), "query_executed": query_cache_text(query)}
 
 
 def run_diagnostic(
@@ -168,6 +173,7 @@ def run_diagnostic(
         if out.get("query_executed"):
             query_count += 1
             result.queries_executed.append(out["query_executed"])
+        # Texto + parámetros (query_cache_text): sólo se omite la misma query con los mismos valores
         for q in out.get("queries") or []:
             if q and q not in result.queries_executed:
                 query_count += 1
@@ -0,0 +1,143 @@
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from dashboard_core.result_set import ResultSet
+
+
+def _norm(value: Any) -> str:
+    # SQL Server compara sin distinguir mayúsculas ni espacios finales
+    return str(value).strip().casefold()
+
+
+def period_index(iso_date: str) -> int:
+    """'YYYY-MM-DD' -> índice de mes (año * 12 + mes - 1)."""
+    return int(iso_date[:4]) * 12 + int(iso_date[5:7]) - 1
+
+
+def _float_column(rs: ResultSet, name: str) -> np.ndarray:
+    """Columna numérica como float64 con NaN en los nulos (o en toda la columna si falta)."""
+    if name not in rs.columns:
+        return np.full(len(rs), np.nan)
+    column = rs.column(name)
+    if isinstance(column, list):
+        return np.array([np.nan if v is None else float(v) for v in column], dtype=np.float64)
+    return column.astype(np.float64, copy=False)
+
+
+class ScreenCube:
+    """
+    Bloque columnar en memoria con el resultado (ResultSet) de SmartQueryBuilder.get_cube_query:
+    una fila por (año, mes, columnas de filtro) y medidas aditivas (SUM / COUNT).
+
+    Las columnas de filtro se codifican como enteros (un código por valor distinto) y
+    las medidas como float64, así cualquier combinación de filtros se resuelve con
+    máscaras booleanas y np.bincount / np.unique, sin volver a la BD.
+    """
+
+    def __init__(
+        self,
+        rows: List[Dict[str, Any]],
+        columns: Sequence[str],
+        measures: Dict[str, Tuple[str, str]],
+        *,
+        date_from: str,
+        date_to: str,
+        ignored_columns: Sequence[str] = (),
+    ) -> None:
+        rs = ResultSet.from_rows(rows)
+        n = len(rs)
+        self.size = n
+        self.start = period_index(date_from)
+        self.end = period_index(date_to)
+        # alias -> agregación, y (agregación, columna) -> alias para resolver métricas
+        self.measure_aggs = {alias: agg for alias, (agg, _) in measures.items()}
+        self.measure_index = {spec: alias for alias, spec in measures.items()}
+        self.ignored_columns = frozenset(ignored_columns)
+
+        years = np.nan_to_num(_float_column(rs, "anio"), nan=0.0).astype(np.int32)
+        months = np.nan_to_num(_float_column(rs, "mes"), nan=1.0).astype(np.int32)
+        self.periods = years * 12 + months - 1
+        self.codes: Dict[str, np.ndarray] = {}
+        self.labels: Dict[str, List[Any]] = {}
+        self._lookup: Dict[str, Dict[str, List[int]]] = {}
+        for col in columns:
+            index: Dict[Any, int] = {}
+            labels: List[Any] = []
+            codes = np.empty(n, dtype=np.int32)
+            for i, v in enumerate(rs.values(col)):
+                code = index.get(v)
+                if code is None:
+                    code = index[v] = len(labels)
+                    labels.append(v)
+                codes[i] = code
+            lookup: Dict[str, List[int]] = {}
+            for code, v in enumerate(labels):
+                if v is not None:
+                    lookup.setdefault(_norm(v), []).append(code)
+            self.codes[col] = codes
+            self.labels[col] = labels
+            self._lookup[col] = lookup
+
+        self.values: Dict[str, np.ndarray] = {alias: _float_column(rs, alias) for alias in measures}
+
+    def covers(self, start: int, end: int) -> bool:
+        return self.start <= start and end <= self.end
+
+    def mask(self, start: int, end: int, filters: Dict[str, Any]) -> np.ndarray:
+        """Filas del cubo dentro de [start, end) que cumplen los filtros (igualdad o lista IN)."""
+        m = (self.periods >= start) & (self.periods < end)
+        for col, value in filters.items():
+            wanted = value if isinstance(value, list) else [value]
+            allowed = [code for v in wanted for code in self._lookup[col].get(_norm(v), [])]
+            m &= np.isin(self.codes[col], allowed)
+        return m
+
+    def _reduce(self, alias: str, values: np.ndarray) -> Any:
+        valid = ~np.isnan(values)
+        if self.measure_aggs[alias] == "COUNT":
+            return int(values[valid].sum())
+        # SUM sin filas (o sólo NULLs) es NULL en SQL
+        return float(values[valid].sum()) if valid.any() else None
+
+    def aggregate(
+        self, mask: np.ndarray, outputs: Dict[str, str], group_by: Sequence[Tuple[str, str]] = ()
+    ) -> List[Dict[str, Any]]:
+        """
+        outputs: {clave de salida: alias de medida}.
+        group_by: [(clave de salida, columna)], con "__month__" como columna = mes del año.
+        Sin group_by devuelve una sola fila (como un agregado SQL sin GROUP BY).
+        """
+        if not group_by:
+            return [{key: self._reduce(alias, self.values[alias][mask]) for key, alias in outputs.items()}]
+        if not mask.any():
+            return []
+
+        keys = [
+            (self.periods[mask] % 12) + 1 if col == "__month__" else self.codes[col][mask]
+            for _, col in group_by
+        ]
+        groups, inverse = np.unique(np.stack(keys, axis=1), axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        n_groups = len(groups)
+
+        reduced: Dict[str, List[Any]] = {}
+        for key, alias in outputs.items():
+            values = self.values[alias][mask]
+            valid = ~np.isnan(values)
+            sums = np.bincount(inverse, weights=np.where(valid, values, 0.0), minlength=n_groups)
+            if self.measure_aggs[alias] == "COUNT":
+                reduced[key] = [int(v) for v in sums]
+            else:
+                non_null = np.bincount(inverse, weights=valid, minlength=n_groups)
+                reduced[key] = [float(v) if c else None for v, c in zip(sums, non_null)]
+
+        rows = []
+        for g, group in enumerate(groups):
+            row: Dict[str, Any] = {}
+            for (out_key, col), code in zip(group_by, group):
+                row[out_key] = int(code) if col == "__month__" else self.labels[col][code]
+            for key in outputs:
+                row[key] = reduced[key][g]
+            rows.append(row)
+        return rows
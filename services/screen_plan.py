@@ -0,0 +1,325 @@
+"""
+Plan de ejecución compilado de una pantalla de screens.json.
+
+refresh_screen reinterpretaba el dict de configuración en cada llamada: detectar
+batches de métricas (lista de listas), repartir fixed_filters por batch, agrupar
+métricas por tabla de hechos, resolver inject_paths y elegir el formato de cada KPI
+por nombre. compile_screen_plan hace ese trabajo una vez por (tenant, pantalla,
+versión de configuración y de metadata) y devuelve un ScreenPlan inmutable, un DAG:
+
+    QueryNode   solicitud de métricas (métricas, dimensiones, fixed_filters); sólo le
+                faltan los filtros de la llamada para convertirse en SQL
+    TargetNode  transformación que consume QueryNodes (inputs) y escribe en su path
+                (kpi / chart / categorical / table, en el orden de inyección)
+
+DataManager cachea el plan y en cada refresco sólo instancia las solicitudes con los
+filtros (ScreenPlan.requests), las fusiona y ejecuta, y recorre los targets.
+"""
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+PathTuple = Tuple[Any, ...]
+
+TARGET_KINDS = ("kpi", "chart", "categorical", "table")
+
+# Formato de los KPI según su clave (penúltimo elemento del path)
+_COUNT_KPIS = frozenset((
+    "total_trips", "total_kilometers", "units_used", "customers_served", "real_kilometers",
+    "workshop_entries", "items_registered", "items_with_stock", "items_without_stock",
+))
+_DECIMAL_KPIS = frozenset(("real_yield", "liters_consumed", "avg_collection_days", "average_payment_days"))
+_PERCENT_KPIS = frozenset(("availability_percent", "compliance_level"))
+_DAYS_KPIS = frozenset(("avg_collection_days", "average_payment_days"))
+_VOLUME_LEAVES = frozenset(("trips_meta", "trips_previous", "trips_ytd", "kms_meta", "kms_anterior", "kms_ytd", "kms_valor"))
+
+
+@dataclass(frozen=True)
+class QueryNode:
+    id: int
+    metrics: Tuple[str, ...]
+    dimensions: Tuple[str, ...]
+    fixed_filters: Mapping[str, Any] = field(default_factory=lambda: MappingProxyType({}))
+    page_filters: Tuple[Any, ...] = ()
+
+    def request(self, filters: Optional[Dict]) -> Dict[str, Any]:
+        """Solicitud para plan_fused_queries: filtros de la llamada + fixed_filters."""
+        combined = (filters or {}).copy()
+        combined.update(self.fixed_filters)
+        return {
+            "id": self.id,
+            "metrics": list(self.metrics),
+            "dimensions": list(self.dimensions),
+            "filters": combined,
+            "page_filters": list(self.page_filters),
+        }
+
+
+@dataclass(frozen=True)
+class KpiOutput:
+    """Una columna de kpi_roadmap: valor (fórmula o clave) y los textos derivados.
+    derived: (path, operación, argumento) con operación "format" | "delta" | "const"."""
+    path: PathTuple
+    formula: Optional[str]
+    key: Optional[str]
+    derived: Tuple[Tuple[PathTuple, str, Any], ...] = ()
+
+
+@dataclass(frozen=True)
+class TargetNode:
+    kind: str
+    key: str
+    path: Optional[PathTuple]
+    spec: Mapping[str, Any] = field(repr=False)
+    inputs: Tuple[int, ...] = ()
+    dimensions: Tuple[str, ...] = ()
+    metrics: Tuple[str, ...] = ()
+    # kpi: (batch, id de QueryNode) y columnas compiladas
+    batches: Tuple[Tuple[Tuple[str, ...], int], ...] = ()
+    outputs: Tuple[KpiOutput, ...] = ()
+    # chart: series y modo año-mes
+    series: Tuple[Mapping[str, Any], ...] = ()
+    year_month: bool = False
+
+
+@dataclass(frozen=True)
+class ScreenPlan:
+    screen_id: str
+    tenant: str
+    meta_version: str
+    queries: Tuple[QueryNode, ...]
+    targets: Tuple[TargetNode, ...]
+    source: Any = field(default=None, compare=False, repr=False)  # cfg de origen (identidad)
+
+    def requests(self, filters: Optional[Dict]) -> List[Dict[str, Any]]:
+        return [q.request(filters) for q in self.queries]
+
+    def targets_of(self, kind: str) -> Tuple[TargetNode, ...]:
+        return tuple(t for t in self.targets if t.kind == kind)
+
+    def consumers(self) -> Dict[int, Tuple[str, ...]]:
+        """Aristas del DAG: QueryNode.id → "tipo:clave" de los targets que lo leen."""
+        out: Dict[int, List[str]] = {q.id: [] for q in self.queries}
+        for t in self.targets:
+            for q_id in t.inputs:
+                out[q_id].append(f"{t.kind}:{t.key}")
+        return {q_id: tuple(names) for q_id, names in out.items()}
+
+    def is_valid_for(self, cfg: Any, meta_version: str) -> bool:
+        return self.source is cfg and self.meta_version == meta_version
+
+
+def _flat_metrics(raw: Any) -> List[str]:
+    if raw and isinstance(raw[0], list):
+        return [m for batch in raw for m in batch]
+    return raw if isinstance(raw, list) else []
+
+
+def _group_by_fact(metric_keys: List[str], metrics: Mapping[str, Any], skip_types: Tuple[str, ...]) -> List[List[str]]:
+    by_fact: Dict[str, List[str]] = {}
+    for m_key in metric_keys:
+        m_def = metrics.get(m_key)
+        if not m_def or m_def.get("type") in skip_types:
+            continue
+        tbl = m_def.get("recipe", {}).get("table")
+        if tbl:
+            by_fact.setdefault(tbl, []).append(m_key)
+    return list(by_fact.values())
+
+
+def _kpi_derived(path: PathTuple) -> Tuple[Tuple[PathTuple, str, Any], ...]:
+    """Textos que acompañan al valor de un KPI, decididos por la forma del path."""
+    if len(path) <= 1:
+        return ()
+    leaf, parent, kpi_key = path[-1], path[:-1], path[-2]
+    if kpi_key in _COUNT_KPIS:
+        fmt = "integer"
+    elif kpi_key in _PERCENT_KPIS:
+        fmt = "percent"
+    elif kpi_key in _DECIMAL_KPIS:
+        fmt = "decimal"
+    else:
+        fmt = "currency"
+
+    derived: List[Tuple[PathTuple, str, Any]] = []
+    if leaf == "value" or leaf == "current_value":
+        derived.append((parent + ("value_formatted",), "format", fmt))
+    elif leaf == "target":
+        derived.append((parent + ("target_formatted",), "format", fmt))
+
+    if kpi_key in _DAYS_KPIS:
+        derived.append((parent + ("vs_last_year_formatted",), "const", "none"))
+        derived.append((parent + ("label_prev_year",), "const", "Vs 2025"))
+    elif kpi_key == "availability_percent":
+        derived.append((parent + ("vs_last_year_formatted",), "const", None))
+        derived.append((parent + ("vs_last_year_delta",), "const", None))
+        derived.append((parent + ("vs_last_year_delta_formatted",), "const", None))
+    elif leaf == "vs_last_year_value":
+        derived.append((parent + ("vs_last_year_formatted",), "format", fmt))
+    elif leaf == "ytd_value":
+        derived.append((parent + ("ytd_formatted",), "format", fmt))
+    elif leaf in _VOLUME_LEAVES:
+        fmt_leaf = "integer" if "trips" in leaf or "kms" in leaf else "currency"
+        derived.append((parent + (leaf + "_formatted",), "format", fmt_leaf))
+    elif "delta" in leaf or "variance" in leaf:
+        derived.append((parent + (leaf + "_formatted",), "delta", None))
+    return tuple(derived)
+
+
+def compile_screen_plan(
+    screen_id: str, cfg: Dict[str, Any], metrics: Mapping[str, Any], *, tenant: str = "", meta_version: str = "",
+) -> ScreenPlan:
+    """Compila la configuración de una pantalla; metrics es la metadata del tenant
+    (agrupación de métricas por tabla de hechos)."""
+    inject_paths = cfg.get("inject_paths", {}) or {}
+    page_filters = tuple(cfg.get("page_filter", []) or ())
+    queries: List[QueryNode] = []
+    targets: List[TargetNode] = []
+
+    def _query(batch: List[str], dims: List[str], fixed: Dict[str, Any]) -> int:
+        node = QueryNode(
+            id=len(queries), metrics=tuple(batch), dimensions=tuple(dims),
+            fixed_filters=MappingProxyType(dict(fixed)), page_filters=page_filters,
+        )
+        queries.append(node)
+        return node.id
+
+    def _path(key: str) -> Optional[PathTuple]:
+        path = inject_paths.get(key)
+        return tuple(path) if path else None
+
+    def _skip(kind: str, key: str, spec: Any) -> bool:
+        if isinstance(spec, dict):
+            return False
+        print(f"⚠️ DataManager: spec para {kind} '{key}' no es dict (tipo: {type(spec).__name__}), skipping...")
+        return True
+
+    for group_key, spec in cfg.get("kpi_roadmap", {}).items():
+        if _skip("kpi", group_key, spec):
+            continue
+        dims = spec.get("dimensions", [])
+        raw_metrics = spec.get("metrics", [])
+        if raw_metrics and isinstance(raw_metrics[0], list):
+            metric_batches = raw_metrics
+        else:
+            metric_batches = [raw_metrics] if raw_metrics else []
+
+        fixed_filters_raw = spec.get("fixed_filters", {})
+        fixed_filters_per_batch = isinstance(fixed_filters_raw, list)
+
+        batches = []
+        for batch_idx, batch in enumerate(metric_batches):
+            if not batch: continue
+            fixed: Dict[str, Any] = {}
+            if fixed_filters_per_batch:
+                if batch_idx < len(fixed_filters_raw):
+                    ff = fixed_filters_raw[batch_idx]
+                    if isinstance(ff, dict):
+                        fixed.update(ff)
+                    elif isinstance(ff, list):
+                        for f in ff:
+                            if isinstance(f, dict):
+                                fixed.update(f)
+            elif isinstance(fixed_filters_raw, dict):
+                fixed.update(fixed_filters_raw)
+            batches.append((tuple(batch), _query(batch, dims, fixed)))
+
+        outputs = []
+        for col_def in spec.get("columns", []):
+            target_key = col_def.get("target")
+            path = inject_paths.get(f"{group_key}.{target_key}") or inject_paths.get(target_key)
+            if not path: continue
+            path = tuple(path)
+            outputs.append(KpiOutput(
+                path=path,
+                formula=col_def["formula"] if "formula" in col_def else None,
+                key=col_def.get("key"),
+                derived=_kpi_derived(path),
+            ))
+        targets.append(TargetNode(
+            kind="kpi", key=group_key, path=None, spec=spec, inputs=tuple(q for _, q in batches),
+            batches=tuple(batches), outputs=tuple(outputs),
+        ))
+
+    for chart_key, spec in cfg.get("chart_roadmap", {}).items():
+        if _skip("chart", chart_key, spec):
+            continue
+        fixed_filters_raw = spec.get("fixed_filters", {})
+        fixed_filters_per_batch = isinstance(fixed_filters_raw, list)
+
+        if "metrics" in spec:
+            raw_c = spec["metrics"]
+            chart_batches = raw_c if (raw_c and isinstance(raw_c[0], list)) else [raw_c]
+            series_defs = spec.get("columns", [])
+        else:
+            chart_batches = [[v for v in spec.values() if isinstance(v, str)]]
+            series_defs = [{"key": v, "series": k} for k, v in spec.items() if isinstance(v, str)]
+
+        spec_dims = spec.get("dimensions", ["__month__"])
+        year_month = "__year_month__" in spec_dims
+        dim_arg = ["__year_month__"] if year_month else ["__month__"]
+
+        inputs = []
+        for batch_idx, batch in enumerate(chart_batches):
+            fixed = {}
+            if fixed_filters_per_batch:
+                if batch_idx < len(fixed_filters_raw):
+                    ff = fixed_filters_raw[batch_idx]
+                    if isinstance(ff, dict):
+                        fixed.update(ff)
+            elif isinstance(fixed_filters_raw, dict):
+                fixed.update(fixed_filters_raw)
+            inputs.append(_query(batch, dim_arg, fixed))
+        targets.append(TargetNode(
+            kind="chart", key=chart_key, path=_path(chart_key), spec=spec, inputs=tuple(inputs),
+            dimensions=tuple(dim_arg), series=tuple(series_defs), year_month=year_month,
+        ))
+
+    for chart_key, spec in cfg.get("categorical_roadmap", {}).items():
+        if _skip("categorical", chart_key, spec):
+            continue
+        inputs = []
+        dims: List[str] = []
+        mets: List[str] = []
+        try:
+            ff = spec.get("fixed_filters", {})
+            fixed = dict(ff) if isinstance(ff, dict) else {}
+
+            dims = [spec.get("dimension")] if isinstance(spec.get("dimension"), str) else spec.get("dimensions", [])
+            raw_mets = spec.get("metrics", [])
+            mets = raw_mets[0] if raw_mets and isinstance(raw_mets[0], list) else (raw_mets if isinstance(raw_mets, list) else [spec.get("kpi")] if spec.get("kpi") else [])
+
+            if spec.get("columns"):
+                if dims:
+                    if raw_mets and isinstance(raw_mets[0], list):
+                        # Multi-batch: una query por tabla de hechos (evita blowup de INNER JOIN)
+                        all_mets = [m for sublist in raw_mets for m in sublist]
+                        inputs = [_query(grp, dims, fixed) for grp in _group_by_fact(all_mets, metrics, ("derived", "placeholder"))]
+                    elif mets:
+                        inputs = [_query(mets, dims, fixed)]
+            else:
+                mets = [spec.get("kpi")] if isinstance(spec.get("kpi"), str) else mets
+                inputs = [_query(mets, dims, fixed)]
+        except Exception:
+            inputs = []
+        targets.append(TargetNode(
+            kind="categorical", key=chart_key, path=_path(chart_key), spec=spec, inputs=tuple(inputs),
+            dimensions=tuple(dims or ()), metrics=tuple(mets or ()),
+        ))
+
+    for table_key, spec in cfg.get("table_roadmap", {}).items():
+        if _skip("table", table_key, spec):
+            continue
+        dims = spec.get("dimensions", [])
+        mets = _flat_metrics(spec.get("metrics", []))
+        fixed = dict(spec.get("fixed_filters", {}))
+        inputs = [_query(grp, dims, fixed) for grp in _group_by_fact(mets, metrics, ("derived",))]
+        targets.append(TargetNode(
+            kind="table", key=table_key, path=_path(table_key), spec=spec, inputs=tuple(inputs),
+            dimensions=tuple(dims), metrics=tuple(mets),
+        ))
+
+    return ScreenPlan(
+        screen_id=screen_id, tenant=tenant, meta_version=meta_version,
+        queries=tuple(queries), targets=tuple(targets), source=cfg,
+    )
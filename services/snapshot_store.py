@@ -0,0 +1,159 @@
+"""
+Almacén local de snapshots de periodos cerrados (un archivo SQLite por tenant).
+
+Las queries cuyo rango de fechas terminó antes del periodo abierto (ver
+SmartQueryBuilder.get_dataframe_query, "closed_period") ya no cambian: su resultado
+se persiste aquí y DataManager lo lee antes de ir a SQL Server, así reabrir meses
+del año pasado no viaja a la BD y los snapshots sobreviven a reinicios del proceso.
+
+Cada resultado se guarda como ResultSet (columnar), que comprime mucho mejor que una
+lista de filas, con el mismo formato firmado que la caché compartida
+(cache_backends.serialize_entry: HMAC con SECRET_KEY + pickle + zlib); un snapshot con
+firma inválida cuenta como miss y nunca se deserializa. Las lecturas usan mmap_size de
+SQLite (páginas mapeadas en memoria). compact() borra snapshots sin uso o demasiado
+viejos y reescribe los archivos; maybe_compact() lo lanza en segundo plano como
+mucho una vez por SNAPSHOT_COMPACT_INTERVAL_SECONDS.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from config import Config
+from dashboard_core.result_set import ResultSet
+from dashboard_core.sql_query import Query, query_cache_text
+from services.cache_backends import CacheEntry, deserialize_entry, serialize_entry, signing_key_configured
+
+
+class SnapshotStore:
+
+    # Resolución con la que se actualiza last_access en lecturas (evita un UPDATE por hit)
+    _TOUCH_SECONDS = 3600.0
+
+    def __init__(self, base_dir: Optional[str] = None) -> None:
+        # Directorio explícito de la app (no /tmp) y firmas con una SECRET_KEY propia
+        self.base_dir = base_dir or Config.SNAPSHOT_DIR
+        if not self.base_dir:
+            raise ValueError("SNAPSHOT_STORE_ENABLED requiere SNAPSHOT_DIR (un directorio propio de la app)")
+        if not signing_key_configured():
+            raise ValueError("SNAPSHOT_STORE_ENABLED requiere una SECRET_KEY propia (no la de desarrollo)")
+        os.makedirs(self.base_dir, mode=0o700, exist_ok=True)
+        self._local = threading.local()
+        self._compact_lock = threading.Lock()
+        self._last_compact = 0.0
+        self.counters: Dict[str, int] = {"hits": 0, "misses": 0, "writes": 0, "compacted": 0}
+
+    def _path(self, tenant: str) -> str:
+        safe = re.sub(r"[^A-Za-z0-9_.-]", "_", tenant)
+        return os.path.join(self.base_dir, f"{safe}.sqlite3")
+
+    def _conn(self, tenant: str) -> sqlite3.Connection:
+        # sqlite3.Connection no se comparte entre hilos: una por hilo y tenant
+        conns = getattr(self._local, "conns", None)
+        if conns is None:
+            conns = self._local.conns = {}
+        conn = conns.get(tenant)
+        if conn is None:
+            conn = sqlite3.connect(self._path(tenant), timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(f"PRAGMA mmap_size={Config.CACHE_SQLITE_MMAP_BYTES}")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS snapshots ("
+                " key TEXT PRIMARY KEY, created_at REAL NOT NULL, last_access REAL NOT NULL,"
+                " row_count INTEGER NOT NULL, size INTEGER NOT NULL, payload BLOB NOT NULL)"
+            )
+            conns[tenant] = conn
+        return conn
+
+    @staticmethod
+    def _key(sql: Query) -> str:
+        return hashlib.sha256(query_cache_text(sql).encode("utf-8")).hexdigest()
+
+    def get(self, tenant: str, sql: Query) -> Optional[ResultSet]:
+        key = self._key(sql)
+        conn = self._conn(tenant)
+        row = conn.execute(
+            "SELECT payload, created_at, last_access FROM snapshots WHERE key = ?", (key,)
+        ).fetchone()
+        now = time.time()
+        if row is None or (now - row[1]) > Config.SNAPSHOT_MAX_AGE_SECONDS:
+            self.counters["misses"] += 1
+            return None
+        if now - row[2] > self._TOUCH_SECONDS:
+            conn.execute("UPDATE snapshots SET last_access = ? WHERE key = ?", (now, key))
+        entry = deserialize_entry(row[0])
+        if entry is None:
+            self.counters["misses"] += 1
+            return None
+        self.counters["hits"] += 1
+        return entry.data
+
+    def exists(self, tenant: str, sql: Query) -> bool:
+        """Si hay un snapshot vigente, sin tocar contadores, last_access ni crear el archivo
+        del tenant (para planes / diagnóstico)."""
+        if not os.path.exists(self._path(tenant)):
+            return False
+        row = self._conn(tenant).execute(
+            "SELECT created_at FROM snapshots WHERE key = ?", (self._key(sql),)
+        ).fetchone()
+        return row is not None and (time.time() - row[0]) <= Config.SNAPSHOT_MAX_AGE_SECONDS
+
+    def put(self, tenant: str, sql: Query, rows: List[Dict[str, Any]]) -> None:
+        now = time.time()
+        blob = serialize_entry(CacheEntry(data=ResultSet.from_rows(rows), ts=now))
+        self._conn(tenant).execute(
+            "INSERT OR REPLACE INTO snapshots (key, created_at, last_access, row_count, size, payload)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (self._key(sql), now, now, len(rows), len(blob), sqlite3.Binary(blob)),
+        )
+        self.counters["writes"] += 1
+
+    def tenants(self) -> List[str]:
+        return sorted(f[: -len(".sqlite3")] for f in os.listdir(self.base_dir) if f.endswith(".sqlite3"))
+
+    def compact(self) -> Dict[str, int]:
+        """Borra snapshots viejos (SNAPSHOT_MAX_AGE_SECONDS) o sin uso (SNAPSHOT_IDLE_SECONDS)
+        y reescribe cada archivo para devolver el espacio al disco."""
+        now = time.time()
+        removed: Dict[str, int] = {}
+        for tenant in self.tenants():
+            conn = self._conn(tenant)
+            cur = conn.execute(
+                "DELETE FROM snapshots WHERE created_at < ? OR last_access < ?",
+                (now - Config.SNAPSHOT_MAX_AGE_SECONDS, now - Config.SNAPSHOT_IDLE_SECONDS),
+            )
+            removed[tenant] = cur.rowcount or 0
+            if removed[tenant]:
+                conn.execute("VACUUM")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self.counters["compacted"] += sum(removed.values())
+        return removed
+
+    def maybe_compact(self) -> None:
+        now = time.time()
+        with self._compact_lock:
+            if now - self._last_compact < Config.SNAPSHOT_COMPACT_INTERVAL_SECONDS:
+                return
+            self._last_compact = now
+        threading.Thread(target=self._compact_safely, name="snapshot-compaction", daemon=True).start()
+
+    def _compact_safely(self) -> None:
+        try:
+            removed = self.compact()
+            if any(removed.values()):
+                print(f"🗜️ SnapshotStore: compactación eliminó {sum(removed.values())} snapshots")
+        except Exception as e:
+            print(f"⚠️ SnapshotStore: error en compactación — {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        per_tenant = {}
+        for tenant in self.tenants():
+            count, size = self._conn(tenant).execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM snapshots"
+            ).fetchone()
+            per_tenant[tenant] = {"snapshots": count, "bytes": size}
+        return {"dir": self.base_dir, **self.counters, "tenants": per_tenant}
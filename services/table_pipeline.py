@@ -0,0 +1,244 @@
+"""
+Construcción columnar de las tablas de table_roadmap.
+
+refresh_screen armaba cada tabla fila por fila: un dict por fila fusionado con
+update(), _clean_val por celda, eval de fórmulas por celda, totales acumulados en
+un segundo recorrido y el formato celda a celda. Aquí la tabla es un dict de
+columnas:
+
+    fusión      las filas de cada solicitud se alinean por clave (dimensiones) en una
+                sola pasada; cada columna se llena con su lista de valores
+    métricas    se limpian como columna (float64; None / NaN / inf → 0)
+    fórmulas    Formula.evaluate_columns sobre arreglos NumPy cuando todas las columnas
+                que lee son numéricas; si no, la misma evaluación fila a fila de antes
+    totales     suma por columna (en orden de filas, igual que la acumulación anterior)
+    ratios      is_total_ratio como división vectorizada contra el total
+    formato     por columna: las float64 ya limpias se formatean directo, el resto
+                pasa por _clean_val / _format_val con memo por valor
+
+La salida es idéntica a la de la versión por fila: {"headers": [...], "rows": [[...]]}.
+"""
+import math
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from dashboard_core.result_set import ResultSet
+from services.formula_engine import compile_formula
+from utils.helpers import format_value
+
+_MISSING = object()  # la fila no trae la columna (row.get → None, pero r.get(k, d) → d)
+_NUMERIC = (int, float)
+
+
+def column_key(col: Dict[str, Any]) -> str:
+    return col.get("key") or (col.get("label") or "").strip().replace(" ", "_").replace(".", "_").lower() or ""
+
+
+def _as_float_array(values: Any) -> Optional[np.ndarray]:
+    """float64 si todos los valores están presentes y son int/float; si no, None."""
+    if isinstance(values, np.ndarray):
+        return values
+    if all(type(v) in (int, float, bool) for v in values):
+        return np.array(values, dtype=np.float64)
+    return None
+
+
+def _finite_or_zero(values: np.ndarray) -> np.ndarray:
+    return np.where(np.isfinite(values), values, 0.0)
+
+
+def _running_sum(values: np.ndarray) -> float:
+    # Suma secuencial (no por pares): el mismo resultado que acumular fila por fila
+    return float(np.cumsum(values)[-1]) if len(values) else 0.0
+
+
+class TableBuilder:
+    """Arma una tabla de table_roadmap; clean_val / format_val son los de DataManager."""
+
+    def __init__(self, clean_val: Callable[[Any], float], format_val: Callable[[Any, str], str]) -> None:
+        self._clean_val = clean_val
+        self._format_val = format_val
+
+    # --- fusión ---
+
+    def merge(self, parts: Iterable[Any], dims: List[str]) -> Dict[str, Any]:
+        """
+        Alinea las filas de todas las solicitudes por clave: tupla de dimensiones, o el
+        primer valor de la fila si hay una sola (o ninguna). Una clave repetida
+        sobrescribe en su posición original. Devuelve {"n": filas, "columns": {nombre: lista}}.
+        """
+        index: Dict[Any, int] = {}
+        columns: Dict[str, List[Any]] = {}
+        for rows in parts:
+            try:
+                rs = ResultSet.from_rows(rows)
+                if not rs.columns:
+                    continue
+                if len(dims) > 1:
+                    keys = list(zip(*(rs.values(d) for d in dims)))
+                else:
+                    keys = rs.values(rs.columns[0])
+                positions = [index.setdefault(k, len(index)) for k in keys]
+            except Exception:
+                continue
+            n = len(index)
+            for name in rs.columns:
+                col = columns.setdefault(name, [])
+                col.extend([_MISSING] * (n - len(col)))
+                for pos, value in zip(positions, rs.values(name)):
+                    col[pos] = value
+        n = len(index)
+        for col in columns.values():
+            col.extend([_MISSING] * (n - len(col)))
+        return {"n": n, "columns": columns}
+
+    # --- limpieza / fórmulas ---
+
+    def clean_column(self, values: Any) -> np.ndarray:
+        """_clean_val de toda una columna."""
+        if isinstance(values, np.ndarray):
+            return _finite_or_zero(values.astype(np.float64))
+        if all(v is None or v is _MISSING or type(v) in (int, float, bool) for v in values):
+            arr = np.array([np.nan if v is None or v is _MISSING else v for v in values], dtype=np.float64)
+            return _finite_or_zero(arr)
+        clean = self._clean_val
+        return np.array([clean(None if v is _MISSING else v) for v in values], dtype=np.float64)
+
+    def _formula_column(self, col: Dict[str, Any], columns: Dict[str, Any], n: int) -> Any:
+        formula = compile_formula(col["formula"])
+        is_text = col.get("format") == "text"
+
+        if formula.vectorizable and not is_text:
+            inputs = {}
+            for field in formula.fields:
+                arr = _as_float_array(columns[field]) if field in columns else None
+                if arr is None:
+                    break
+                inputs[field] = arr
+            else:
+                out = formula.evaluate_columns(inputs, n)
+                if out is not None:
+                    return _finite_or_zero(out)
+
+        # Fila a fila: cada fila ve sólo las columnas que lee la fórmula
+        present = []
+        for field in formula.fields:
+            if field in columns:
+                values = columns[field]
+                present.append((field, values.tolist() if isinstance(values, np.ndarray) else values))
+        clean = self._clean_val
+        out: List[Any] = []
+        for i in range(n):
+            row = {f: vals[i] for f, vals in present if vals[i] is not _MISSING}
+            try:
+                raw_val = formula(row)
+                if is_text:
+                    out.append(str(raw_val) if raw_val is not None else "")
+                elif isinstance(raw_val, str):
+                    try:
+                        clean_test = raw_val.replace('%', '').replace('+', '').replace(',', '').replace('$', '').strip()
+                        if not clean_test: raise ValueError()
+                        float(clean_test)
+                        out.append(clean(raw_val))
+                    except ValueError:
+                        out.append(raw_val)
+                else:
+                    out.append(clean(raw_val))
+            except Exception:
+                out.append("" if is_text else 0.0)
+        numeric = None if is_text else _as_float_array(out)
+        return numeric if numeric is not None else out
+
+    # --- formato ---
+
+    def _memo(self, values: List[Any], fn: Callable[[Any], str]) -> List[str]:
+        memo: Dict[Any, str] = {}
+        out = []
+        for v in values:
+            try:
+                # 0.0 y -0.0 son iguales como clave pero se formatean distinto
+                key = ("zero", math.copysign(1.0, v)) if type(v) is float and v == 0 else (type(v), v)
+                s = memo.get(key)
+                if s is None:
+                    s = memo[key] = fn(v)
+            except TypeError:
+                s = fn(v)
+            out.append(s)
+        return out
+
+    def format_column(self, values: Any, fmt: Optional[str]) -> List[str]:
+        if isinstance(values, np.ndarray):
+            # Columna ya limpia (float64 finito): el mismo texto sin pasar por _clean_val
+            floats = values.tolist()
+            if fmt == "currency":
+                return [format_value(v, "$") for v in floats]
+            if fmt == "percent":
+                return [f"{v:.2%}" for v in floats]
+            if fmt == "integer":
+                return [f"{int(v):,}" for v in floats]
+            return [str(v) for v in floats]
+        clean = self._clean_val
+        if fmt == "currency":
+            return self._memo(values, lambda v: self._format_val(v, "currency"))
+        if fmt == "percent":
+            return self._memo(values, lambda v: f"{clean(v):.2%}")
+        if fmt == "integer":
+            return self._memo(values, lambda v: f"{int(clean(v)):,}")
+        return self._memo(values, lambda v: str(v) if v is not None else "")
+
+    # --- tabla completa ---
+
+    def build(self, spec: Dict[str, Any], parts: Iterable[Any], dims: List[str], mets: List[str]) -> Dict[str, Any]:
+        merged = self.merge(parts, dims)
+        n = merged["n"]
+        columns: Dict[str, Any] = merged["columns"]
+        spec_columns = spec.get("columns", [])
+        col_totals: Dict[str, float] = {}
+
+        for m in mets:
+            values = self.clean_column(columns.get(m, [_MISSING] * n))
+            columns[m] = values
+            col_totals[m] = col_totals.get(m, 0) + _running_sum(values)
+
+        formula_keys = []
+        for col in spec_columns:
+            if "formula" in col:
+                col_key = column_key(col)
+                if not col_key:
+                    continue
+                columns[col_key] = self._formula_column(col, columns, n)
+                formula_keys.append(col_key)
+
+        for col_key in formula_keys:
+            values = columns[col_key]
+            if isinstance(values, np.ndarray):
+                col_totals[col_key] = col_totals.get(col_key, 0) + _running_sum(values)
+            else:
+                numeric = [v for v in values if isinstance(v, _NUMERIC)]
+                if numeric:
+                    col_totals[col_key] = col_totals.get(col_key, 0) + _running_sum(np.array(numeric, dtype=np.float64))
+
+        display = []
+        for col in spec_columns:
+            if col.get("role") == "row_number":
+                display.append([str(i + 1) for i in range(n)])
+                continue
+            ck = column_key(col)
+            if col.get("is_total_ratio"):
+                nk = col.get("numerator_key", ck)
+                den = self._clean_val(col_totals.get(nk, 0))
+                if den == 0:
+                    values = np.zeros(n)
+                else:
+                    values = _finite_or_zero(self.clean_column(columns.get(nk, [_MISSING] * n)) / den)
+            else:
+                values = columns.get(ck)
+                if values is None:
+                    values = [None] * n
+                elif not isinstance(values, np.ndarray):
+                    values = [None if v is _MISSING else v for v in values]
+            display.append(self.format_column(values, col.get("format")))
+
+        rows = [list(r) for r in zip(*display)] if display else [[] for _ in range(n)]
+        return {"headers": [c.get("label", "") for c in spec_columns], "rows": rows}